@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Engine benchmarks: seeded micro-benchmarks for the core simulation operations, and
+macro-benchmarks for full deals, full matches and bid_stage1 replay blocks; results can
+be saved as JSON, and compared across runs (e.g. to catch performance regressions
+between versions)
+
+Micro-benchmarks report time per operation (best and median of several repeats, each
+with the same seed); macro-benchmarks report deals/sec and decisions/sec (bids plus
+card plays, where counted), and peak (traced) memory from a separate pass under
+tracemalloc
+"""
+
+import sys
+import os.path
+import random
+import gc
+import time
+import json
+import platform
+import subprocess
+import statistics
+import tracemalloc
+from time import perf_counter
+
+BENCH_DIR  = os.path.dirname(os.path.realpath(__file__))
+EUCHRE_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'euchre')
+sys.path.insert(0, EUCHRE_DIR)
+
+import click
+
+from core import log, HEADLESS_LEVEL
+from hand import TRUMP_CARDS
+from euchre import Match, PlayTracking, engine_args, play_match
+from stats import PlayStats
+import bidding
+import playing
+import bid_stage1
+
+MAX_DEALS = 1000000
+
+#########
+# Setup #
+#########
+
+def new_game(seed, bidding_mod = bidding, playing_mod = playing):
+    """
+    :return: Game (which never ends, with no deal history retained)
+    """
+    random.seed(seed)
+    match = Match(bidding_mod, playing_mod, game_points=sys.maxsize, history=0)
+    return match.newgame()
+
+def dealt(game):
+    """
+    :return: new Deal (shuffled and dealt)
+    """
+    deal = game.newdeal()
+    deal.shuffle()
+    deal.deal()
+    return deal
+
+def contracted(game):
+    """
+    :return: new Deal (shuffled, dealt, and bid, with a contract)
+    """
+    while True:
+        deal = dealt(game)
+        if deal.bid():
+            return deal
+        deal.compute_stats()
+
+class NullWriter(object):
+    """Stands in for csv.writer (see bid_stage1.play_variants)
+    """
+    def writerow(self, row):
+        pass
+
+####################
+# Micro-benchmarks #
+####################
+
+# Each micro-benchmark takes the number of operations (approximate, since some
+# operations come in groups) and seed, and returns a tuple (elapsed secs, number of
+# operations); only the operation itself is timed, not the setup
+
+def micro_shuffle(nops, seed):
+    deal = new_game(seed).newdeal()
+    start = perf_counter()
+    for _ in range(nops):
+        deal.shuffle(force=True)
+    return perf_counter() - start, nops
+
+def micro_deal(nops, seed):
+    """Includes Hand.show_turncard (i.e. bidding.analyze) for each hand
+    """
+    game = new_game(seed)
+    elapsed = 0.0
+    for _ in range(nops):
+        deal = game.newdeal()
+        deal.shuffle()
+        start = perf_counter()
+        deal.deal()
+        elapsed += perf_counter() - start
+    return elapsed, nops
+
+def micro_analyze(nops, seed):
+    game = new_game(seed)
+    elapsed = 0.0
+    ndeals = -(-nops // 4)
+    for _ in range(ndeals):
+        deal = dealt(game)
+        turncard = deal.turncard
+        start = perf_counter()
+        for hand in deal.hands:
+            bidding.analyze(hand, turncard)
+        elapsed += perf_counter() - start
+    return elapsed, ndeals * 4
+
+def micro_bestdiscard(nops, seed):
+    game = new_game(seed)
+    args = []
+    for _ in range(nops):
+        deal = dealt(game)
+        turncard = deal.turncard
+        dealer_hand = deal.hands[3]
+        args.append((bidding.BidAnalysis(dealer_hand.cards, turncard.suit, turncard),
+                     turncard))
+    start = perf_counter()
+    for analysis, turncard in args:
+        bidding._bestdiscard(analysis, turncard)
+    return perf_counter() - start, nops
+
+def micro_bid(nops, seed):
+    game = new_game(seed)
+    elapsed = 0.0
+    for _ in range(nops):
+        deal = dealt(game)
+        start = perf_counter()
+        deal.bid()
+        elapsed += perf_counter() - start
+    return elapsed, nops
+
+def micro_play(nops, seed):
+    """Time for playing.play decisions, with tricks played out as in Deal.playtricks
+    (only the calls to playing.play are timed)
+    """
+    game = new_game(seed)
+    elapsed = 0.0
+    ndecisions = 0
+    while ndecisions < nops:
+        deal = contracted(game)
+        player = deal.hands[0]
+        for _ in range(5):
+            plays = []
+            cards = []
+            winning = (None, None)
+            for _ in range(4):
+                start = perf_counter()
+                card = playing.play(player, plays, winning)
+                elapsed += perf_counter() - start
+                ndecisions += 1
+                player.cards.remove(card)
+                deal.tracking.card_seen(card)
+                cards.append(card)
+                plays.append((player, card))
+                if not winning[1]:
+                    winning = (player, card)
+                elif deal.cmpcards(plays[0][1], winning[1], card) > 0:
+                    winning = (player, card)
+                player = player.next
+            deal.tricks.append((winning[0], cards))
+            player = winning[0]
+    return elapsed, ndecisions
+
+def micro_cmpcards(nops, seed):
+    game = new_game(seed)
+    args = []
+    while len(args) < nops:
+        deal = contracted(game)
+        cards = TRUMP_CARDS[deal.contract['idx']]
+        for _ in range(16):
+            args.append((deal, *random.sample(cards, 3)))
+    start = perf_counter()
+    for deal, lead, winning, played in args:
+        deal.cmpcards(lead, winning, played)
+    return perf_counter() - start, len(args)
+
+def micro_card_seen(nops, seed):
+    game = new_game(seed)
+    elapsed = 0.0
+    nseen = 0
+    while nseen < nops:
+        deal = contracted(game)
+        cards = [card for hand in deal.hands for card in hand.cards]
+        tracking = PlayTracking(deal)
+        start = perf_counter()
+        for card in cards:
+            tracking.card_seen(card)
+        elapsed += perf_counter() - start
+        nseen += len(cards)
+    return elapsed, nseen
+
+def deal_stats(ndeals, seed):
+    """
+    :return: list of Deal.stats dicts
+    """
+    game = new_game(seed)
+    stats = []
+    for _ in range(ndeals):
+        deal = game.newdeal()
+        deal.play()
+        stats.append(deal.stats)
+    return stats
+
+def micro_playstats_update(nops, seed):
+    """Includes applying any buffered updates (by accessing the counts)
+    """
+    dealstats = deal_stats(nops, seed)
+    playstats = PlayStats()
+    start = perf_counter()
+    for stats in dealstats:
+        playstats.update(stats)
+    playstats.counts
+    return perf_counter() - start, nops
+
+def micro_playstats_rollup(nops, seed):
+    dealstats = deal_stats(100, seed)
+    gamestats = []
+    for i in range(nops):
+        playstats = PlayStats()
+        for stats in dealstats[i % 10::10]:
+            playstats.update(stats)
+        playstats.counts  # apply buffered updates (not timed)
+        gamestats.append(playstats)
+    matchstats = PlayStats()
+    start = perf_counter()
+    for playstats in gamestats:
+        matchstats.rollup(playstats)
+    return perf_counter() - start, nops
+
+def micro_solve(nops, seed):
+    """Time for double-dummy solving a deal from the start of play (see solver.py); only
+    1/20th of `nops` deals are solved, since each is relatively expensive
+    """
+    import solver
+    game = new_game(seed)
+    deals = [contracted(game) for _ in range(max(nops // 20, 1))]
+    start = perf_counter()
+    for deal in deals:
+        solver.solve_deal(deal)
+    return perf_counter() - start, len(deals)
+
+MICRO = {'shuffle'         : micro_shuffle,
+         'deal'            : micro_deal,
+         'analyze'         : micro_analyze,
+         'bestdiscard'     : micro_bestdiscard,
+         'bid'             : micro_bid,
+         'play'            : micro_play,
+         'cmpcards'        : micro_cmpcards,
+         'card_seen'       : micro_card_seen,
+         'playstats_update': micro_playstats_update,
+         'playstats_rollup': micro_playstats_rollup,
+         'solve'           : micro_solve}
+
+def run_micro(name, nops, seed, repeat):
+    """
+    :return: dict (results)
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        elapsed, count = MICRO[name](nops, seed)
+        times.append(elapsed / count)
+    return {'ops'        : count,
+            'best_ns'    : min(times) * 1e9,
+            'median_ns'  : statistics.median(times) * 1e9,
+            'ops_per_sec': 1.0 / min(times)}
+
+####################
+# Macro-benchmarks #
+####################
+
+# Each macro-benchmark takes a scale (number of deals, matches, or replay blocks),
+# seed, and engine, and returns a tuple (number of deals, number of decisions, or None
+# if not counted)
+
+def macro_deals(ndeals, seed, engine):
+    """Full deals in a single (never-ending) game
+    """
+    match_args, match_kwargs = engine_args(engine, 0)
+    random.seed(seed)
+    game = Match(*match_args, game_points=sys.maxsize, **match_kwargs).newgame()
+    ndecisions = 0
+    for _ in range(ndeals):
+        deal = game.newdeal()
+        deal.play()
+        ndecisions += len(deal.bids)
+        if deal.plays:
+            ndecisions += sum(1 for play in deal.plays if play[1] is not None)
+    return ndeals, ndecisions
+
+def macro_matches(nmatches, seed, engine):
+    """Full matches (as in euchre.test)
+    """
+    match_args, match_kwargs = engine_args(engine, 0)
+    random.seed(seed)
+    ndeals = 0
+    for imatch in range(nmatches):
+        match = Match(*match_args, **match_kwargs)
+        play_match(imatch, match, MAX_DEALS, lambda line: None)
+        ndeals += match.teamstats[0].ndeal + match.teamstats[1].ndeal
+    return ndeals, None
+
+def macro_bid_stage1(nblocks, seed, engine):
+    """Blocks of bid variants for a deal, as in bid_stage1 (the engine is always std)
+    """
+    random.seed(seed)
+    match = Match(bid_stage1, playing, game_points=MAX_DEALS, history=0)
+    writer = NullWriter()
+    for _ in range(nblocks):
+        bid_stage1.play_variants(match.newgame(), writer)
+    return nblocks * bid_stage1.BID_VARIANTS, None
+
+MACRO = {'deals'     : (macro_deals,      2000),
+         'matches'   : (macro_matches,    20),
+         'bid_stage1': (macro_bid_stage1, 100)}
+
+def run_macro(name, scale, seed, engine, memory):
+    """
+    :param scale: multiplier for the default number of deals, matches, or blocks
+    :return: dict (results)
+    """
+    func, count = MACRO[name]
+    count = max(1, int(count * scale))
+    gc.collect()
+    start = perf_counter()
+    ndeals, ndecisions = func(count, seed, engine)
+    elapsed = perf_counter() - start
+    res = {'count'        : count,
+           'deals'        : ndeals,
+           'secs'         : elapsed,
+           'deals_per_sec': ndeals / elapsed}
+    if ndecisions is not None:
+        res['decisions']         = ndecisions
+        res['decisions_per_sec'] = ndecisions / elapsed
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func(count, seed, engine)
+        res['peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024.0
+        tracemalloc.stop()
+    return res
+
+###########
+# Results #
+###########
+
+def git_commit():
+    """
+    :return: str (commit hash for the working tree, or None if not available)
+    """
+    try:
+        proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True)
+        return proc.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# primary metric for each type of benchmark, and whether higher is better
+METRICS = {'micro': ('best_ns', False),
+           'macro': ('deals_per_sec', True)}
+
+def compare_results(base, new, threshold, out = print):
+    """
+    :param base: dict (results loaded from JSON)
+    :param new: dict (results loaded from JSON)
+    :param threshold: float (percent change in primary metric to flag as a regression)
+    :return: int (number of regressions)
+    """
+    nregress = 0
+    out("%-28s %14s %14s %9s" % ("benchmark", "base", "new", "change%"))
+    for name, res in new['benchmarks'].items():
+        if name not in base['benchmarks']:
+            continue
+        metric, higher_better = METRICS[name.split('.')[0]]
+        base_val = base['benchmarks'][name][metric]
+        new_val = res[metric]
+        change = (new_val - base_val) / base_val * 100.0 if base_val else 0.0
+        regress = (-change if higher_better else change) > threshold
+        nregress += int(regress)
+        out("%-28s %14.1f %14.1f %+9.2f%s" % (name, base_val, new_val, change,
+                                              "  REGRESSION" if regress else ""))
+    return nregress
+
+#######
+# CLI #
+#######
+
+@click.group()
+def cli():
+    """Benchmarks for the simulation engine
+    """
+    pass
+
+@cli.command()
+@click.option('--bench',  '-b', 'benches', multiple=True,
+              help="Benchmark(s) to run, e.g. micro.play or macro (default: all)")
+@click.option('--seed',   '-s', default=1,     type=int, help="Seed for random module")
+@click.option('--ops',    '-n', default=2000,  type=int,
+              help="Number of operations per micro-benchmark")
+@click.option('--repeat', '-r', default=5,     type=int,
+              help="Number of repeats per micro-benchmark")
+@click.option('--scale',  '-x', default=1.0,   type=float,
+              help="Scale factor for macro-benchmark sizes")
+@click.option('--engine', '-e', default='std', type=click.Choice(['std', 'bit']),
+              help="Deal engine for macro-benchmarks")
+@click.option('--memory/--no-memory', default=True,
+              help="Measure peak memory for macro-benchmarks (separate pass)")
+@click.option('--output', '-o', default=None,
+              help="Save results to JSON file")
+def run(benches, seed, ops, repeat, scale, engine, memory, output):
+    """Run benchmarks, and print (and optionally save) the results
+    """
+    log.setLevel(HEADLESS_LEVEL)
+    names = ['micro.' + name for name in MICRO] + ['macro.' + name for name in MACRO]
+    if benches:
+        names = [n for n in names if n in benches or n.split('.')[0] in benches]
+        if not names:
+            raise click.UsageError("No matching benchmarks: %s" % (', '.join(benches)))
+
+    results = {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'commit'   : git_commit(),
+                        'python'   : platform.python_version(),
+                        'platform' : platform.platform(),
+                        'seed'     : seed,
+                        'ops'      : ops,
+                        'repeat'   : repeat,
+                        'scale'    : scale,
+                        'engine'   : engine},
+               'benchmarks': {}}
+
+    for name in names:
+        kind, bench = name.split('.')
+        if kind == 'micro':
+            res = run_micro(bench, ops, seed, repeat)
+            print("%-28s %12.1f ns/op (median %.1f), %12.0f ops/sec" %
+                  (name, res['best_ns'], res['median_ns'], res['ops_per_sec']))
+        else:
+            res = run_macro(bench, scale, seed, engine, memory)
+            line = "%-28s %12.1f deals/sec" % (name, res['deals_per_sec'])
+            if 'decisions_per_sec' in res:
+                line += ", %.0f decisions/sec" % (res['decisions_per_sec'])
+            if 'peak_kb' in res:
+                line += ", peak %.0f KB" % (res['peak_kb'])
+            print(line)
+        results['benchmarks'][name] = res
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+@cli.command()
+@click.argument('base_file')
+@click.argument('new_file')
+@click.option('--threshold', '-t', default=10.0, type=float,
+              help="Percent change in primary metric to report as a regression")
+def compare(base_file, new_file, threshold):
+    """Compare two saved results files (primary metric is ns/op for micro-benchmarks,
+    deals/sec for macro-benchmarks); exits with 1 if there are any regressions
+    """
+    with open(base_file) as f:
+        base = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    nregress = compare_results(base, new, threshold)
+    if nregress:
+        print("%d regression(s) (threshold %.1f%%)" % (nregress, threshold))
+        sys.exit(1)
+    return 0
+
+if __name__ == '__main__':
+    cli()
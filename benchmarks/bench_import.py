@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Startup benchmark: import time for the euchre modules (as reported by python -X
+importtime), and check that importing does not load config, open the log file, or pull
+in CLI dependencies
+"""
+
+import sys
+import os
+import os.path
+import subprocess
+
+BENCH_DIR  = os.path.dirname(os.path.realpath(__file__))
+EUCHRE_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'euchre')
+
+import click
+
+# modules that should only be imported when actually needed
+LAZY_MODULES = ('yaml', 'click', 'logging.handlers', 'socket', 'numpy')
+
+CHECK_SCRIPT = """
+import sys
+import %s
+import core
+print(','.join(m for m in %r if m in sys.modules))
+print(int('param' in vars(core)))
+print(int(core.dflt_hand._handler is not None))
+"""
+
+def importtime(module):
+    """Import module in a fresh interpreter
+
+    :return: tuple (total usec, list of (cumulative usec, module name) for all imports)
+    """
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import ' + module]
+    proc = subprocess.run(cmd, cwd=EUCHRE_DIR, capture_output=True, text=True, check=True)
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumul_us, name = line[len('import time:'):].split('|')
+        imports.append((int(cumul_us), name.strip()))
+    total = next(us for us, name in reversed(imports) if name == module)
+    return total, imports
+
+def side_effects(module):
+    """
+    :return: list of strings (descriptions of side effects of importing module)
+    """
+    cmd = [sys.executable, '-c', CHECK_SCRIPT % (module, LAZY_MODULES)]
+    proc = subprocess.run(cmd, cwd=EUCHRE_DIR, capture_output=True, text=True, check=True)
+    lazy, config_loaded, log_opened = proc.stdout.splitlines()
+    effects = ["imports %s" % (m) for m in lazy.split(',') if m]
+    if int(config_loaded):
+        effects.append("loads config")
+    if int(log_opened):
+        effects.append("opens log file")
+    return effects
+
+@click.command()
+@click.option('--module', '-m', 'modules', multiple=True,
+              default=('euchre', 'bid_stage1', 'bitengine'), help="Module(s) to import")
+@click.option('--runs',   '-r', default=5, type=int, help="Number of runs (best is reported)")
+@click.option('--top',    '-t', default=8, type=int, help="Number of slowest imports to list")
+def main(modules, runs, top):
+    """Report import time (best of N runs) and side effects for euchre modules
+
+    Note: if bytecode writing is disabled (e.g. PYTHONDONTWRITEBYTECODE), times include
+    compiling the modules on each run
+    """
+    for module in modules:
+        results = [importtime(module) for _ in range(runs)]
+        total, imports = min(results)
+        print("%s: %.1f ms" % (module, total / 1000.0))
+        for us, name in sorted(imports, reverse=True)[1:top + 1]:
+            print("  %8.1f ms  %s" % (us / 1000.0, name))
+        effects = side_effects(module)
+        print("  side effects: %s" % (', '.join(effects) if effects else "none"))
+    return 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Memory benchmark: bytes retained per deal, for deals kept in Game.deals (as in long
+bid_stage1 runs, where the game never ends); with a bounded history (see Match), this
+should be (close to) zero
+"""
+
+import sys
+import os.path
+import random
+import gc
+import logging
+import tracemalloc
+
+BENCH_DIR  = os.path.dirname(os.path.realpath(__file__))
+EUCHRE_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'euchre')
+sys.path.insert(0, EUCHRE_DIR)
+
+import click
+
+from core import log
+from euchre import Match
+import bidding
+import playing
+
+def retained_per_deal(ndeals, seed = None, retain = None):
+    """Play the specified number of deals in a single (never-ending) game
+
+    :param retain: number of most recent deals to retain (None for all)
+    :return: float (bytes retained per deal)
+    """
+    random.seed(seed)
+    match = Match(bidding, playing, game_points=sys.maxsize, history=retain)
+    game = match.newgame()
+    # warm up, so that one-time allocations are not counted
+    game.newdeal().play()
+
+    tracemalloc.start()
+    gc.collect()
+    base = tracemalloc.get_traced_memory()[0]
+    for _ in range(ndeals):
+        game.newdeal().play()
+    # deals are reference cycles (deal <-> hands), so collect before measuring
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return retained / ndeals
+
+@click.command()
+@click.option('--ndeals', '-n', default=2000, type=int, help="Number of deals to retain")
+@click.option('--seed',   '-s', default=1,    type=int, help="Seed for random module")
+@click.option('--retain', '-r', default=None, type=int,
+              help="Number of most recent deals to retain (default: all)")
+def main(ndeals, seed, retain):
+    """Report bytes retained per deal
+    """
+    log.setLevel(logging.WARNING)
+    per_deal = retained_per_deal(ndeals, seed, retain)
+    print("%d bytes per deal played (%d deals)" % (per_deal, ndeals))
+    return 0
+
+if __name__ == '__main__':
+    main()
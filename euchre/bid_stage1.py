@@ -51,10 +51,10 @@ import random
 import datetime as dt
 import csv
 
-import click
-
-from core import BASE_DIR, param, dflt_hand, dbg_hand, TEAMS
-from euchre import Match
+import core
+from core import BASE_DIR, dflt_hand, dbg_hand, TEAMS
+from euchre import Match, set_logging, set_profiling
+from stats import MatchStats
 import playing
 import utils
 
@@ -65,62 +65,223 @@ MODELS_DIR = 'models'
 TDATA_DIR  = 'training_data'
 MODEL_NAME = 'bid_stage1'
 
+SHARD_DEALS_DFLT = 10000
+
 def tdata_file(run_id):
     filename  = 'tdata_' + run_id
     return os.path.join(BASE_DIR, MODELS_DIR, MODEL_NAME, TDATA_DIR, filename)
 
-@click.command()
-@click.option('--ndeals',  '-n', default=1,    type=int, help="Number of deals to run through")
-@click.option('--debug',   '-d', default=0,    type=int, help="Debug level (0-2)")
-@click.option('--seed',    '-s', default=None, type=int, help="Seed for random module")
-def main(ndeals, debug, seed):
+def play_variants(game, writer):
+    """Play all bid variants for a new deal (replays after the first), and write out the
+    resulting features
+
+    :return: int (number of rows written)
+    """
+    nrows = 0
+    for iplay in range(BID_VARIANTS):
+        deal = game.replaydeal() if iplay > 0 else game.newdeal()
+        deal.play()
+        if deal.caller:
+            caller_idx   = deal.caller.team_idx
+            tricks_made  = deal.score[caller_idx]
+            ml_features = (len(deal.bids) - 1,  # bidder position, 0-7 (3 and 7 are dealer)
+                           int(deal.play_alone),
+                           *deal.caller.bid_features(deal.contract),
+                           tricks_made)
+            writer.writerow(ml_features)
+            nrows += 1
+            #print("ML features: %s" % (list(ml_features)))
+
+        #print(deal.stats)
+    return nrows
+
+def gen_shard(shard):
+    """Generate training data for one shard (runs in a worker process); rows are written
+    to a temporary file, which is renamed only when the shard is complete, so a failed
+    shard never leaves a partial file behind
+
+    :param shard: dict (shard entry for the manifest, see gen_sharded)
+    :return: tuple (shard dict, updated with status and nrows; MatchStats or None;
+             PhaseStats or None)
+    """
+    partname = shard['file'] + '.part'
+    try:
+        # the temporary file is created first, so that gen_sharded can tell whether a
+        # shard was started, if its worker process dies
+        with open(partname, 'w', newline='') as f:
+            # note that worker processes may be reused across shards
+            Match.matchstats = MatchStats()
+            profiler = set_profiling(shard['profile'])
+            random.seed(shard['seed'])
+            match = Match(mymodule, playing, game_points=MAX_DEALS, history=0)
+            nrows = 0
+            writer = csv.writer(f, lineterminator='\n')
+            for ideal in range(shard['ndeals']):
+                nrows += play_variants(match.newgame(), writer)
+        os.replace(partname, shard['file'])
+        match.compute_stats()
+    except Exception as e:
+        log.exception("Shard #%d failed", shard['shard'])
+        if os.path.exists(partname):
+            os.remove(partname)
+        return dict(shard, status='failed', error=repr(e)), None, None
+    return dict(shard, status='complete', nrows=nrows), Match.matchstats, profiler
+
+def gen_sharded(dsname, ndeals, seed, workers, shard_deals, merge, profiler = None):
+    """Shard deals across a pool of worker processes, where shard n is played with seed
+    (seed + n), and each shard is streamed to its own file; a manifest (JSON) listing
+    the shards and their status is rewritten as each shard finishes
+
+    If a worker process dies (without a Python exception), the pool is broken, and all
+    of its outstanding shards are returned as failed; shards that had not yet started
+    are run again in a new pool, and those that had started (which includes the one
+    that caused the failure) are run again one at a time, so that only the shard that
+    actually fails is lost
+
+    :param merge: bool (concatenate completed shards into a single CSV at the end)
+    :param profiler: PhaseStats (if specified, phase timings from workers are merged in)
+    :return: int (number of failed shards)
+    """
+    import json
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    shards = []
+    for ishard, start in enumerate(range(0, ndeals, shard_deals)):
+        shards.append({'shard' : ishard,
+                       'file'  : "%s_%04d.csv" % (dsname, ishard),
+                       'seed'  : seed + ishard,
+                       'ndeals': min(shard_deals, ndeals - start),
+                       'profile': bool(profiler),
+                       'status': 'pending'})
+    manifest = {'seed': seed, 'ndeals': ndeals, 'shards': shards}
+
+    def write_manifest():
+        tmpname = dsname + '.manifest.part'
+        with open(tmpname, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmpname, dsname + '.manifest')
+
+    write_manifest()
+    pending = list(shards)
+    suspects = []  # shards that were running when a pool broke
+    while pending or suspects:
+        if pending:
+            batch, nworkers, pending = pending, workers, []
+        else:
+            batch, nworkers, suspects = suspects[:1], 1, suspects[1:]
+        progress = False
+        with ProcessPoolExecutor(nworkers) as executor:
+            futures = {executor.submit(gen_shard, shard): shard for shard in batch}
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    shard, matchstats, shard_profiler = future.result()
+                except BrokenProcessPool as e:
+                    partname = shard['file'] + '.part'
+                    started = os.path.exists(partname)
+                    if started:
+                        os.remove(partname)
+                    if nworkers > 1:
+                        (suspects if started else pending).append(shard)
+                        progress = progress or started
+                        continue
+                    shard = dict(shard, status='failed', error=repr(e))
+                    matchstats = shard_profiler = None
+                progress = True
+                shards[shard['shard']] = shard
+                if matchstats:
+                    Match.matchstats.merge(matchstats)
+                if profiler and shard_profiler:
+                    profiler.merge(shard_profiler)
+                write_manifest()
+                print("Shard #%d (seed %d): %s" %
+                      (shard['shard'], shard['seed'], shard['status']))
+        if not progress:
+            # no shard was started before the pool broke, so run them one at a time
+            suspects += pending
+            pending = []
+
+    failed = [shard for shard in shards if shard['status'] != 'complete']
+    if merge:
+        with open(dsname + '.csv', 'w', newline='') as f:
+            for shard in shards:
+                if shard['status'] == 'complete':
+                    with open(shard['file'], newline='') as shard_f:
+                        f.writelines(shard_f)
+    return len(failed)
+
+def main(ndeals = 1, debug = 0, seed = None, retain = 0, workers = None,
+         shard_deals = SHARD_DEALS_DFLT, merge = False, headless = False, sample = 0,
+         async_log = None, profile = False):
     """Generate training data for Stage 1 bidding model
 
     Currently hardwired to use the default "playing" module for playing out the hand
-    (though we can make this configurable later)
+    (though we can make this configurable later); features are written out as deals
+    are completed, so memory usage does not grow with the number of deals
     """
     ndeals = ndeals or MAX_DEALS
-    debug = debug or int(param.get('debug') or 0)
-    if debug > 0:
-        log.setLevel(utils.TRACE if debug > 1 else logging.DEBUG)
-        dflt_hand.setLevel(utils.TRACE if debug > 1 else logging.DEBUG)
+    debug = debug or int(core.param.get('debug') or 0)
+    set_logging(debug, headless, sample, async_log)
+    profiler = set_profiling(profile)
     random.seed(seed)
     dsname = tdata_file(dt.datetime.now().strftime('%Y%m%d%H%M%S'))
-    features = []
-
-    match = Match(mymodule, playing, game_points=MAX_DEALS)
-    for ideal in range(ndeals):
-        game = match.newgame()
-        for iplay in range(BID_VARIANTS):
-            deal = game.replaydeal() if iplay > 0 else game.newdeal()
-            deal.play()
-            if deal.caller:
-                caller_idx   = deal.caller.team_idx
-                tricks_made  = deal.score[caller_idx]
-                ml_features = (len(deal.bids) - 1,  # bidder position, 0-7 (3 and 7 are dealer)
-                               int(deal.play_alone),
-                               *deal.caller.bid_features(deal.contract),
-                               tricks_made)
-                features.append(ml_features)
-                #print("ML features: %s" % (list(ml_features)))
-
-            #print(deal.stats)
-
-        print("Score for game #%d: %s %d, %s %d" %
-              (game.gameno,
-               TEAMS[0]['name'], game.score[0],
-               TEAMS[1]['name'], game.score[1]))
-        game.compute_stats()
-
-    with open(dsname + '.csv', 'w', newline='') as f:
-        writer = csv.writer(f, lineterminator='\n')
-        writer.writerows(features)
-
-    match.compute_stats()
+
+    if workers:
+        nfailed = gen_sharded(dsname, ndeals, seed, workers, shard_deals, merge, profiler)
+        if nfailed:
+            print("%d shard(s) failed, see %s" % (nfailed, dsname + '.manifest'))
+    else:
+        match = Match(mymodule, playing, game_points=MAX_DEALS, history=retain)
+        with open(dsname + '.csv', 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            for ideal in range(ndeals):
+                game = match.newgame()
+                play_variants(game, writer)
+                print("Score for game #%d: %s %d, %s %d" %
+                      (game.gameno,
+                       TEAMS[0]['name'], game.score[0],
+                       TEAMS[1]['name'], game.score[1]))
+        match.compute_stats()
+
     matchstats_agg = Match.matchstats.compute_agg()
     for k, v in matchstats_agg.items():
         print("%20s: %s" % (k, v))
+    if profiler:
+        profiler.report()
     return 0
 
+def cli():
+    """Command line interface for main() (click is imported here, rather than at module
+    level, to keep imports fast)
+    """
+    import click
+
+    @click.command(help=main.__doc__)
+    @click.option('--ndeals',  '-n', default=1,    type=int, help="Number of deals to run through")
+    @click.option('--debug',   '-d', default=0,    type=int, help="Debug level (0-2)")
+    @click.option('--seed',    '-s', default=None, type=int, help="Seed for random module")
+    @click.option('--retain',  '-r', default=0,    type=int,
+                  help="Number of most recent games/deals to retain (default: none)")
+    @click.option('--workers', '-w', default=None, type=int,
+                  help="Number of worker processes (output is sharded by seed)")
+    @click.option('--shard-deals', default=SHARD_DEALS_DFLT, type=int,
+                  help="Number of deals per shard (with --workers)")
+    @click.option('--merge/--no-merge', default=False,
+                  help="Merge shard files into a single CSV (with --workers)")
+    @click.option('--headless', is_flag=True, help="Disable INFO and DEBUG logging")
+    @click.option('--sample',  default=0,    type=int,
+                  help="Log 1 in every N deals at debug level (e.g. with --headless)")
+    @click.option('--async-log', default=None, type=click.Choice(['block', 'drop']),
+                  help="Write log file from a background thread (policy if queue is full)")
+    @click.option('--profile', is_flag=True,
+                  help="Report time spent in each phase of a deal at the end")
+    def main_cmd(**kwargs):
+        return main(**kwargs)
+
+    return main_cmd()
+
 if __name__ == '__main__':
-    main()
+    cli()
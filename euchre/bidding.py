@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from core import log, SUITS, ace, king, queen, jack, ten, nine, right, left
+from core import log, SUITS, ace, king, queen, jack, ten, nine, right, left, LogicError
+from hand import EFFLEVEL
+from utils import TRACE
 
 # TEMP: for now, hardwire value for off-suit aces and voids, as equated with
 # a trump suit card value!!!
@@ -10,12 +12,19 @@ VOID_SUIT_VALUE = queen['level']
 BID_THRESHOLD   = right['level'] + left['level'] + ten['level'] + OFF_ACE_VALUE
 DEALER_VALUE    = nine['level']
 
+# set to stats.RuleStats instance to enable rule instrumentation (see _bestdiscard)
+rule_stats = None
+
 class BidAnalysis(object):
     """Analysis for a hand and specified trump suit
 
     TODO: need to transition this class into the bidding module, to keep the Hand
     class/module as unopinionated (relative to strategy) as possible!!!
     """
+    __slots__ = ('cards', 'trump', 'turncard', 'discard', 'suitcount', 'suitcards',
+                 'trump_score', 'next_score', 'green_score', 'purple_score', 'green_swap',
+                 'trumps', 'aces', 'voids', 'singletons', 'top_trump_scores', 'hand_score')
+
     def __init__(self, cards, trump, turncard, discard = None):
         self.cards        = cards
         self.trump        = trump
@@ -77,7 +86,8 @@ class BidAnalysis(object):
                 self.aces += 1
 
         # re-sort suitcards to include bower rankings (TODO: make this less ugly!!!)
-        self.suitcards[tru_idx].sort(key=lambda c: c.efflevel[tru_idx])
+        level = EFFLEVEL[tru_idx]
+        self.suitcards[tru_idx].sort(key=lambda c: level[c.idx])
 
         # count trumps/voids/singletons
         count = self.suitcount.copy()
@@ -91,16 +101,16 @@ class BidAnalysis(object):
         nxt_cards = self.suitcards[nxt_idx]
         grn_cards = self.suitcards[grn_idx]
         pur_cards = self.suitcards[pur_idx]
-        self.trump_score  = sum(c.efflevel[tru_idx] for c in tru_cards)
-        self.next_score   = sum(c.efflevel[tru_idx] for c in nxt_cards)
-        self.green_score  = sum(c.efflevel[tru_idx] for c in grn_cards)
-        self.purple_score = sum(c.efflevel[tru_idx] for c in pur_cards)
+        self.trump_score  = sum(level[c.idx] for c in tru_cards)
+        self.next_score   = sum(level[c.idx] for c in nxt_cards)
+        self.green_score  = sum(level[c.idx] for c in grn_cards)
+        self.purple_score = sum(level[c.idx] for c in pur_cards)
 
         # aggregation for top trump card scores (idx 0 = top trump, idx 1 = second high, etc.)
         for idx in range(len(tru_cards)):
             card_idx = -1 - idx
             for idx2 in range(idx, len(self.cards)):
-                self.top_trump_scores[idx2] += tru_cards[card_idx].efflevel[tru_idx]
+                self.top_trump_scores[idx2] += level[tru_cards[card_idx].idx]
 
         # REVISIT: currently swap green and purple scores based on "score", but could
         # (or should) it be something else???
@@ -115,6 +125,10 @@ class BidAnalysis(object):
                           self.voids * VOID_SUIT_VALUE + \
                           self.aces * OFF_ACE_VALUE
 
+        # freeze the suit card lists (analysis is not modified from here on, and tuples
+        # are more compact, especially for empty suits)
+        self.suitcards = tuple(tuple(s) for s in self.suitcards)
+
         self.log_trace()
 
     @property
@@ -140,34 +154,37 @@ class BidAnalysis(object):
     def log_trace(self):
         """
         """
-        log.trace("  with %s as trump:" % (self.trump['tag']))
-        log.trace("    cards by suit:    %s" % (self.card_tags_by_suit))
-        log.trace("    count by suit:    %s" % (self.suitcount))
-        log.trace("    trump score:      %s" % (self.trump_score))
-        log.trace("    next score:       %s" % (self.next_score))
-        log.trace("    green score:      %s" % (self.green_score))
-        log.trace("    purple score:     %s" % (self.purple_score))
-        log.trace("    trumps:           %s" % (self.trumps))
-        log.trace("    top trump scores: %s" % (self.top_trump_scores))
-        log.trace("    aces:             %s" % (self.aces))
-        log.trace("    voids:            %s" % (self.voids))
-        log.trace("    singletons:       %s" % (self.singletons))
-        log.trace("    hand score:       %s" % (self.hand_score))
+        if not log.isEnabledFor(TRACE):
+            return
+        log.trace("  with %s as trump:", self.trump['tag'])
+        log.trace("    cards by suit:    %s", self.card_tags_by_suit)
+        log.trace("    count by suit:    %s", self.suitcount)
+        log.trace("    trump score:      %s", self.trump_score)
+        log.trace("    next score:       %s", self.next_score)
+        log.trace("    green score:      %s", self.green_score)
+        log.trace("    purple score:     %s", self.purple_score)
+        log.trace("    trumps:           %s", self.trumps)
+        log.trace("    top trump scores: %s", self.top_trump_scores)
+        log.trace("    aces:             %s", self.aces)
+        log.trace("    voids:            %s", self.voids)
+        log.trace("    singletons:       %s", self.singletons)
+        log.trace("    hand score:       %s", self.hand_score)
 
 def analyze(hand, turncard):
     """
     """
-    log.trace("Analyzing hand for %s: %s" % (hand.seat['name'], hand.card_tags))
+    if log.isEnabledFor(TRACE):
+        log.trace("Analyzing hand for %s: %s", hand.seat['name'], hand.card_tags)
     discard = None
     bid_analysis = [BidAnalysis(hand.cards, s, turncard) for s in SUITS]
     # penalty/reward for ordering trump into dealer hand (note, this should be
     # pushed into BidAnalysis, one way or another!)
     turn_idx = turncard.suit['idx']
     if hand.pos in (0, 2):
-        penalty = turncard.efflevel[turn_idx]
+        penalty = EFFLEVEL[turn_idx][turncard.idx]
         bid_analysis[turn_idx].hand_score -= penalty
     elif hand.pos == 1:
-        reward = turncard.efflevel[turn_idx] // 2
+        reward = EFFLEVEL[turn_idx][turncard.idx] // 2
         bid_analysis[turn_idx].hand_score += reward
 
     # fix up dealer hand based on turncard
@@ -179,8 +196,8 @@ def analyze(hand, turncard):
         newcards = hand.cards.copy()
         newcards.append(turncard)
         newcards.remove(discard)
-        log.trace("Reanalyzing dealer hand with turncard (%s) and discard (%s)" %
-                  (turncard.tag, discard.tag))
+        log.trace("Reanalyzing dealer hand with turncard (%s) and discard (%s)",
+                  turncard.tag, discard.tag)
         reanalysis = BidAnalysis(newcards, turncard.suit, turncard, discard)
         bid_analysis[suit_idx] = reanalysis
 
@@ -200,7 +217,7 @@ def _bestdiscard(analysis, turncard):
         """
         if suitcount[tru_idx] == len(analysis.cards):
             discard = min(suitcards[tru_idx][0], turncard, key=lambda c: c.level)
-            log.debug("Discard %s if %s trump, lowest trump" % (discard.tag, trump['tag']))
+            log.debug("Discard %s if %s trump, lowest trump", discard.tag, trump['tag'])
             return discard
 
     def create_void():
@@ -219,7 +236,7 @@ def _bestdiscard(analysis, turncard):
                     mincard = suitcards[idx][0]
                     minlevel = mincard.level
             if mincard:
-                log.debug("Discard %s if %s trump, voiding suit" % (mincard.tag, trump['tag']))
+                log.debug("Discard %s if %s trump, voiding suit", mincard.tag, trump['tag'])
                 return mincard
 
     def create_doubleton():
@@ -232,7 +249,7 @@ def _bestdiscard(analysis, turncard):
             if idx != tru_idx:
                 # note that first element is the loweest (cards sorted ascending)
                 discard = suitcards[idx][0]
-                log.debug("Discard %s if %s trump, creating doubleton" % (discard.tag, trump['tag']))
+                log.debug("Discard %s if %s trump, creating doubleton", discard.tag, trump['tag'])
                 return discard
 
     def discard_from_next():
@@ -243,7 +260,7 @@ def _bestdiscard(analysis, turncard):
             # don't unguard doubleton king or break up A-K
             if king not in (c.rank for c in suitcards[nxt_idx]):
                 discard = suitcards[nxt_idx][0]
-                log.debug("Discard %s if %s trump, reducing next" % (discard.tag, trump['tag']))
+                log.debug("Discard %s if %s trump, reducing next", discard.tag, trump['tag'])
                 return discard
 
     def discard_lowest():
@@ -276,7 +293,7 @@ def _bestdiscard(analysis, turncard):
         if not mincard:
             mincard = min(savecards, key=lambda c: c.level)
             log.debug("Have to unguard doubleton king or discard from A/A-K, oh well...")
-        log.debug("Discard %s if %s trump, lowest card" % (mincard.tag, trump['tag']))
+        log.debug("Discard %s if %s trump, lowest card", mincard.tag, trump['tag'])
         return mincard
 
     # for now, we only have a single ruleset (later, can conditionally choose rules)
@@ -290,10 +307,13 @@ def _bestdiscard(analysis, turncard):
         """TODO: move to core (currently replicated across modules)!!!
         """
         res = None
-        for rule in ruleset:
-            res = rule()
-            if res:
-                break
+        if rule_stats is not None:
+            res = rule_stats.apply('discard', ruleset, None, None)
+        else:
+            for rule in ruleset:
+                res = rule()
+                if res:
+                    break
         if not res:
             raise LogicError("Ruleset did not produce valid result")
         return res
@@ -341,8 +361,8 @@ def _biddable(hand, trump, bid_pos):
         thresh -= DEALER_VALUE
     elif bid_pos > 3:
         thresh -= bid_pos % 4  # or whatever...
-    log.debug("  Hand score: %d (with %s as trump), threshold: %d" %
-              (hand.bid_analysis[idx].hand_score, trump['tag'], thresh))
+    log.debug("  Hand score: %d (with %s as trump), threshold: %d",
+              hand.bid_analysis[idx].hand_score, trump['tag'], thresh)
     return hand.bid_analysis[idx].hand_score > thresh
 
 def bid_features(hand, suit):
@@ -365,12 +385,13 @@ def bid_features(hand, suit):
     suit_idx = suit['idx']
     analysis = hand.bid_analysis[suit_idx]
 
-    if analysis.turncard.is_left():
+    turncard = analysis.turncard.bind(suit)
+    if turncard.is_left():
         turn_level = right['level']
-        turn_suit  = analysis.turncard.base['suit']
+        turn_suit  = turncard.base['suit']
     else:
-        turn_level = analysis.turncard.level
-        turn_suit  = analysis.turncard.suit
+        turn_level = turncard.level
+        turn_suit  = turncard.suit
     one_hot_rel_suits = tuple(int(turn_suit == s) for s in analysis.rel_suits)
     top_trump_scores = tuple(analysis.top_trump_scores[:3])
     return (turn_level,
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Bidding strategy for the bit engine, equivalent to the bidding module (see bidding.py
+for commentary on the rules and formulas, which are not repeated here)
+"""
+
+from core import ace, king, LogicError
+from bitcards import (CARD_BIT, RANK, BASE_SUIT, BASE_LEVEL, EFF_LEVEL, EFF_SUIT,
+                      EFF_SUIT_MASK, SUIT_MASK, RANK_MASK, low_card)
+from bidding import OFF_ACE_VALUE, VOID_SUIT_VALUE, BID_THRESHOLD, DEALER_VALUE
+
+ACE_MASK  = RANK_MASK[ace['idx']]
+KING_MASK = RANK_MASK[king['idx']]
+
+class BitBidAnalysis(object):
+    """Analysis for a hand (mask) and specified trump suit (idx)
+    """
+    __slots__ = ('mask', 'trump', 'turncard', 'discard', 'suitmasks', 'suitcount',
+                 'trump_score', 'next_score', 'green_score', 'purple_score',
+                 'green_swap', 'trumps', 'aces', 'voids', 'singletons',
+                 'top_trump_scores', 'hand_score')
+
+    def __init__(self, mask, trump, turncard, discard = None):
+        self.mask     = mask
+        self.trump    = trump
+        self.turncard = turncard
+        self.discard  = discard
+
+        level     = EFF_LEVEL[trump]
+        effsuit   = EFF_SUIT[trump]
+        suitmask  = EFF_SUIT_MASK[trump]
+        self.suitmasks = [mask & suitmask[s] for s in range(4)]
+        self.aces      = (mask & ACE_MASK & ~SUIT_MASK[trump]).bit_count()
+
+        count  = [0, 0, 0, 0]
+        scores = [0, 0, 0, 0]
+        trump_levels = []
+        m = mask
+        while m:
+            low = m & -m
+            card = low.bit_length() - 1
+            suit = effsuit[card]
+            count[suit] += 1
+            scores[suit] += level[card]
+            if suit == trump:
+                trump_levels.append(level[card])
+            m ^= low
+        self.suitcount  = count
+        self.trumps     = count[trump]
+        off_counts      = [count[s] for s in range(4) if s != trump]
+        self.voids      = off_counts.count(0)
+        self.singletons = off_counts.count(1)
+
+        self.trump_score  = scores[trump]
+        self.next_score   = scores[trump ^ 0x03]
+        self.green_score  = scores[trump ^ 0x01]
+        self.purple_score = scores[trump ^ 0x02]
+        self.green_swap   = False
+
+        # top trump scores (idx 0 = top trump, idx 1 = top two, etc.)
+        trump_levels.sort(reverse=True)
+        ncards = mask.bit_count()
+        self.top_trump_scores = [0] * ncards
+        total = 0
+        for idx in range(ncards):
+            if idx < len(trump_levels):
+                total += trump_levels[idx]
+            self.top_trump_scores[idx] = total
+
+        if self.purple_score > self.green_score:
+            self.green_score, self.purple_score = self.purple_score, self.green_score
+            self.green_swap = True
+
+        self.hand_score = self.trump_score + \
+                          self.trumps * 2 + \
+                          self.voids * VOID_SUIT_VALUE + \
+                          self.aces * OFF_ACE_VALUE
+
+def analyze(hand, turncard):
+    """
+    :return: tuple (list of BitBidAnalysis, indexed by suit; discard card idx or None)
+    """
+    discard = None
+    bid_analysis = [BitBidAnalysis(hand.mask, s, turncard) for s in range(4)]
+    turn_idx = BASE_SUIT[turncard]
+    if hand.pos in (0, 2):
+        bid_analysis[turn_idx].hand_score -= EFF_LEVEL[turn_idx][turncard]
+    elif hand.pos == 1:
+        bid_analysis[turn_idx].hand_score += EFF_LEVEL[turn_idx][turncard] // 2
+
+    if hand.pos == 3:
+        discard = _bestdiscard(bid_analysis[turn_idx], turncard)
+        newmask = (hand.mask | CARD_BIT[turncard]) & ~CARD_BIT[discard]
+        bid_analysis[turn_idx] = BitBidAnalysis(newmask, turn_idx, turncard, discard)
+
+    return (bid_analysis, discard)
+
+def _bestdiscard(analysis, turncard):
+    """Same rules (and order of evaluation) as bidding._bestdiscard; note that card
+    levels are compared using base level, since trump is not yet set
+    """
+    tru_idx   = BASE_SUIT[turncard]
+    nxt_idx   = tru_idx ^ 0x03
+    suitcount = analysis.suitcount
+    suitmasks = analysis.suitmasks
+
+    # all trump case
+    if suitcount[tru_idx] == analysis.mask.bit_count():
+        lowest = low_card(suitmasks[tru_idx], tru_idx)
+        return lowest if BASE_LEVEL[lowest] <= BASE_LEVEL[turncard] else turncard
+
+    # create void
+    if suitcount.count(1) > 0:
+        mincard = None
+        minlevel = 10
+        for idx in range(4):
+            if idx == tru_idx or suitcount[idx] != 1:
+                continue
+            card = low_card(suitmasks[idx], tru_idx)
+            if BASE_LEVEL[card] < minlevel and RANK[card] != ace['idx']:
+                mincard = card
+                minlevel = BASE_LEVEL[card]
+        if mincard is not None:
+            return mincard
+
+    # create doubleton
+    if suitcount.count(3) > 0:
+        idx = suitcount.index(3)
+        if idx != tru_idx:
+            return low_card(suitmasks[idx], tru_idx)
+
+    # discard from next
+    if suitcount[nxt_idx] == 2 and not suitmasks[nxt_idx] & KING_MASK:
+        return low_card(suitmasks[nxt_idx], tru_idx)
+
+    # discard lowest
+    mincard = None
+    minlevel = ace['level']
+    savecards = []
+    for idx in range(4):
+        if idx == tru_idx:
+            continue
+        if suitcount[idx] == 2 and suitmasks[idx] & KING_MASK:
+            savecards.append(low_card(suitmasks[idx], tru_idx))
+            continue
+        if suitmasks[idx]:
+            card = low_card(suitmasks[idx], tru_idx)
+            if BASE_LEVEL[card] < minlevel:
+                mincard = card
+                minlevel = BASE_LEVEL[card]
+            elif BASE_LEVEL[card] == minlevel:
+                savecards.append(card)
+    if mincard is None:
+        if not savecards:
+            raise LogicError("Ruleset did not produce valid result")
+        mincard = min(savecards, key=lambda c: BASE_LEVEL[c])
+    return mincard
+
+def bid(hand):
+    """
+    :return: suit idx or None (meaning "pass")
+    """
+    deal = hand.deal
+    bid_pos = len(deal.bids)
+    turn_idx = BASE_SUIT[deal.turncard]
+
+    if bid_pos < 4:
+        return turn_idx if _biddable(hand, turn_idx, bid_pos) else None
+    else:
+        suit = _bestsuit(hand, turn_idx)
+        return suit if _biddable(hand, suit, bid_pos) else None
+
+def _bestsuit(hand, exclude = None):
+    """
+    :return: suit idx
+    """
+    suits = [s for s in range(4) if s != exclude]
+    return max(suits, key=lambda s: hand.bid_analysis[s].hand_score)
+
+def _biddable(hand, trump, bid_pos):
+    thresh = BID_THRESHOLD
+    if bid_pos == 3:
+        thresh -= DEALER_VALUE
+    elif bid_pos > 3:
+        thresh -= bid_pos % 4
+    return hand.bid_analysis[trump].hand_score > thresh
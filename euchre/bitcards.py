@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integer/bitmask representation of cards, for use by the fast (bit) engine
+
+A card is represented by its index into core.CARDS (0-23), and a set of cards (hand,
+deck, seen cards, etc.) is represented by a 24-bit mask, where bit n is set if CARDS[n]
+is in the set.  Trump-relative (effective) level and suit for each card are looked up
+from tables that are computed once (at import), indexed by [trump suit idx][card idx].
+
+Note that the natural card index ordering (rank * 4 + suit) means that the cards within
+a single effective suit are also in ascending level order, with the exception of the
+bowers in the trump suit (see high_card() and low_card() below)
+"""
+
+from core import CARDS, SUITS, RANKS, jack, queen, king, ace, right, left
+
+#############
+# Constants #
+#############
+
+NCARDS    = len(CARDS)
+NSUITS    = len(SUITS)
+ALL_CARDS = (1 << NCARDS) - 1
+
+# base (i.e. non-trump-relative) card attributes, indexed by card
+RANK       = tuple(c['rank']['idx'] for c in CARDS)
+BASE_SUIT  = tuple(c['suit']['idx'] for c in CARDS)
+BASE_LEVEL = tuple(c['level'] for c in CARDS)
+TAG        = tuple(c['tag'] for c in CARDS)
+SORTKEY    = tuple(c['sortkey'] for c in CARDS)
+
+CARD_BIT   = tuple(1 << c for c in range(NCARDS))
+SUIT_MASK  = tuple(sum(CARD_BIT[c] for c in range(NCARDS) if BASE_SUIT[c] == s)
+                   for s in range(NSUITS))
+RANK_MASK  = tuple(sum(CARD_BIT[c] for c in range(NCARDS) if RANK[c] == r)
+                   for r in range(len(RANKS)))
+
+# bowers, indexed by trump suit
+RIGHT      = tuple(jack['idx'] * NSUITS + s for s in range(NSUITS))
+LEFT       = tuple(jack['idx'] * NSUITS + (s ^ 0x03) for s in range(NSUITS))
+BOWER_MASK = tuple(CARD_BIT[RIGHT[s]] | CARD_BIT[LEFT[s]] for s in range(NSUITS))
+
+##########################
+# Trump-relative tables #
+##########################
+
+def _build_efftables():
+    """Compute effective level and suit for each card, for each possible trump suit
+    (same rules as the original hand.Card implementation)
+
+    :return: tuple (level table, suit table), each indexed by [trump][card]
+    """
+    level = [list(BASE_LEVEL) for _ in range(NSUITS)]
+    suit  = [list(BASE_SUIT) for _ in range(NSUITS)]
+    for c in range(NCARDS):
+        suit_idx = BASE_SUIT[c]
+        opp_idx  = suit_idx ^ 0x03
+        if RANK[c] == jack['idx']:
+            level[suit_idx][c] = right['level']
+            level[opp_idx][c]  = left['level']
+            suit[opp_idx][c]   = opp_idx
+        elif RANK[c] in (queen['idx'], king['idx']):
+            level[suit_idx][c] -= 1
+            level[opp_idx][c]  -= 1
+        elif RANK[c] == ace['idx']:
+            level[opp_idx][c]  -= 1
+    return (tuple(tuple(row) for row in level), tuple(tuple(row) for row in suit))
+
+EFF_LEVEL, EFF_SUIT = _build_efftables()
+
+# masks for effective suits, indexed by [trump][suit]
+EFF_SUIT_MASK = tuple(tuple(sum(CARD_BIT[c] for c in range(NCARDS) if EFF_SUIT[t][c] == s)
+                            for s in range(NSUITS))
+                      for t in range(NSUITS))
+TRUMP_MASK    = tuple(EFF_SUIT_MASK[t][t] for t in range(NSUITS))
+
+# card order within a hand once trump is set (i.e. by effective suit, then effective
+# level), same as Hand.set_trump
+PLAY_ORDER = tuple(tuple(sorted(range(NCARDS), key=lambda c: EFF_SUIT[t][c] * 8 + EFF_LEVEL[t][c]))
+                   for t in range(NSUITS))
+# card order before trump is set (same as Hand.__init__)
+DEAL_ORDER = tuple(sorted(range(NCARDS), key=lambda c: SORTKEY[c]))
+
+####################
+# Trick resolution #
+####################
+
+# strength of each card within a trick, indexed by [trump][led card][card]: trump cards
+# rank above all others, cards following the led (effective) suit rank by level, and all
+# other cards have strength 0 (can never win); the played card takes the trick from the
+# currently winning card iff its strength is greater (strengths are distinct for all
+# cards that can win, so there are no ties)
+TRUMP_STRENGTH = 16
+
+def _build_strength():
+    rows = {}
+    table = []
+    for t in range(NSUITS):
+        by_lead = []
+        for lead in range(NCARDS):
+            led = EFF_SUIT[t][lead]
+            if (t, led) not in rows:
+                rows[(t, led)] = tuple(EFF_LEVEL[t][c] + TRUMP_STRENGTH if EFF_SUIT[t][c] == t
+                                       else (EFF_LEVEL[t][c] if EFF_SUIT[t][c] == led else 0)
+                                       for c in range(NCARDS))
+            by_lead.append(rows[(t, led)])
+        table.append(tuple(by_lead))
+    return tuple(table)
+
+STRENGTH = _build_strength()
+
+def trick_winner(trump, cards):
+    """Resolve a trick in a single call
+
+    :param trump: int (suit idx)
+    :param cards: sequence of card idx, in order played (None for a skipped turn, but
+                  the lead card must not be None)
+    :return: int (index within cards of the winning card)
+    """
+    strength = STRENGTH[trump][cards[0]]
+    best = 0
+    for i in range(1, len(cards)):
+        c = cards[i]
+        if c is not None and strength[c] > strength[cards[best]]:
+            best = i
+    return best
+
+######################
+# Mask manipulations #
+######################
+
+def mask_of(cards):
+    """
+    :param cards: iterable of card idx
+    :return: int (mask)
+    """
+    mask = 0
+    for c in cards:
+        mask |= CARD_BIT[c]
+    return mask
+
+def cards_of(mask, order = DEAL_ORDER):
+    """
+    :param mask: int
+    :param order: sequence of card idx (default is deal order, i.e. by sortkey)
+    :return: list of card idx
+    """
+    return [c for c in order if mask >> c & 1]
+
+def ncards(mask):
+    """
+    :return: int (number of cards in mask)
+    """
+    return mask.bit_count()
+
+def high_card(mask, trump):
+    """Return the highest card in the mask, which must contain cards of a single
+    effective suit (relative to trump)
+
+    :param mask: int (non-zero)
+    :param trump: int (suit idx)
+    :return: card idx
+    """
+    bowers = mask & BOWER_MASK[trump]
+    if bowers:
+        return RIGHT[trump] if bowers & CARD_BIT[RIGHT[trump]] else LEFT[trump]
+    return mask.bit_length() - 1
+
+def low_card(mask, trump):
+    """Return the lowest card in the mask, which must contain cards of a single
+    effective suit (relative to trump)
+
+    :param mask: int (non-zero)
+    :param trump: int (suit idx)
+    :return: card idx
+    """
+    rest = mask & ~BOWER_MASK[trump]
+    if rest:
+        return (rest & -rest).bit_length() - 1
+    return LEFT[trump] if mask & CARD_BIT[LEFT[trump]] else RIGHT[trump]
+
+def tags(cards):
+    """
+    :param cards: iterable of card idx
+    :return: list of card tags
+    """
+    return [TAG[c] for c in cards]
+
+###########
+# Interop #
+###########
+
+# engine-neutral accessors, for cards and suits from either engine (e.g. for comparing
+# or recording deals)
+
+def card_idx(card):
+    """
+    :param card: Card (reference engine) or int (bit engine), or None
+    :return: int (or None)
+    """
+    if card is None or isinstance(card, int):
+        return card
+    return card.idx
+
+def suit_idx(suit):
+    """
+    :param suit: SUITS entry (reference engine) or int (bit engine), or None
+    :return: int (or None)
+    """
+    if suit is None or isinstance(suit, int):
+        return suit
+    return suit['idx']
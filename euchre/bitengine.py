@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Fast (bit) engine, which runs the same shuffle/deal/bid/play sequence as euchre.Deal,
+but with cards represented as integers (0-23) and hands, decks, and seen-sets as 24-bit
+masks (see bitcards module)
+
+The bit engine is driven by its own bidding/playing modules (bitbidding and bitplaying
+by default), which implement the same strategy as the bidding and playing modules, and
+consume the random module in the same sequence--thus, for a given seed, the resulting
+deal stats (as well as game and match outcomes) are identical to the reference engine.
+BitDeal can be plugged into Match/Game by specifying `deal_class` for the match.
+"""
+
+import random
+
+from core import SUITS, SEATS, TEAMS, right, left, LogicError
+from bitcards import (NCARDS, ALL_CARDS, CARD_BIT, BASE_SUIT, BASE_LEVEL, EFF_LEVEL,
+                      EFF_SUIT, EFF_SUIT_MASK, TRUMP_MASK, PLAY_ORDER, mask_of, cards_of,
+                      STRENGTH, high_card, tags)
+
+CARD_IDXS = list(range(NCARDS))
+
+###########
+# BitHand #
+###########
+
+class BitHand(object):
+    """Lightweight counterpart to hand.Hand; `mask` is the set of cards currently
+    held (reflecting the turncard pickup and discard, once trump is set)
+    """
+    __slots__ = ('deal', 'seat', 'pos', 'next_pos', 'partner_pos', 'prev_pos', 'mask',
+                 'bidding', 'playing', 'bid_analysis', 'play_analysis', 'trump',
+                 'discard')
+
+    def __init__(self, deal, seat, pos, mask):
+        self.deal          = deal
+        self.seat          = seat
+        self.pos           = pos
+        self.next_pos      = (pos + 1) % 4
+        self.partner_pos   = (pos + 2) % 4
+        self.prev_pos      = (pos + 3) % 4
+        self.mask          = mask
+
+        self.bidding       = deal.match.bidding[seat['idx']]
+        self.playing       = deal.match.playing[seat['idx']]
+        self.bid_analysis  = None  # managed by bidding module
+        self.play_analysis = None  # managed by playing module
+
+        # the following are set in set_trump()
+        self.trump         = None  # suit idx
+        self.discard       = None  # dealer only
+
+    @property
+    def team_idx(self):
+        return self.seat['idx'] & 0x01
+
+    @property
+    def next(self):
+        return self.deal.hands[self.next_pos]
+
+    @property
+    def partner(self):
+        return self.deal.hands[self.partner_pos]
+
+    def is_partner(self, other):
+        return other is self.deal.hands[self.partner_pos]
+
+    @property
+    def card_tags(self):
+        order = PLAY_ORDER[self.trump] if self.trump is not None else None
+        return tags(cards_of(self.mask, order) if order else cards_of(self.mask))
+
+    def show_turncard(self, turncard):
+        self.bid_analysis, self.discard = self.bidding.analyze(self, turncard)
+        assert self.discard is not None or self.pos != 3
+
+    def bid(self):
+        return self.bidding.bid(self)
+
+    def set_trump(self, trump):
+        """
+        :param trump: int (suit idx)
+        """
+        self.trump = trump
+        self.mask = self.bid_analysis[trump].mask
+        self.play_analysis = self.playing.analyze(self, trump)
+
+    def play(self, plays, winning):
+        """
+        :return: int (card idx)
+        """
+        card = self.playing.play(self, plays, winning)
+        if not self.mask & CARD_BIT[card]:
+            raise LogicError("Card %s not in hand %s" % (tags([card])[0], self.card_tags))
+        self.mask ^= CARD_BIT[card]
+        return card
+
+###############
+# BitTracking #
+###############
+
+class BitTracking(object):
+    """Counterpart to euchre.PlayTracking, using masks for seen and unseen cards (across
+    all suits), with the highest unseen card in each suit updated incrementally
+    """
+    __slots__ = ('trump', 'unseen', 'seen', 'high')
+
+    def __init__(self, trump):
+        self.trump  = trump
+        self.unseen = ALL_CARDS
+        self.seen   = 0
+        self.high   = [high_card(EFF_SUIT_MASK[trump][s], trump) for s in range(4)]
+
+    def card_seen(self, card):
+        bit = CARD_BIT[card]
+        self.unseen ^= bit
+        self.seen |= bit
+        suit_idx = EFF_SUIT[self.trump][card]
+        if self.high[suit_idx] == card:
+            unseen = self.unseen & EFF_SUIT_MASK[self.trump][suit_idx]
+            self.high[suit_idx] = high_card(unseen, self.trump) if unseen else None
+
+    def high_card(self, suit_idx):
+        """
+        :return: card idx for highest unseen card in (effective) suit, or None
+        """
+        return self.high[suit_idx]
+
+    @property
+    def high_cards(self):
+        """Return list of high cards remaining (unseen), indexed by suit number (value of
+        None for a suit indicates all cards have been seen)
+
+        Note: this is the tracking structure itself (not a copy), do not modify!
+        """
+        return self.high
+
+    def is_boss(self, card):
+        """
+        :return: bool (True if card is the highest unseen card in its suit)
+        """
+        return self.high[EFF_SUIT[self.trump][card]] == card
+
+    def unseen_count(self, suit_idx):
+        """
+        :return: int (number of unseen cards in suit, including cards in hands)
+        """
+        return (self.unseen & EFF_SUIT_MASK[self.trump][suit_idx]).bit_count()
+
+    def trump_out(self, held = 0):
+        """
+        :param held: int (number of trump held by caller, e.g. own hand)
+        :return: int (number of trump still out, other than those held)
+        """
+        return (self.unseen & TRUMP_MASK[self.trump]).bit_count() - held
+
+###########
+# BitDeal #
+###########
+
+class BitDeal(object):
+    """Counterpart to euchre.Deal (same interface to Game, same stats output)
+
+    Note that `deck`, `bury`, `turncard`, `discard`, and cards within `plays` and
+    `tricks` are card idx values; `contract` is a SUITS entry (as for Deal), and
+    `trump` is the corresponding suit idx
+    """
+    __slots__ = ('game', 'match', 'dealer', 'deck', 'hands', 'bury', 'turncard',
+                 'discard', 'bids', 'contract', 'trump', 'caller', 'defender',
+                 'play_alone', 'dfnd_alone', 'plays', 'tricks', 'score', 'winner',
+                 'tracking', 'stats', 'replay')
+
+    profiler = None  # stats.PhaseStats (see euchre.set_profiling)
+
+    def __init__(self, game, replay_deal = None):
+        self.game       = game
+        self.match      = game.match
+        self.dealer     = game.curdealer
+        self.deck       = None
+        self.hands      = None
+        self.bury       = None
+        self.turncard   = None
+        self.discard    = None
+
+        self.bids       = None
+        self.contract   = None
+        self.trump      = None
+        self.caller     = None
+        self.defender   = None
+        self.play_alone = False
+        self.dfnd_alone = False
+        self.plays      = None
+        self.tricks     = None
+        self.score      = [0, 0]
+        self.winner     = None
+        self.tracking   = None
+        self.stats      = None
+
+        if replay_deal:
+            self.deck   = replay_deal.deck
+            self.replay = replay_deal.replay + 1
+        else:
+            self.replay = 0
+
+    @property
+    def dealno(self):
+        assert self.game.curdeal == self
+        return self.game.ndeals
+
+    def play(self):
+        """
+        :return: void
+        """
+        if self.game.winner:
+            raise RuntimeError("Cannot deal when game is already over (winner: %s)" %
+                               (self.game.winner['name']))
+        prof = self.profiler
+        if prof:
+            prof.begin()
+        if not self.replay:
+            self.shuffle()
+            if prof:
+                prof.lap('shuffle')
+        self.deal()
+        if prof:
+            prof.lap('deal')
+
+        bid = self.bid()
+        if prof:
+            prof.lap('bid')
+        if bid is not None:
+            self.playtricks()
+            if prof:
+                prof.lap('playtricks')
+            self.tabulate()
+        else:
+            self.compute_stats()
+            if prof:
+                prof.lap('compute_stats')
+        if prof:
+            prof.end()
+
+    def shuffle(self, force = False):
+        """Note: same consumption of the random module as Deal.shuffle
+        """
+        if self.deck and not force:
+            raise LogicError("Cannot shuffle if deck is already shuffled")
+        self.deck = random.sample(CARD_IDXS, k=NCARDS)
+
+    def deal(self, force = False):
+        if self.hands and not force:
+            raise LogicError("Cannot deal when hands have been dealt")
+        if not self.deck:
+            raise LogicError("Deck must be shuffled in order to deal")
+        if not self.dealer:
+            raise LogicError("Dealer must be set in order to deal")
+
+        deck = self.deck
+        dealer_idx = self.dealer['idx']
+        self.hands = [None] * 4
+        for seat in SEATS:
+            pos = (seat['idx'] - dealer_idx - 1) % 4
+            cardno = seat['idx'] * 5
+            self.hands[pos] = BitHand(self, seat, pos, mask_of(deck[cardno:cardno+5]))
+
+        self.bury = deck[20:]
+        self.turncard = self.bury.pop()
+        for hand in self.hands:
+            hand.show_turncard(self.turncard)
+        self.bids = []
+
+    def bid(self):
+        """
+        :return: suit idx (trump) or None (meaning passed deal)
+        """
+        dealer_hand = self.hands[3]
+        if dealer_hand.discard is None:
+            raise RuntimeError("Dealer hand analysis must select best discard")
+
+        turn_idx = BASE_SUIT[self.turncard]
+        bidder = self.hands[0]
+        while len(self.bids) < 8:
+            bid = bidder.bid()
+            self.bids.append(bid)
+            if bid is not None:
+                nbids = len(self.bids)
+                if nbids <= 4:
+                    if bid != turn_idx:
+                        raise RuntimeError("Illegal bid, %s does not match turncard %s" %
+                                           (SUITS[bid]['name'], tags([self.turncard])[0]))
+                    self.bury.append(dealer_hand.discard)
+                elif bid == turn_idx:
+                    raise RuntimeError("Illegal bid, %s must be different than turncard %s" %
+                                       (SUITS[bid]['name'], tags([self.turncard])[0]))
+                break
+            elif len(self.bids) == 4:
+                self.bury.append(self.turncard)
+            bidder = self.hands[bidder.next_pos]
+
+        if bid is not None:
+            self.caller   = bidder
+            self.contract = SUITS[bid]
+            self.trump    = bid
+            self.plays    = []
+            self.tricks   = []
+            for hand in self.hands:
+                hand.set_trump(bid)
+            self.tracking = BitTracking(bid)
+        return bid
+
+    @property
+    def is_next_call(self):
+        # note: turncard suit is relative to trump here (same as Deal.is_nextsuit)
+        return self.trump == EFF_SUIT[self.trump][self.turncard] ^ 0x03 and len(self.bids) == 5
+
+    def cmpcards(self, lead, winning, played):
+        """Same semantics as Deal.cmpcards (but for card idx values)
+        """
+        strength = STRENGTH[self.trump][lead]
+        return strength[played] - strength[winning]
+
+    def playtricks(self):
+        hands = self.hands
+        tracking = self.tracking
+        player = hands[0]
+        trick_strength = STRENGTH[self.trump]
+        while len(self.tricks) < 5:
+            plays   = []
+            cards   = []
+            winning = (None, None)
+            while len(plays) < 4:
+                card = player.play(plays, winning)
+                cards.append(card)
+                plays.append((player, card))
+                tracking.card_seen(card)
+                if winning[1] is None:
+                    strength = trick_strength[card]
+                    winning = (player, card)
+                elif strength[card] > strength[winning[1]]:
+                    winning = (player, card)
+                player = hands[player.next_pos]
+
+            winning_hand = winning[0]
+            self.plays += plays
+            self.tricks.append((winning_hand, cards))
+            self.score[winning_hand.team_idx] += 1
+            player = winning_hand
+
+    def tabulate(self):
+        team_points  = [0, 0]
+        caller_idx   = self.caller.team_idx
+        defender_idx = caller_idx ^ 0x01
+        tricks_made  = self.score[caller_idx]
+
+        if tricks_made >= 3:
+            self.winner = TEAMS[caller_idx]
+            team_points[caller_idx] += 1
+            if tricks_made == 5:
+                team_points[caller_idx] += 1
+        else:
+            self.winner = TEAMS[defender_idx]
+            team_points[defender_idx] += 2
+
+        prof = self.profiler
+        if prof:
+            prof.lap('tabulate')
+        self.compute_stats()
+        if prof:
+            prof.lap('compute_stats')
+        self.game.update_score(team_points)
+        if prof:
+            prof.lap('score')
+
+    def compute_stats(self):
+        """Same stats dict as Deal.compute_stats
+        """
+        deal_seat = self.dealer['idx']
+        turncard = self.turncard
+        if self.caller:
+            tru_idx = self.trump
+            if EFF_LEVEL[tru_idx][turncard] == left['level']:
+                turn_level = right['level']
+                turn_idx   = BASE_SUIT[turncard]
+            else:
+                turn_level = EFF_LEVEL[tru_idx][turncard]
+                turn_idx   = EFF_SUIT[tru_idx][turncard]
+            suit_bid   = 0 if tru_idx == turn_idx else \
+                         (1 if tru_idx == turn_idx ^ 0x03 else 2)
+            caller_idx = self.caller.team_idx
+            tricks     = self.score[caller_idx]
+            points     = -2 if tricks < 3 else \
+                         (1 if tricks < 5 else \
+                          (4 if self.play_alone else 2))
+
+            self.stats = {'deal_seat': deal_seat,
+                          'turncard' : turn_level,
+                          'call_pos' : len(self.bids) - 1,
+                          'call_seat': self.caller.seat['idx'],
+                          'call_suit': suit_bid,
+                          'tricks'   : tricks,
+                          'points'   : points}
+        else:
+            self.stats = {'deal_seat': deal_seat,
+                          'turncard' : BASE_LEVEL[turncard],
+                          'call_pos' : None,
+                          'call_seat': deal_seat,
+                          'call_suit': None}
+        self.game.update_stats(self.stats)
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Playing strategy for the bit engine, equivalent to the playing module (see playing.py
+for commentary on the individual rules, which is not repeated here)
+
+Note that choices among multiple candidate cards (random or otherwise) are made from
+lists in the same order as the corresponding lists in the playing module, so that the
+random module is consumed identically
+"""
+
+import random
+
+from core import ace, left, LogicError
+from bitcards import (NSUITS, RIGHT, LEFT, CARD_BIT, RANK, EFF_LEVEL, EFF_SUIT,
+                      EFF_SUIT_MASK, TRUMP_MASK, PLAY_ORDER, cards_of, high_card, low_card)
+from playing import Strategy
+
+ACE_RANK = ace['idx']
+
+# ace of trump, right and ace, and top three trumps, by trump idx
+ACE        = tuple(ACE_RANK * NSUITS + s for s in range(NSUITS))
+RIGHT_ACE  = tuple(CARD_BIT[RIGHT[s]] | CARD_BIT[ACE[s]] for s in range(NSUITS))
+TOP_TRUMPS = tuple(RIGHT_ACE[s] | CARD_BIT[LEFT[s]] for s in range(NSUITS))
+
+class BitPlayAnalysis(object):
+    """Analysis for a hand (mask) and specified trump suit (idx)
+    """
+    __slots__ = ('mask', 'trump', 'strategy')
+
+    def __init__(self, mask, trump):
+        self.mask     = mask
+        self.trump    = trump
+        self.strategy = []  # list of Strategy enum values
+
+    def suitmask(self, suit_idx):
+        return self.mask & EFF_SUIT_MASK[self.trump][suit_idx]
+
+    def suitcards(self, suit_idx):
+        """
+        :return: list of cards in suit (ascending level)
+        """
+        return cards_of(self.mask & EFF_SUIT_MASK[self.trump][suit_idx], PLAY_ORDER[self.trump])
+
+    @property
+    def cards(self):
+        return cards_of(self.mask, PLAY_ORDER[self.trump])
+
+    def play_card(self, card):
+        self.mask ^= CARD_BIT[card]
+        return card
+
+def analyze(hand, trump):
+    """Allocate and initialize play analysis structure based on trump
+    """
+    return BitPlayAnalysis(hand.mask, trump)
+
+class _Decision(object):
+    """Context for a single play decision (shared across the rules in a ruleset)
+    """
+    __slots__ = ('hand', 'deal', 'analysis', 'plays', 'winning', 'trick_no', 'play_pos',
+                 'tru', 'level', 'trump_mask', 'ncards', 'lead_idx', 'winning_card',
+                 'lead_trumped', '_singletons')
+
+    def __init__(self, hand, plays, winning):
+        deal = hand.deal
+        analysis = hand.play_analysis
+        self.hand       = hand
+        self.deal       = deal
+        self.analysis   = analysis
+        self.plays      = plays
+        self.winning    = winning
+        self.trick_no   = len(deal.tricks) + 1
+        self.play_pos   = len(plays)
+        self.tru        = tru = deal.trump
+        self.level      = EFF_LEVEL[tru]
+        self.trump_mask = analysis.mask & TRUMP_MASK[tru]
+        self.ncards     = analysis.mask.bit_count()
+        if plays:
+            lead_card = plays[0][1]
+            self.lead_idx     = EFF_SUIT[tru][lead_card]
+            self.winning_card = winning[1]
+            self.lead_trumped = self.lead_idx != tru and EFF_SUIT[tru][winning[1]] == tru
+        self._singletons = None
+
+    @property
+    def singletons(self):
+        """Singleton (non-trump) cards, in suit order--note, new list for each decision
+        """
+        if self._singletons is None:
+            tru = self.tru
+            mask = self.analysis.mask
+            self._singletons = []
+            for s in range(4):
+                suitmask = mask & EFF_SUIT_MASK[tru][s]
+                if s != tru and suitmask and not suitmask & (suitmask - 1):
+                    self._singletons.append(suitmask.bit_length() - 1)
+        return self._singletons
+
+    def has_bower(self):
+        return bool(self.trump_mask) and \
+            self.level[high_card(self.trump_mask, self.tru)] >= left['level']
+
+    def off_aces(self):
+        tru = self.tru
+        mask = self.analysis.mask
+        aces = []
+        for s in range(4):
+            suitmask = mask & EFF_SUIT_MASK[tru][s]
+            if suitmask and s != tru:
+                top = high_card(suitmask, tru)
+                if RANK[top] == ACE_RANK:
+                    aces.append(top)
+        return aces
+
+    def non_trump_low(self):
+        """Lowest level non-trump card (ties broken by suit order)
+        """
+        level = self.level
+        cards = cards_of(self.analysis.mask & ~TRUMP_MASK[self.tru], PLAY_ORDER[self.tru])
+        return min(cards, key=lambda c: level[c])
+
+#################
+# Lead Card Plays #
+#################
+
+def lead_last_card(d):
+    if d.ncards == 1:
+        return d.analysis.mask.bit_length() - 1
+
+def next_call_lead(d):
+    # see playing.next_call_lead--the case of a low top trump cannot fire when holding
+    # a bower, so is not ported
+    if d.deal.is_next_call and d.trump_mask:
+        if not d.has_bower():
+            d.analysis.strategy.append(Strategy.PRESERVE_TRUMP)
+            return low_card(d.trump_mask, d.tru)
+        # right and ace as the top two trumps (i.e. without the left)
+        if d.trump_mask & TOP_TRUMPS[d.tru] == RIGHT_ACE[d.tru]:
+            d.analysis.strategy.append(Strategy.DRAW_TRUMP)
+            return ACE[d.tru]
+
+def draw_trump(d):
+    if d.hand is d.deal.caller and d.deal.tracking.unseen & TRUMP_MASK[d.tru] & ~d.trump_mask:
+        play_strategy = d.analysis.strategy
+        ntrump = d.trump_mask.bit_count()
+        if Strategy.DRAW_TRUMP in play_strategy:
+            if ntrump > 2:
+                return high_card(d.trump_mask, d.tru)
+            elif ntrump >= 2:
+                play_strategy.remove(Strategy.DRAW_TRUMP)
+                return high_card(d.trump_mask, d.tru)
+        elif ntrump >= 3:
+            play_strategy.append(Strategy.DRAW_TRUMP)
+            return high_card(d.trump_mask, d.tru)
+
+def lead_off_ace(d):
+    off_aces = d.off_aces()
+    if off_aces:
+        return off_aces[0] if len(off_aces) == 1 else random.choice(off_aces)
+
+def lead_to_partner_call(d):
+    if d.hand.is_partner(d.deal.caller):
+        if d.trump_mask and not d.deal.tracking.seen & TRUMP_MASK[d.tru]:
+            if d.has_bower():
+                return high_card(d.trump_mask, d.tru)
+            elif d.trump_mask.bit_count() > 1:
+                return low_card(d.trump_mask, d.tru)
+            elif d.singletons:
+                singletons = d.singletons
+                return singletons[0] if len(singletons) == 1 else random.choice(singletons)
+
+def lead_to_create_void(d):
+    if d.trump_mask and d.singletons:
+        singletons = d.singletons
+        return singletons[0] if len(singletons) == 1 else random.choice(singletons)
+
+def lead_suit_winner(d):
+    tracking = d.deal.tracking
+    mask = d.analysis.mask
+    my_high_cards = []
+    for s in range(4):
+        if s == d.tru:
+            continue
+        high = tracking.high_card(s)
+        if high is not None and mask & CARD_BIT[high]:
+            my_high_cards.append(high)
+    if my_high_cards:
+        my_high_cards.sort(key=lambda c: d.level[c])
+        return my_high_cards[-1] if d.trick_no <= 3 else my_high_cards[0]
+
+def lead_low_non_trump(d):
+    if d.trump_mask and d.trump_mask.bit_count() < d.ncards:
+        return d.non_trump_low()
+
+def lead_low_from_long_suit(d):
+    # longest suit, ties go to the highest suit idx (stable sort in playing module)
+    best = None
+    bestlen = -1
+    for s in range(4):
+        suitmask = d.analysis.suitmask(s)
+        if suitmask.bit_count() >= bestlen:
+            best = suitmask
+            bestlen = suitmask.bit_count()
+    return low_card(best, d.tru)
+
+##################
+# Follow Card Plays #
+##################
+
+def play_last_card(d):
+    if d.ncards == 1:
+        return d.analysis.mask.bit_length() - 1
+
+def follow_suit_low(d):
+    suitmask = d.analysis.suitmask(d.lead_idx)
+    if suitmask:
+        return low_card(suitmask, d.tru)
+
+def throw_off_to_create_void(d):
+    if d.trump_mask and d.singletons:
+        singletons = d.singletons
+        if len(singletons) == 1:
+            return singletons[0]
+        return min(singletons, key=lambda c: d.level[c])
+
+def throw_off_low(d):
+    if d.trump_mask.bit_count() < d.ncards:
+        return d.non_trump_low()
+
+def play_low_trump(d):
+    if d.trump_mask and d.trump_mask == d.analysis.mask:
+        return low_card(d.trump_mask, d.tru)
+
+def _take_trick(d, suitmask):
+    """Play lowest card that beats the winning card if last to play, otherwise highest
+    (assumes highest card in suitmask beats it), same as the playing module
+    """
+    level = d.level
+    if d.play_pos == 3:
+        win_level = level[d.winning_card]
+        for card in cards_of(suitmask, PLAY_ORDER[d.tru]):
+            if level[card] > win_level:
+                return card
+    return high_card(suitmask, d.tru)
+
+def follow_suit_high(d):
+    suitmask = d.analysis.suitmask(d.lead_idx)
+    if suitmask:
+        if d.lead_trumped:
+            return low_card(suitmask, d.tru)
+        if d.level[high_card(suitmask, d.tru)] > d.level[d.winning_card]:
+            return _take_trick(d, suitmask)
+        return low_card(suitmask, d.tru)
+
+def trump_low(d):
+    trump_mask = d.trump_mask
+    if trump_mask:
+        if d.lead_trumped:
+            if d.level[high_card(trump_mask, d.tru)] > d.level[d.winning_card]:
+                return _take_trick(d, trump_mask)
+        else:
+            low = low_card(trump_mask, d.tru)
+            if trump_mask & (trump_mask - 1) or d.deal.tracking.high_card(d.tru) != low:
+                return low
+
+def play_random_card(d):
+    if d.plays:
+        suitcards = d.analysis.suitcards(d.lead_idx)
+        if suitcards:
+            return random.choice(suitcards)
+    return random.choice(d.analysis.cards)
+
+###################
+# play strategies #
+###################
+
+INIT_LEAD    = (next_call_lead,
+                draw_trump,
+                lead_off_ace,
+                lead_to_partner_call,
+                lead_to_create_void,
+                lead_low_from_long_suit)
+
+SUBSEQ_LEAD  = (lead_last_card,
+                draw_trump,
+                lead_to_partner_call,
+                lead_off_ace,
+                lead_suit_winner,
+                lead_to_create_void,
+                lead_low_non_trump,
+                lead_low_from_long_suit)
+
+PART_WINNING = (play_last_card,
+                follow_suit_low,
+                throw_off_to_create_void,
+                throw_off_low,
+                play_low_trump,
+                play_random_card)
+
+OPP_WINNING  = (play_last_card,
+                follow_suit_high,
+                trump_low,
+                throw_off_to_create_void,
+                throw_off_low,
+                play_random_card)
+
+RULESET_NAMES = {INIT_LEAD:    'init_lead',
+                 SUBSEQ_LEAD:  'subseq_lead',
+                 PART_WINNING: 'part_winning',
+                 OPP_WINNING:  'opp_winning'}
+
+# set to stats.RuleStats instance to enable rule instrumentation
+rule_stats = None
+
+# set to a function taking (hand, plays) and returning a card idx, or None if it does
+# not apply, to override the rules for endgame plays (e.g. tablebase.EndgamePlayer)
+endgame = None
+
+def play(hand, plays, winning):
+    """
+    :param hand: BitHand
+    :param plays: [(player, card), ...]
+    :param winning: (player, card)
+    :return: int (card idx)
+    """
+    if endgame is not None:
+        card = endgame(hand, plays)
+        if card is not None:
+            return hand.play_analysis.play_card(card)
+
+    d = _Decision(hand, plays, winning)
+    if not plays:
+        ruleset = INIT_LEAD if d.trick_no == 1 else SUBSEQ_LEAD
+    else:
+        ruleset = PART_WINNING if hand.is_partner(winning[0]) else OPP_WINNING
+
+    if rule_stats is not None:
+        card = rule_stats.apply(RULESET_NAMES[ruleset], ruleset, d.trick_no, d.play_pos, d)
+        if card is not None:
+            return d.analysis.play_card(card)
+    else:
+        for rule in ruleset:
+            card = rule(d)
+            if card is not None:
+                return d.analysis.play_card(card)
+    raise LogicError("Ruleset did not produce valid result")
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Suit-isomorphism canonicalization, for caching and precomputed tables keyed by hands
+or deal states
+
+Strategically, suits only matter by their role relative to trump (or to the turncard, for
+bidding): trump, next (same color as trump), and the two green suits (other color), where
+the green suits are interchangeable.  Without a reference suit (i.e. a hand on its own),
+any permutation of suits that keeps same-color suits paired is a symmetry.  States that
+differ only by such a permutation have the same canonical key, where the reference suit
+is mapped to suit 0 (and so next to suit 3, see bitcards.LEFT), and the choice among the
+remaining permutations is the one giving the smallest key.
+
+Each canonicalization also returns the SuitMap used, which maps cards, suits, and masks
+in both directions, so that decisions made (or looked up) for the canonical state can be
+turned back into real cards
+
+These keys preserve card identity, which is needed for hands and for bidding (where next
+is distinct from the green suits, and a turncard refers to a specific card).  For the
+play of a deal, a coarser form is possible, where only the order of the remaining cards
+within each suit matters, and all three off suits are interchangeable; the endgame
+tablebase uses that form instead (see tablebase.py).  The solver's transposition table is
+keyed by the actual position, since it only holds positions from a single deal, and a
+canonical key would cost more per node than the search it saves
+"""
+
+import sys
+import time
+from itertools import combinations
+
+from core import log, HEADLESS_LEVEL
+from bitcards import NCARDS, NSUITS, SUIT_MASK, RANK, BASE_SUIT, CARD_BIT, card_idx, suit_idx
+
+# next suit (same color) for each suit, see bitcards.LEFT
+NEXT = tuple(s ^ 0x03 for s in range(NSUITS))
+
+class SuitMap(object):
+    """Permutation of suits (real -> canonical), and its inverse
+    """
+    __slots__ = ('perm', 'inverse', '_shifts', '_inv_shifts')
+
+    def __init__(self, perm):
+        """
+        :param perm: tuple (canonical suit idx, indexed by real suit idx)
+        """
+        self.perm    = tuple(perm)
+        self.inverse = tuple(self.perm.index(s) for s in range(NSUITS))
+        self._shifts     = tuple((SUIT_MASK[s], self.perm[s] - s) for s in range(NSUITS))
+        self._inv_shifts = tuple((SUIT_MASK[s], self.inverse[s] - s) for s in range(NSUITS))
+
+    def suit(self, suit):
+        return self.perm[suit]
+
+    def real_suit(self, suit):
+        return self.inverse[suit]
+
+    def card(self, card):
+        return card & ~0x03 | self.perm[card & 0x03]
+
+    def real_card(self, card):
+        return card & ~0x03 | self.inverse[card & 0x03]
+
+    def mask(self, mask):
+        """
+        :param mask: int (real cards)
+        :return: int (canonical cards)
+        """
+        return _apply(mask, self._shifts)
+
+    def real_mask(self, mask):
+        """
+        :param mask: int (canonical cards)
+        :return: int (real cards)
+        """
+        return _apply(mask, self._inv_shifts)
+
+def _apply(mask, shifts):
+    """Move the bits for each suit to the mapped suit (card idx is rank * 4 + suit, so
+    this is a shift by the difference in suit idx)
+    """
+    out = 0
+    for suitmask, shift in shifts:
+        bits = mask & suitmask
+        out |= bits << shift if shift >= 0 else bits >> -shift
+    return out
+
+def _build_maps():
+    """
+    :return: list of SuitMap (all permutations keeping same-color suits paired)
+    """
+    maps = []
+    for first in range(NSUITS):
+        # `first` maps to suit 0 (so its next suit maps to 3), and the other color pair
+        # maps to suits 1 and 2, in either order
+        others = [s for s in range(NSUITS) if s not in (first, NEXT[first])]
+        for green in (others, others[::-1]):
+            perm = [0] * NSUITS
+            perm[first], perm[NEXT[first]] = 0, 3
+            perm[green[0]], perm[green[1]] = 1, 2
+            maps.append(SuitMap(perm))
+    return maps
+
+# all suit maps, and the maps for which the specified suit is the reference (i.e. maps to
+# suit 0), indexed by real suit
+SUIT_MAPS = tuple(_build_maps())
+REF_MAPS  = tuple(tuple(m for m in SUIT_MAPS if m.perm[s] == 0) for s in range(NSUITS))
+
+IDENTITY = SUIT_MAPS[0]
+assert IDENTITY.perm == (0, 1, 2, 3)
+
+#########
+# Hands #
+#########
+
+def canonical_hand(mask):
+    """Canonical form of a hand without a reference suit (all pairing-preserving suit
+    permutations are symmetries)
+
+    :param mask: int (cards in hand)
+    :return: tuple (key, SuitMap)
+    """
+    best = None
+    for suit_map in SUIT_MAPS:
+        key = suit_map.mask(mask)
+        if best is None or key < best[0]:
+            best = (key, suit_map)
+    return best
+
+def canonical_hand_turncard(mask, turncard):
+    """Canonical form of a hand and turncard (the turncard suit maps to suit 0)
+
+    :param mask: int (cards in hand)
+    :param turncard: int (card idx)
+    :return: tuple (key, SuitMap), where the key includes the rank of the turncard
+    """
+    best = None
+    for suit_map in REF_MAPS[BASE_SUIT[turncard]]:
+        key = suit_map.mask(mask) | RANK[turncard] << NCARDS
+        if best is None or key < best[0]:
+            best = (key, suit_map)
+    return best
+
+###############
+# Deal states #
+###############
+
+def canonical_position(trump, hands, leader = 0, trick = ()):
+    """Canonical form of a position in the playing of a deal (trump maps to suit 0)
+
+    :param trump: int (suit idx)
+    :param hands: list of masks, by position
+    :param leader: int (position leading the current trick)
+    :param trick: sequence of card idx (played to the current trick so far)
+    :return: tuple (key, SuitMap)
+    """
+    best = None
+    for suit_map in REF_MAPS[trump]:
+        key = (suit_map.mask(hands[0]) | suit_map.mask(hands[1]) << 24 |
+               suit_map.mask(hands[2]) << 48 | suit_map.mask(hands[3]) << 72 |
+               leader << 96 | len(trick) << 98)
+        for i, card in enumerate(trick):
+            key |= suit_map.card(card) << (100 + i * 5)
+        if best is None or key < best[0]:
+            best = (key, suit_map)
+    return best
+
+def canonical_deal(deal):
+    """Canonical form of the current state of a deal (at a trick boundary): the position
+    if the contract has been set, otherwise the dealt hands and turncard (for bidding)
+
+    :param deal: Deal or BitDeal (dealt)
+    :return: tuple (key, SuitMap)
+    """
+    from solver import hand_mask
+
+    hands = [hand_mask(hand) for hand in deal.hands]
+    if deal.contract is not None:
+        leader = deal.tricks[-1][0].pos if deal.tricks else 0
+        return canonical_position(suit_idx(deal.contract), hands, leader)
+
+    turncard = card_idx(deal.turncard)
+    best = None
+    for suit_map in REF_MAPS[BASE_SUIT[turncard]]:
+        key = (suit_map.mask(hands[0]) | suit_map.mask(hands[1]) << 24 |
+               suit_map.mask(hands[2]) << 48 | suit_map.mask(hands[3]) << 72 |
+               RANK[turncard] << 96)
+        if best is None or key < best[0]:
+            best = (key, suit_map)
+    return best
+
+###########
+# Testing #
+###########
+
+def main(ndeals = 200, seed = None):
+    """Count canonical classes for all hands, and all hands with a turncard (checking the
+    inverse mappings), and check that the double-dummy result for played deals is the
+    same for the canonical position
+    """
+    import random
+    import solver
+    from euchre import Match, engine_args
+
+    log.setLevel(HEADLESS_LEVEL)
+    hands = [sum(CARD_BIT[c] for c in cards) for cards in combinations(range(NCARDS), 5)]
+    start = time.perf_counter()
+    classes = set()
+    for mask in hands:
+        key, suit_map = canonical_hand(mask)
+        assert suit_map.real_mask(key) == mask
+        classes.add(key)
+    elapsed = time.perf_counter() - start
+    print("Hands: %d, canonical: %d (%.1f us/hand)" %
+          (len(hands), len(classes), elapsed / len(hands) * 1e6))
+
+    start = time.perf_counter()
+    classes = set()
+    nturn = 0
+    for mask in hands:
+        for turncard in range(NCARDS):
+            if mask & CARD_BIT[turncard]:
+                continue
+            key, suit_map = canonical_hand_turncard(mask, turncard)
+            assert suit_map.real_mask(key & ((1 << NCARDS) - 1)) == mask
+            assert suit_map.real_card(suit_map.card(turncard)) == turncard
+            classes.add(key)
+            nturn += 1
+    elapsed = time.perf_counter() - start
+    print("Hands with turncard: %d, canonical: %d (%.1f us/hand)" %
+          (nturn, len(classes), elapsed / nturn * 1e6))
+
+    random.seed(seed)
+    match_args, match_kwargs = engine_args('bit', 0)
+    game = Match(*match_args, game_points=sys.maxsize, **match_kwargs).newgame()
+    nsolved = 0
+    for _ in range(ndeals):
+        deal = game.newdeal()
+        deal.play()
+        if deal.contract is None:
+            continue
+        hands, trump = solver.initial_position(deal)
+        key, suit_map = canonical_position(trump, hands)
+        canon_hands = [suit_map.mask(h) for h in hands]
+        tricks = solver.get_solver(trump).solve(hands, 0)
+        canon_tricks = solver.get_solver(0).solve(canon_hands, 0)
+        if tricks != canon_tricks:
+            print("Mismatch for %s: %d vs %d" % (hands, tricks, canon_tricks))
+            return 1
+        nsolved += 1
+    print("Deals: %d, same double-dummy result for canonical position" % (nsolved))
+    return 0
+
+def cli():
+    """Command line interface for main() (click is imported here, rather than at module
+    level, to keep imports fast)
+    """
+    import click
+
+    @click.command(help=main.__doc__)
+    @click.option('--ndeals', '-n', default=200, type=int, help="Number of deals to play")
+    @click.option('--seed',   '-s', default=None, type=int, help="Seed for random module")
+    def main_cmd(**kwargs):
+        sys.exit(main(**kwargs))
+
+    return main_cmd()
+
+if __name__ == '__main__':
+    cli()
@@ -3,9 +3,7 @@
 
 from os import environ
 import os.path
-from socket import gethostname
 import logging
-import logging.handlers
 import random
 
 import utils
@@ -20,10 +18,18 @@ CONFIG_DIR    = 'config'
 CONFIG_FILE   = 'config.yml'
 CONFIG_PATH   = os.path.join(BASE_DIR, CONFIG_DIR, CONFIG_FILE)
 cfg           = utils.Config(CONFIG_PATH)
-
-param         = cfg.config('params')
 env_param     = {'EUCHREDEBUG': 'debug'}
-param.update({v: environ[k] for k, v in env_param.items() if k in environ})
+
+def __getattr__(name):
+    """Load config params (`param`) on first access, so that importing this module does
+    not read the config file
+    """
+    global param
+    if name == 'param':
+        param = cfg.config('params')
+        param.update({v: environ[k] for k, v in env_param.items() if k in environ})
+        return param
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
 
 ###########
 # Logging #
@@ -38,7 +44,45 @@ LOG_FMTR     = logging.Formatter('%(asctime)s %(levelname)s [%(filename)s:%(line
 LOG_FILE_MAX = 25000000
 LOG_FILE_NUM = 50
 
-dflt_hand = logging.handlers.RotatingFileHandler(LOG_PATH, 'a', LOG_FILE_MAX, LOG_FILE_NUM)
+class LogFileHandler(logging.Handler):
+    """Rotating log file handler that defers creating the underlying RotatingFileHandler
+    (and importing logging.handlers, which is slow to import) and opening the log file
+    (creating the log directory, if needed) until the first record is written
+    """
+    def __init__(self, path, max_bytes, backup_count):
+        super().__init__()
+        self.path         = path
+        self.max_bytes    = max_bytes
+        self.backup_count = backup_count
+        self._handler     = None
+
+    @property
+    def handler(self):
+        """
+        :return: logging.handlers.RotatingFileHandler
+        """
+        if not self._handler:
+            import logging.handlers
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._handler = logging.handlers.RotatingFileHandler(self.path, 'a',
+                                                                 self.max_bytes,
+                                                                 self.backup_count)
+            self._handler.setFormatter(self.formatter)
+        return self._handler
+
+    def emit(self, record):
+        self.handler.emit(record)
+
+    def flush(self):
+        if self._handler:
+            self._handler.flush()
+
+    def close(self):
+        if self._handler:
+            self._handler.close()
+        super().close()
+
+dflt_hand = LogFileHandler(LOG_PATH, LOG_FILE_MAX, LOG_FILE_NUM)
 dflt_hand.setLevel(logging.DEBUG)
 dflt_hand.setFormatter(LOG_FMTR)
 
@@ -50,6 +94,65 @@ log = logging.getLogger(LOGGER_NAME)
 log.setLevel(logging.INFO)
 log.addHandler(dflt_hand)
 
+def use_async_log(policy = 'block', maxsize = 10000):
+    """Move file logging (dflt_hand) onto a background writer thread (see
+    utils.AsyncLogHandler for queue policies); the queue is flushed at exit
+
+    :return: utils.AsyncLogHandler
+    """
+    async_hand = utils.AsyncLogHandler(dflt_hand, maxsize, policy)
+    log.removeHandler(dflt_hand)
+    log.addHandler(async_hand)
+    return async_hand
+
+# logger level for headless mode, where INFO and DEBUG log calls are disabled (note that
+# log calls in the simulation hot path use lazy formatting, and expensive arguments are
+# guarded, so disabled calls are close to free)
+HEADLESS_LEVEL = logging.WARNING
+
+class LogSampler(object):
+    """Enable full debug tracing for 1 in every N deals (e.g. in headless mode); deals are
+    selected by count rather than randomly, so that random number sequences (and hence
+    results) are not affected
+    """
+    def __init__(self):
+        self.every = 0  # 0 means no sampling
+        self.level = logging.DEBUG
+        self.count = 0
+
+    def configure(self, every, level = logging.DEBUG):
+        """
+        :param every: int (sample 1 in every N deals, 0 to disable)
+        :param level: logger level for sampled deals
+        """
+        self.every = every or 0
+        self.level = level
+        self.count = 0
+
+    def begin(self):
+        """Call at the start of a deal
+
+        :return: previous logger level if deal is sampled, otherwise None
+        """
+        if not self.every:
+            return None
+        self.count += 1
+        if self.count % self.every:
+            return None
+        prev_level = log.level
+        log.setLevel(self.level)
+        return prev_level
+
+    def end(self, prev_level):
+        """Call at the end of a deal
+
+        :param prev_level: return value from begin()
+        """
+        if prev_level is not None:
+            log.setLevel(prev_level)
+
+log_sampler = LogSampler()
+
 ##############
 # Exceptions #
 ##############
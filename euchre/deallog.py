@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compact binary deal log, with exact replay
+
+Each deal is written as a fixed-size (64-byte) record: match, game and deal numbers,
+the deck permutation (24 card indexes), dealer, bid sequence, dealer discard, flags
+(playing or defending alone, and the position of a lone defender), and the 20 plays (in
+order, with skipped turns recorded as NO_CARD); a log file is a short header followed by
+the records, so it can be memory-mapped as a numpy record array (see open_log)
+
+A recorded deal can be replayed exactly (see replay), using the recorded bids, discard
+and plays in place of the bidding and playing decisions, and stopped at any trick, to
+rebuild the Deal state at that point; the recorded deck can also be re-run with other
+bidding/playing modules, for either engine (see rerun)
+"""
+
+import os
+import sys
+import struct
+
+from core import log, SUITS, SEATS, TEAMS, LogicError, HEADLESS_LEVEL
+from hand import BASE_CARDS
+from bitcards import TAG, card_idx, suit_idx
+import bidding
+import playing
+
+MAGIC      = b'EUCHDLOG'
+VERSION    = 1
+HEADER     = struct.Struct('<8sII')  # magic, version, record size
+RECORD     = struct.Struct('<IHH24sBB8bBB20s')
+BUFFER_LEN = 1 << 20
+
+NO_CARD = 0xff  # for unplayed (or skipped) cards
+NO_BID  = -1    # for passes (and unused bid slots)
+
+# modules that only work with the bit engine (see rerun)
+BIT_MODULES = ('bitbidding', 'bitplaying')
+
+# flags (the position of a lone defender is stored in the bits above DFND_ALONE)
+PLAY_ALONE     = 0x01
+DFND_ALONE     = 0x02
+DFND_POS_SHIFT = 2
+
+def record_dtype():
+    """
+    :return: numpy dtype (matching RECORD layout)
+    """
+    import numpy as np
+    return np.dtype([('match',   '<u4'),
+                     ('game',    '<u2'),
+                     ('deal',    '<u2'),
+                     ('deck',    'u1', 24),
+                     ('dealer',  'u1'),
+                     ('nbids',   'u1'),
+                     ('bids',    'i1', 8),
+                     ('discard', 'u1'),
+                     ('flags',   'u1'),
+                     ('plays',   'u1', 20)])
+
+def pack_deal(imatch, deal):
+    """
+    :param imatch: int (match number)
+    :param deal: Deal (or BitDeal), after play()
+    :return: bytes
+    """
+    bids = [NO_BID if b is None else suit_idx(b) for b in deal.bids]
+    bids += [NO_BID] * (8 - len(bids))
+    plays = bytearray(NO_CARD for _ in range(20))
+    if deal.plays:
+        for i, (hand, card) in enumerate(deal.plays):
+            if card is not None:
+                plays[i] = card_idx(card)
+    flags = PLAY_ALONE if deal.play_alone else 0
+    if deal.dfnd_alone:
+        flags |= DFND_ALONE | deal.defender.pos << DFND_POS_SHIFT
+    return RECORD.pack(imatch, deal.game.gameno, deal.game.ndeals,
+                       bytes(card_idx(c) for c in deal.deck), deal.dealer['idx'],
+                       len(deal.bids), *bids, card_idx(deal.hands[3].discard), flags,
+                       bytes(plays))
+
+def unpack_deal(data):
+    """
+    :param data: bytes (RECORD), or numpy record (see open_log)
+    :return: dict, where `plays` holds a card idx (or None, for a skipped turn) for each
+             play in the deal
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        fields = RECORD.unpack(data)
+        imatch, game, dealno, deck, dealer, nbids = fields[:6]
+        bids = fields[6:14]
+        discard, flags, plays = fields[14:]
+    else:
+        imatch, game, dealno, deck, dealer, nbids, bids, discard, flags, plays = \
+            (data[name] for name in data.dtype.names)
+        deck, bids, plays = deck.tobytes(), bids.tolist(), plays.tobytes()
+    # all 20 plays (including skipped turns) for a played deal, none for a passed deal
+    plays = [None if p == NO_CARD else p for p in plays]
+    if all(p is None for p in plays):
+        plays = []
+    return {'match'  : int(imatch),
+            'game'   : int(game),
+            'deal'   : int(dealno),
+            'deck'   : list(deck),
+            'dealer' : int(dealer),
+            'bids'   : list(bids[:nbids]),
+            'discard': int(discard),
+            'flags'  : int(flags),
+            'plays'  : plays}
+
+##########
+# Writer #
+##########
+
+class DealLogWriter(object):
+    """Appends deal records to a log file (through a large write buffer, so records are
+    written in batches)
+    """
+    def __init__(self, path):
+        """
+        :param path: str (log file, created if needed; otherwise appended to)
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.file = open(path, 'ab', buffering=BUFFER_LEN)
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        else:
+            read_header(path)
+        self.nrecs = 0
+
+    def append(self, imatch, deal):
+        """
+        :param imatch: int (match number)
+        :param deal: Deal (or BitDeal), after play()
+        :return: void
+        """
+        self.file.write(pack_deal(imatch, deal))
+        self.nrecs += 1
+
+    def close(self):
+        """
+        :return: void
+        """
+        self.file.close()
+
+def log_file(path, run_id, shard = 0):
+    """
+    :param path: str (log directory)
+    :return: str (log file for run and shard, same naming as for results store chunks)
+    """
+    return os.path.join(path, "%s-%06d.dlog" % (run_id, shard))
+
+##########
+# Reader #
+##########
+
+def read_header(path):
+    """
+    :return: void (raises ValueError if not a compatible deal log)
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError("Deal log %s is truncated" % (path))
+    magic, version, rec_size = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or rec_size != RECORD.size:
+        raise ValueError("Deal log %s is not compatible (version %d, record size %d)" %
+                         (path, version, rec_size))
+
+def open_log(path):
+    """
+    :return: numpy memmap (records, see record_dtype)
+    """
+    import numpy as np
+    read_header(path)
+    nrecs = (os.path.getsize(path) - HEADER.size) // RECORD.size
+    if nrecs == 0:
+        return np.zeros(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode='r', offset=HEADER.size,
+                     shape=(nrecs,))
+
+def read_deal(path, index):
+    """Read a single record (without mapping the file)
+
+    :param index: int (record number, zero-based)
+    :return: dict (see unpack_deal)
+    """
+    read_header(path)
+    with open(path, 'rb') as f:
+        f.seek(HEADER.size + index * RECORD.size)
+        data = f.read(RECORD.size)
+    if len(data) < RECORD.size:
+        raise IndexError("Deal log %s has no record #%d" % (path, index))
+    return unpack_deal(data)
+
+############
+# Replayer #
+############
+
+class StopReplay(Exception):
+    """Raised (and caught by replay) to stop playing at the requested trick
+    """
+    pass
+
+class RecordedBidding(object):
+    """Stands in for the bidding module (for all seats), making the recorded bids and
+    discard; analysis is delegated to the underlying module
+    """
+    def __init__(self, rec, module = bidding):
+        self.bids    = rec['bids']
+        self.discard = rec['discard']
+        self.module  = module
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def analyze(self, hand, turncard):
+        bid_analysis, discard = self.module.analyze(hand, turncard)
+        if hand.pos == 3 and discard.idx != self.discard:
+            # redo the dealer analysis for the turncard suit, with the recorded discard
+            discard = BASE_CARDS[self.discard]
+            newcards = hand.cards + [turncard]
+            newcards.remove(discard)
+            suit = turncard.suit
+            bid_analysis[suit['idx']] = self.module.BidAnalysis(newcards, suit, turncard,
+                                                                discard)
+        return bid_analysis, discard
+
+    def bid(self, hand):
+        bid = self.bids[len(hand.deal.bids)]
+        return None if bid == NO_BID else SUITS[bid]
+
+class RecordedPlaying(object):
+    """Stands in for the playing module (for all seats), making the recorded plays, and
+    stopping after the specified number of plays (if any)
+    """
+    def __init__(self, rec, stop = None, module = playing):
+        self.plays  = rec['plays']
+        self.stop   = stop
+        self.module = module
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def play(self, hand, plays, winning):
+        nplays = len(hand.deal.plays) + len(plays)
+        if self.stop is not None and nplays >= self.stop:
+            raise StopReplay()
+        idx = self.plays[nplays]
+        if idx is None:
+            return None
+        for card in hand.cards:
+            if card.idx == idx:
+                return hand.play_analysis.play_card(card)
+        raise LogicError("Recorded play %s not in hand %s (%s)" %
+                         (BASE_CARDS[idx].tag, hand.card_tags, hand.seat['name']))
+
+def module_engine(module):
+    """
+    :param module: bidding or playing module
+    :return: str ('bit' for modules that only work with the bit engine, otherwise 'std')
+    """
+    return 'bit' if module.__name__ in BIT_MODULES else 'std'
+
+def new_deal(rec, bidders, players, engine = 'std'):
+    """Set up a deal for the recorded deck and dealer
+
+    :param bidders: bidding module (or stand-in), for all seats
+    :param players: playing module (or stand-in), for all seats
+    :param engine: str ('std' or 'bit', see euchre.engine_args)
+    :return: Deal or BitDeal (not yet dealt)
+    """
+    from euchre import Match, engine_args
+
+    match_args, match_kwargs = engine_args(engine, None)
+    match = Match([bidders] * 4, [players] * 4, game_points=sys.maxsize, **match_kwargs)
+    game = match.newgame()
+    game.curdealer = SEATS[(rec['dealer'] - 1) % 4]  # see Game.nextdealer
+    deal = game.newdeal()
+    if engine == 'bit':
+        deal.deck = list(rec['deck'])
+    else:
+        deal.deck = [BASE_CARDS[idx] for idx in rec['deck']]
+    return deal
+
+def play_deal(deal, flags = 0):
+    """Same as Deal.play, except that the (preset) deck is not shuffled
+
+    :param flags: int (recorded flags, for deals played or defended alone)
+    :return: void
+    """
+    deal.deal()
+    if flags:
+        deal.play_alone = bool(flags & PLAY_ALONE)
+        if flags & DFND_ALONE:
+            deal.dfnd_alone = True
+            deal.defender = deal.hands[flags >> DFND_POS_SHIFT & 0x03]
+    deal.bid()
+    if deal.contract is not None:
+        deal.playtricks()
+        deal.tabulate()
+    else:
+        deal.compute_stats()
+
+def replay(rec, trick = None):
+    """Rebuild the state of a recorded deal
+
+    :param rec: dict (see unpack_deal)
+    :param trick: int (stop after this many tricks, where 0 means after bidding), or
+                  None to replay the entire deal
+    :return: Deal
+    """
+    stop = None if trick is None else trick * 4
+    deal = new_deal(rec, RecordedBidding(rec), RecordedPlaying(rec, stop))
+    try:
+        play_deal(deal, rec['flags'])
+    except StopReplay:
+        pass
+    return deal
+
+def rerun(rec, bidders = bidding, players = playing):
+    """Play the recorded deck (and dealer) with the specified bidding and playing
+    modules (which use the random module, same as for any deal), using the bit engine
+    if either module requires it
+
+    :return: Deal or BitDeal
+    """
+    engines = {module_engine(bidders), module_engine(players)}
+    if len(engines) > 1:
+        raise ValueError("Cannot mix bit engine and standard modules (%s, %s)" %
+                         (bidders.__name__, players.__name__))
+    deal = new_deal(rec, bidders, players, engines.pop())
+    play_deal(deal)
+    return deal
+
+def describe(deal, out = print):
+    """Print the state of a (replayed) deal
+
+    :return: void
+    """
+    out("Dealer: %s, turncard: %s" % (deal.dealer['name'], TAG[card_idx(deal.turncard)]))
+    for hand in deal.hands:
+        out("  %-5s (%d): %s" % (hand.seat['name'], hand.pos, hand.card_tags))
+    out("Bids: %s" % (["pass" if b is None else SUITS[suit_idx(b)]['name'] for b in deal.bids]))
+    if deal.contract is None:
+        out("Deal is passed")
+        return
+    out("Contract: %s, called by %s%s" %
+        (SUITS[suit_idx(deal.contract)]['name'], deal.caller.seat['name'],
+         " (alone)" if deal.play_alone else ''))
+    if deal.dfnd_alone:
+        out("Defended alone by %s" % (deal.defender.seat['name']))
+    for trick_no, (winner, cards) in enumerate(deal.tricks, 1):
+        out("  Trick #%d: %s, won by %s" %
+            (trick_no, [None if c is None else TAG[card_idx(c)] for c in cards],
+             winner.seat['name']))
+    out("Tricks: %s %d, %s %d" %
+        (TEAMS[0]['name'], deal.score[0], TEAMS[1]['name'], deal.score[1]))
+    if deal.stats:
+        out("Stats: %s" % (deal.stats))
+
+########
+# Main #
+########
+
+def cli():
+    """Command line interface (click is imported here, rather than at module level, to
+    keep imports fast)
+    """
+    import importlib
+    import random
+    import click
+
+    @click.group()
+    @click.option('--debug', '-d', is_flag=True, help="Log replayed deals (at INFO level)")
+    def cli_grp(debug):
+        if not debug:
+            log.setLevel(HEADLESS_LEVEL)
+
+    @cli_grp.command()
+    @click.argument('path')
+    @click.argument('index', type=int)
+    @click.option('--trick', '-t', default=None, type=int,
+                  help="Show state after this many tricks (0 = after bidding)")
+    def show(path, index, trick):
+        """Replay a recorded deal (by record number), up to the specified trick
+        """
+        rec = read_deal(path, index)
+        print("Match #%d, game #%d, deal #%d" % (rec['match'] + 1, rec['game'], rec['deal']))
+        describe(replay(rec, trick))
+
+    @cli_grp.command('rerun')
+    @click.argument('path')
+    @click.argument('index', type=int)
+    @click.option('--bidding', 'bidding_mod', default='bidding', help="Bidding module")
+    @click.option('--playing', 'playing_mod', default='playing', help="Playing module")
+    @click.option('--seed',    '-s', default=None, type=int, help="Seed for random module")
+    def rerun_cmd(path, index, bidding_mod, playing_mod, seed):
+        """Re-run a recorded deck with the specified bidding/playing modules
+        """
+        rec = read_deal(path, index)
+        print("Recorded:")
+        describe(replay(rec))
+        random.seed(seed)
+        print("Re-run (%s, %s):" % (bidding_mod, playing_mod))
+        try:
+            deal = rerun(rec, importlib.import_module(bidding_mod),
+                         importlib.import_module(playing_mod))
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        describe(deal)
+
+    return cli_grp()
+
+if __name__ == '__main__':
+    cli()
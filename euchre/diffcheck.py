@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Differential equivalence checker: plays the same deals through a reference engine
+(euchre.Deal, with the bidding and playing modules) and an alternate engine (e.g. the
+bit engine), and compares the deck, bids, discard, every card played, trick winners,
+final score and stats for each deal, reporting the first point of divergence
+
+The engines are run in lockstep, deal by deal, with the random module state restored
+before the alternate engine plays each deal (so a divergence does not cascade into
+every subsequent deal), and the random state after each deal is compared as well, since
+the engines must also consume random numbers identically
+"""
+
+import sys
+import random
+import time
+
+from core import log, HEADLESS_LEVEL
+from euchre import Match, engine_args
+from bitcards import card_idx, suit_idx
+
+SHARD_DEALS_DFLT = 10000
+
+#############
+# Recording #
+#############
+
+def deal_record(deal):
+    """Engine-neutral record of a completed deal
+
+    :return: dict
+    """
+    rec = {'deck'    : [card_idx(c) for c in deal.deck],
+           'dealer'  : deal.dealer['idx'],
+           'turncard': card_idx(deal.turncard),
+           'bids'    : [suit_idx(b) for b in deal.bids],
+           'discard' : card_idx(deal.hands[3].discard),
+           'bury'    : [card_idx(c) for c in deal.bury],
+           'contract': suit_idx(deal.contract),
+           'caller'  : deal.caller.seat['idx'] if deal.caller else None,
+           'plays'   : [],
+           'tricks'  : [],
+           'score'   : list(deal.score),
+           'stats'   : deal.stats}
+    if deal.contract:
+        rec['plays']  = [(h.seat['idx'], card_idx(c)) for h, c in deal.plays]
+        rec['tricks'] = [(h.seat['idx'], [card_idx(c) for c in cards])
+                         for h, cards in deal.tricks]
+    return rec
+
+# fields in order of comparison (i.e. the order in which the deal unfolds)
+FIELDS = ('deck', 'dealer', 'turncard', 'bids', 'discard', 'bury', 'contract', 'caller',
+          'plays', 'tricks', 'score', 'stats')
+
+def first_divergence(ref, alt):
+    """
+    :param ref: dict (see deal_record)
+    :param alt: dict (see deal_record)
+    :return: str (description of first divergence), or None if equivalent
+    """
+    for field in FIELDS:
+        ref_val = ref[field]
+        alt_val = alt[field]
+        if ref_val == alt_val:
+            continue
+        if field in ('bids', 'plays') and len(ref_val) and len(alt_val):
+            for i in range(min(len(ref_val), len(alt_val))):
+                if ref_val[i] != alt_val[i]:
+                    break
+            else:
+                i = min(len(ref_val), len(alt_val))
+            where = "bid #%d" % (i + 1) if field == 'bids' else \
+                    "trick #%d, play #%d" % (i // 4 + 1, i % 4 + 1)
+            return "%s differ at %s: ref %s, alt %s" % \
+                (field, where, ref_val[i] if i < len(ref_val) else None,
+                 alt_val[i] if i < len(alt_val) else None)
+        return "%s differ: ref %s, alt %s" % (field, ref_val, alt_val)
+    return None
+
+############
+# Checking #
+############
+
+def check_shard(shard):
+    """Check a run of deals (runs in a worker process, if sharded)
+
+    :param shard: tuple (shard number, seed, number of deals, ref engine, alt engine)
+    :return: tuple (shard number, number of deals checked, divergence dict or None)
+    """
+    ishard, seed, ndeals, ref_engine, alt_engine = shard
+    log.setLevel(HEADLESS_LEVEL)
+    random.seed(seed)
+    games = []
+    for engine in (ref_engine, alt_engine):
+        match_args, match_kwargs = engine_args(engine, 0)
+        games.append(Match(*match_args, game_points=sys.maxsize, **match_kwargs).newgame())
+    ref_game, alt_game = games
+
+    for ideal in range(ndeals):
+        state = random.getstate()
+        ref_deal = ref_game.newdeal()
+        ref_deal.play()
+        ref_state = random.getstate()
+
+        random.setstate(state)
+        diff = None
+        try:
+            alt_deal = alt_game.newdeal()
+            alt_deal.play()
+        except Exception as e:
+            diff = "alt engine raised %r" % (e)
+        else:
+            diff = first_divergence(deal_record(ref_deal), deal_record(alt_deal))
+            if not diff and random.getstate() != ref_state:
+                diff = "random state differs after deal (different consumption)"
+        if diff:
+            return ishard, ideal + 1, {'shard': ishard, 'seed': seed, 'deal': ideal + 1,
+                                       'diff' : diff}
+        # keep going from the reference state, in case the alt engine consumed differently
+        random.setstate(ref_state)
+    return ishard, ndeals, None
+
+def check(ndeals, seed, ref_engine = 'std', alt_engine = 'bit', workers = None,
+          shard_deals = SHARD_DEALS_DFLT):
+    """Check deals in shards, where shard n is played with seed (seed + n); with
+    workers, shards are checked in parallel, stopping at the first divergence
+
+    :return: tuple (number of deals checked, divergence dict or None, where a
+             divergence is reproduced by the same seed and number of deals with a
+             single shard)
+    """
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    if not workers:
+        shard_deals = ndeals
+    shards = [(ishard, seed + ishard, min(shard_deals, ndeals - start), ref_engine, alt_engine)
+              for ishard, start in enumerate(range(0, ndeals, shard_deals))]
+
+    if not workers:
+        ishard, nchecked, diff = check_shard(shards[0])
+        return nchecked, diff
+
+    import multiprocessing
+
+    nchecked = 0
+    with multiprocessing.Pool(workers) as pool:
+        for ishard, shard_checked, diff in pool.imap_unordered(check_shard, shards):
+            nchecked += shard_checked
+            if diff:
+                pool.terminate()
+                return nchecked, diff
+    return nchecked, None
+
+########
+# Main #
+########
+
+def main(ndeals = 1000, seed = None, ref = 'std', alt = 'bit', workers = None,
+         shard_deals = SHARD_DEALS_DFLT):
+    """Check that the alternate engine plays exactly the same deals as the reference
+    engine (bids, discard, every card played, tricks, score and stats)
+    """
+    start = time.perf_counter()
+    nchecked, diff = check(ndeals, seed, ref, alt, workers, shard_deals)
+    elapsed = time.perf_counter() - start
+    print("Checked %d deals in %.1f secs (%.0f deals/sec)" %
+          (nchecked, elapsed, nchecked / elapsed if elapsed else 0.0))
+    if diff:
+        print("Divergence in deal #%d (seed %d): %s" % (diff['deal'], diff['seed'], diff['diff']))
+        print("Reproduce with: --seed %d --ndeals %d" % (diff['seed'], diff['deal']))
+        return 1
+    print("No divergence (%s vs. %s)" % (ref, alt))
+    return 0
+
+def cli():
+    """Command line interface for main() (click is imported here, rather than at module
+    level, to keep imports fast)
+    """
+    import click
+
+    engines = click.Choice(['std', 'bit'])
+
+    @click.command(help=main.__doc__)
+    @click.option('--ndeals',  '-n', default=1000, type=int, help="Number of deals to check")
+    @click.option('--seed',    '-s', default=None, type=int, help="Seed for random module")
+    @click.option('--ref',     default='std', type=engines, help="Reference engine")
+    @click.option('--alt',     default='bit', type=engines, help="Alternate engine")
+    @click.option('--workers', '-w', default=None, type=int,
+                  help="Number of worker processes (deals are sharded by seed)")
+    @click.option('--shard-deals', default=SHARD_DEALS_DFLT, type=int,
+                  help="Number of deals per shard (with --workers)")
+    def main_cmd(**kwargs):
+        sys.exit(main(**kwargs))
+
+    return main_cmd()
+
+if __name__ == '__main__':
+    cli()
@@ -8,10 +8,12 @@ import logging
 import random
 import types
 import copy
+from collections import deque
 
-from core import log, RANKS, SUITS, CARDS, SEATS, TEAMS, right, LogicError
-from hand import Card, Hand
-from stats import PlayStats, MatchStats
+from core import log, log_sampler, RANKS, SUITS, CARDS, SEATS, TEAMS, right, LogicError
+from hand import BASE_CARDS, TRUMP_CARDS, Hand
+from bitcards import CARD_BIT, EFF_SUIT_MASK, STRENGTH, high_card
+from stats import PlayStats, MatchStats, RuleStats, PhaseStats
 
 ###################
 # Constants, etc. #
@@ -20,6 +22,14 @@ from stats import PlayStats, MatchStats
 MATCH_GAMES_DFLT = 2
 GAME_POINTS_DFLT = 10
 
+def history_buffer(maxlen):
+    """Container for retained games or deals
+
+    :param maxlen: int (number of most recent items to retain), or None for all items
+    :return: list (unbounded) or deque (ring buffer)
+    """
+    return [] if maxlen is None else deque(maxlen=maxlen)
+
 #########
 # Match #
 #########
@@ -30,8 +40,13 @@ class Match(object):
     matchstats = MatchStats()
 
     def __init__(self, bidding, playing, match_games = MATCH_GAMES_DFLT,
-                 game_points = GAME_POINTS_DFLT):
+                 game_points = GAME_POINTS_DFLT, deal_class = None, history = None):
         """
+        :param deal_class: class used to create deals (default is Deal; see bitengine
+                           module for an alternative)
+        :param history: number of most recent games (and deals within each game) to
+                        retain, or None to retain all; stats are accumulated as each deal
+                        completes, so they are not affected by this setting
         """
         # NOTE: for now, bidding/playing are passed in as modules, but later they
         # will be Bidding and Playing (or subclass) objects, instantiated with
@@ -51,11 +66,14 @@ class Match(object):
 
         self.match_games = match_games
         self.game_points = game_points
-        self.games       = []
+        self.deal_class  = deal_class or Deal
+        self.history     = history
+        self.games       = history_buffer(history)
+        self.ngames      = 0
         self.curgame     = None
         self.games_won   = [0, 0]
         self.winner      = None  # team
-        self.teamstats   = None
+        self.teamstats   = [PlayStats(), PlayStats()]
 
     def newgame(self):
         """
@@ -63,7 +81,8 @@ class Match(object):
         """
         self.curgame = Game(self)
         self.games.append(self.curgame)
-        log.info("===== New Game, #%d =====" % (len(self.games)))
+        self.ngames += 1
+        log.info("===== New Game, #%d =====", self.ngames)
         return self.curgame
 
     def update_score(self, team_games):
@@ -75,27 +94,26 @@ class Match(object):
                 self.games_won[idx] += team_games[idx]
                 if self.games_won[idx] >= self.match_games:
                     self.winner = TEAMS[idx]
-                    log.info("%s wins match, games: %d-%d" %
-                             (TEAMS[idx]['name'], self.games_won[idx], self.games_won[idx^0x01]))
+                    log.info("%s wins match, games: %d-%d",
+                             TEAMS[idx]['name'], self.games_won[idx], self.games_won[idx^0x01])
                     self.compute_stats()
                     return
 
         idx = 0 if self.games_won[0] > self.games_won[1] else 1
-        log.info("%s leads match, games: %d-%d" %
-                 (TEAMS[idx]['name'], self.games_won[idx], self.games_won[idx^0x01]))
+        log.info("%s leads match, games: %d-%d",
+                 TEAMS[idx]['name'], self.games_won[idx], self.games_won[idx^0x01])
 
-    def compute_stats(self):
-        """
-        Should roll up deal stats across games:
-          - bid/pass percent by turncard, position, and seat
-          - win percent by turncard, position, seat, and (relative) suit
-          - points ratio by turncard, position, seat, and (relative) suit
+    def update_stats(self, dealstats):
+        """Roll up deal stats across games (called by Game.update_stats as each deal
+        completes)
         """
-        self.teamstats = [PlayStats(), PlayStats()]
-        for game in self.games:
-            self.teamstats[0].rollup(game.teamstats[0])
-            self.teamstats[1].rollup(game.teamstats[1])
+        team_idx = dealstats['call_seat'] & 0x01
+        self.teamstats[team_idx].update(dealstats)
 
+    def compute_stats(self):
+        """Add stats for this match (rolled up across all games, as deals complete) to
+        the aggregate match stats
+        """
         Match.matchstats.update(self)
 
 ########
@@ -110,19 +128,20 @@ class Game(object):
         """
         self.match       = match
         self.game_points = game_points if game_points else match.game_points
-        self.deals       = []
+        self.deals       = history_buffer(match.history)
+        self.ndeals      = 0
         self.curdealer   = None
         self.curdeal     = None
         self.score       = [0, 0]  # points by team
         self.winner      = None  # team
-        self.teamstats   = None
+        self.teamstats   = [PlayStats(), PlayStats()]
 
     @property
     def gameno(self):
         """Only valid for current game within match
         """
         assert self.match.curgame == self
-        return len(self.match.games)
+        return self.match.ngames
 
     def nextdealer(self):
         """
@@ -148,16 +167,18 @@ class Game(object):
         :return: new Deal instance
         """
         self.curdealer = self.nextdealer()
-        self.curdeal = Deal(self)
+        self.curdeal = self.match.deal_class(self)
         self.deals.append(self.curdeal)
+        self.ndeals += 1
         return self.curdeal
 
     def replaydeal(self):
         """
         :return: create clone of current deal to replay bid/tricks
         """
-        self.curdeal = Deal(self, self.curdeal)
+        self.curdeal = self.match.deal_class(self, self.curdeal)
         self.deals.append(self.curdeal)
+        self.ndeals += 1
         return self.curdeal
 
     def update_score(self, team_points):
@@ -169,67 +190,94 @@ class Game(object):
                 self.score[idx] += team_points[idx]
                 if self.score[idx] >= self.game_points:
                     self.winner = TEAMS[idx]
-                    log.info("%s wins game #%d, score: %d-%d" %
-                             (TEAMS[idx]['name'], self.gameno,
-                              self.score[idx], self.score[idx^0x01]))
-                    self.compute_stats()
+                    log.info("%s wins game #%d, score: %d-%d",
+                             TEAMS[idx]['name'], self.gameno,
+                             self.score[idx], self.score[idx^0x01])
                     self.match.update_score([int(bool(pts)) for pts in team_points])
                     return
 
         idx = 0 if self.score[0] > self.score[1] else 1
-        log.info("%s leads game #%d, score: %d-%d" %
-                 (TEAMS[idx]['name'], self.gameno,
-                  self.score[idx], self.score[idx^0x01]))
+        log.info("%s leads game #%d, score: %d-%d",
+                 TEAMS[idx]['name'], self.gameno,
+                 self.score[idx], self.score[idx^0x01])
+
+    def update_stats(self, dealstats):
+        """Fold stats for a completed deal (called by Deal.compute_stats) into the game
+        and match stats, so that deals do not need to be retained
 
-    def compute_stats(self):
-        """
         Should compute the following, across deals:
           - bid/pass percent by turncard, position, and seat
           - win percent by turncard, position, seat, and (relative) suit
           - points ratio by turncard, position, seat, and (relative) suit
         """
-        self.teamstats = [PlayStats(), PlayStats()]
-        for deal in self.deals:
-            team_idx = deal.stats['call_seat'] & 0x01
-            self.teamstats[team_idx].update(deal.stats)
+        team_idx = dealstats['call_seat'] & 0x01
+        self.teamstats[team_idx].update(dealstats)
+        self.match.update_stats(dealstats)
 
 ########
 # Deal #
 ########
 
 class PlayTracking(object):
+    """Tracks seen (played) and unseen cards during the playing of a deal; cards are kept
+    as masks (by effective suit), and the highest unseen card in each suit is updated
+    incrementally, so that updates and queries are O(1) with no allocation
     """
-    """
+    __slots__ = ('deal', 'trump', 'cards', 'unseen', 'seen', 'high')
+
     def __init__(self, deal):
         if not deal.contract:
             raise LogicError("Contract must be set for PlayTracking deal")
 
+        tru_idx     = deal.contract['idx']
         self.deal   = deal
-        self.unseen = [[], [], [], []]
-        self.seen   = [[], [], [], []]
-
-        for c in self.deal.deck:
-            self.unseen[c.suit['idx']].append(c)
-        tru_idx = self.deal.contract['idx']
-        for suitcards in self.unseen:
-            suitcards.sort(key=lambda c: c.efflevel[tru_idx])  # slghtly more efficient than c.level
+        self.trump  = tru_idx
+        self.cards  = TRUMP_CARDS[tru_idx]
+        # card masks (see bitcards module), indexed by (effective) suit
+        self.unseen = list(EFF_SUIT_MASK[tru_idx])
+        self.seen   = [0, 0, 0, 0]
+        # highest unseen card, indexed by suit (updated incrementally)
+        self.high   = [self.cards[high_card(mask, tru_idx)] for mask in self.unseen]
 
     def card_seen(self, card):
         """
         """
         suit_idx = card.suit['idx']
-        self.unseen[suit_idx].remove(card)
-        # not pretty, but oh well...
-        self.seen[suit_idx].append(card)
-        tru_idx = self.deal.contract['idx']
-        self.seen[suit_idx].sort(key=lambda c: c.efflevel[tru_idx])
+        bit = CARD_BIT[card.idx]
+        self.unseen[suit_idx] ^= bit
+        self.seen[suit_idx] |= bit
+        if self.high[suit_idx] is card:
+            unseen = self.unseen[suit_idx]
+            self.high[suit_idx] = self.cards[high_card(unseen, self.trump)] if unseen else None
 
     @property
     def high_cards(self):
         """Return list of high cards remaining (unseen), indexed by suit number (value of
         None for a suit indicates all cards have been seen)
+
+        Note: this is the tracking structure itself (not a copy), do not modify!
+        """
+        return self.high
+
+    def is_boss(self, card):
+        """
+        :param card: Card (bound to trump)
+        :return: bool (True if card is the highest unseen card in its suit)
         """
-        return [s[-1] if s else None for s in self.unseen]
+        return self.high[card.suit['idx']] is card
+
+    def unseen_count(self, suit_idx):
+        """
+        :return: int (number of unseen cards in suit, including cards in hands)
+        """
+        return self.unseen[suit_idx].bit_count()
+
+    def trump_out(self, held = 0):
+        """
+        :param held: int (number of trump held by caller, e.g. own hand)
+        :return: int (number of trump still out, other than those held)
+        """
+        return self.unseen[self.trump].bit_count() - held
 
 class Deal(object):
     """Represents a single shuffle, deal, bidding, and playing of the cards
@@ -237,6 +285,13 @@ class Deal(object):
     Note: our notion of a "deal" is also popularly called a "hand", but we are reserving that
     word to mean the holding of five dealt cards by a player during a deal
     """
+    __slots__ = ('game', 'match', 'dealer', 'deck', 'hands', 'bury', 'turncard', 'discard',
+                 'bids', 'contract', 'caller', 'defender', 'play_alone', 'dfnd_alone',
+                 'plays', 'tricks', 'score', 'winner', 'tracking', 'stats', 'replay',
+                 'prefix')
+
+    profiler = None  # stats.PhaseStats, to time phases of play() (see set_profiling)
+
     def __init__(self, game, replay_deal = None):
         """
         """
@@ -263,14 +318,14 @@ class Deal(object):
         self.stats      = None  # dict (for now)
 
         if replay_deal:
+            # note that the deck only contains unbound cards (see Deal.bid); the prefix
+            # (hands and bid analysis, as originally dealt) is shared by all replays
             self.deck   = replay_deal.deck
-            # don't have to create new Card instances, just reparent to current deal
-            # (kind of ugly, but saves a few cycles)
-            for card in self.deck:
-                card.deal = self
             self.replay = replay_deal.replay + 1
+            self.prefix = replay_deal.prefix
         else:
             self.replay = 0
+            self.prefix = None  # [(seat, pos, cards, (bid_analysis, discard)), ...]
 
     @property
     def dealno(self):
@@ -279,7 +334,7 @@ class Deal(object):
         Note that replays are counted as individual/incremental deals
         """
         assert self.game.curdeal == self
-        return len(self.game.deals)
+        return self.game.ndeals
 
     def play(self):
         """
@@ -288,18 +343,37 @@ class Deal(object):
         if self.game.winner:
             raise RuntimeError("Cannot deal when game is already over (winner: %s)" %
                                (self.game.winner['name']))
-        if not self.replay:
-            self.log_info('header')
-            self.shuffle()
-        self.deal()
-
-        # bidding and playing tricks
-        bid = self.bid()
-        if bid:
-            self.playtricks()
-            self.tabulate()
-        else:
-            self.compute_stats()
+        sampled = log_sampler.begin()
+        prof = self.profiler
+        try:
+            if prof:
+                prof.begin()
+            if not self.replay:
+                self.log_info('header')
+                self.shuffle()
+                if prof:
+                    prof.lap('shuffle')
+            self.deal()
+            if prof:
+                prof.lap('deal')
+
+            # bidding and playing tricks
+            bid = self.bid()
+            if prof:
+                prof.lap('bid')
+            if bid:
+                self.playtricks()
+                if prof:
+                    prof.lap('playtricks')
+                self.tabulate()
+            else:
+                self.compute_stats()
+                if prof:
+                    prof.lap('compute_stats')
+            if prof:
+                prof.end()
+        finally:
+            log_sampler.end(sampled)
 
     def shuffle(self, force = False):
         """
@@ -307,7 +381,7 @@ class Deal(object):
         """
         if self.deck and not force:
             raise LogicError("Cannot shuffle if deck is already shuffled")
-        self.deck = [Card(c, self) for c in random.sample(CARDS, k=len(CARDS))]
+        self.deck = random.sample(BASE_CARDS, k=len(BASE_CARDS))
 
     def deal(self, force = False):
         """
@@ -320,6 +394,15 @@ class Deal(object):
         if not self.dealer:
             raise LogicError("Dealer must be set in order to deal")
 
+        if self.prefix:
+            # replay, so we only have to rebuild the hands (which are modified in playing)
+            self.hands = [Hand(self, *hand_prefix) for hand_prefix in self.prefix]
+            self.bury = self.deck[len(self.hands) * 5:]
+            self.turncard = self.bury.pop()
+            self.log_info('hands')
+            self.bids = []
+            return
+
         cardno  = 0
         self.hands = []
         for seat in SEATS:
@@ -334,6 +417,8 @@ class Deal(object):
         self.turncard = self.bury.pop()
         for hand in self.hands:
             hand.show_turncard(self.turncard)
+        self.prefix = [(h.seat, h.pos, self.deck[h.seat['idx'] * 5:h.seat['idx'] * 5 + 5],
+                        (h.bid_analysis, h.discard)) for h in self.hands]
 
         self.log_info('hands')
         self.bids = []
@@ -346,7 +431,7 @@ class Deal(object):
         if not dealer_hand.discard:
             raise RuntimeError("Dealer hand analysis must select best discard")
 
-        log.info("Bidding for deal #%d begins" % (self.dealno))
+        log.info("Bidding for deal #%d begins", self.dealno)
         bidder = self.hands[0]
         while len(self.bids) < 8:
             bid = bidder.bid()
@@ -360,26 +445,26 @@ class Deal(object):
                         raise RuntimeError("Illegal bid, %s does not match turncard %s" %
                                            (bid['name'], self.turncard.tag))
                     self.bury.append(dealer_hand.discard)
-                    log.info("  %s orders up %s" % (bidder.seat['name'], self.turncard.tag))
+                    log.info("  %s orders up %s", bidder.seat['name'], self.turncard.tag)
                 elif len(self.bids) == 4:
                     if bid != self.turncard.suit:
                         raise RuntimeError("Illegal bid, %s does not match turncard %s" %
                                            (bid['name'], self.turncard.tag))
                     assert bidder == dealer_hand
                     self.bury.append(bidder.discard)
-                    log.info("  %s (dealer) picks up %s" % (bidder.seat['name'], self.turncard.tag))
+                    log.info("  %s (dealer) picks up %s", bidder.seat['name'], self.turncard.tag)
                 else:
                     if bid == self.turncard.suit:
                         raise RuntimeError("Illegal bid, %s must be different than turncard %s" %
                                            (bid['name'], self.turncard.tag))
-                    log.info("  %s calls %s" % (bidder.seat['name'], bid['name']))
+                    log.info("  %s calls %s", bidder.seat['name'], bid['name'])
                 break
             elif len(self.bids) == 4:
                 assert bidder == dealer_hand
                 self.bury.append(self.turncard)
-                log.info("  %s passes, turns down %s" % (bidder.seat['name'], self.turncard.tag))
+                log.info("  %s passes, turns down %s", bidder.seat['name'], self.turncard.tag)
             else:
-                log.info("  %s passes" % (bidder.seat['name']))
+                log.info("  %s passes", bidder.seat['name'])
             bidder = bidder.next
 
         if bid:
@@ -387,9 +472,13 @@ class Deal(object):
             self.contract = bid
             self.plays    = []  # [(player_hand, card), ...]
             self.tricks   = []  # [(winner_hand, [cards]), ...]
-            log.info("%s is trump, called by %s" %
-                     (bid['name'].capitalize(), TEAMS[bidder.team_idx]['tag']))
+            log.info("%s is trump, called by %s",
+                     bid['name'].capitalize(), TEAMS[bidder.team_idx]['tag'])
 
+            # switch to trump-bound cards (hand cards are bound in set_trump); the deck
+            # stays unbound, for replays
+            self.turncard = self.turncard.bind(bid)
+            self.bury     = [c.bind(bid) for c in self.bury]
             for hand in self.hands:
                 hand.set_trump(self.contract)
             if len(self.bids) <= 4 and dealer_hand.discard in dealer_hand.cards:
@@ -439,29 +528,21 @@ class Deal(object):
         :param played: Card last played
         :return: int (negative if played loses, positive if played wins)
         """
-        ret = None
-        trump_winning = winning.suit == self.contract
-        trump_played  = played.suit == self.contract
-        followed_suit = played.suit == lead.suit
-        if trump_winning:
-            ret = played.level - winning.level if trump_played else -played.level
-        elif trump_played:
-            ret = played.level
-        else:
-            ret = played.level - winning.level if followed_suit else -played.level
-        return ret
+        strength = STRENGTH[self.contract['idx']][lead.idx]
+        return strength[played.idx] - strength[winning.idx]
 
     def playtricks(self):
         """
         :return: score [E/W tricks, N/S tricks]
         """
         player  = self.hands[0]
+        trick_strength = STRENGTH[self.contract['idx']]  # see cmpcards()
         while len(self.tricks) < 5:
             plays    = []            # [(player_hand, card), ...]
             cards    = []            # [cards]
             winning  = (None, None)  # (player_hand, card)
             trick_no = len(self.tricks) + 1
-            log.info("Trick #%d:" % (trick_no))
+            log.info("Trick #%d:", trick_no)
             while len(plays) < 4:
                 note = ''
                 winning_card = winning[1]  # just for semantic readability
@@ -473,16 +554,17 @@ class Deal(object):
                     if not winning_card:
                         winning = (player, card)
                         note = ' (currently winning)'
+                        strength = trick_strength[card.idx]
                     else:
-                        if self.cmpcards(cards[0], winning_card, card) > 0:
+                        if strength[card.idx] > strength[winning_card.idx]:
                             winning = (player, card)
                             note = ' (currently winning)'
                     if len(plays) == 1:
-                        log.info("  %s leads %s%s" % (player.seat['name'], card.tag, note))
+                        log.info("  %s leads %s%s", player.seat['name'], card.tag, note)
                     else:
-                        log.info("  %s plays %s%s" % (player.seat['name'], card.tag, note))
+                        log.info("  %s plays %s%s", player.seat['name'], card.tag, note)
                 else:
-                    log.info("  %s's turn is skipped" % (player.seat['name']))
+                    log.info("  %s's turn is skipped", player.seat['name'])
                 player = player.next
 
             winning_hand = winning[0]  # for readability (as above)
@@ -491,9 +573,9 @@ class Deal(object):
             self.tricks.append((winning_hand, cards))
             team_idx = winning_hand.team_idx
             self.score[team_idx] += 1
-            log.info("%s takes trick #%d with %s (%d-%d)" %
-                     (winning_hand.seat['name'], trick_no, winning_card.tag,
-                      self.score[team_idx], self.score[team_idx ^ 0x01]))
+            log.info("%s takes trick #%d with %s (%d-%d)",
+                     winning_hand.seat['name'], trick_no, winning_card.tag,
+                     self.score[team_idx], self.score[team_idx ^ 0x01])
             player = winning_hand
 
     def tabulate(self):
@@ -510,18 +592,25 @@ class Deal(object):
             team_points[caller_idx] += 1
             if tricks_made == 5:
                 team_points[caller_idx] += 1
-            log.info("%s wins deal #%d (makes contract), tricks: %d-%d, +%d points" %
-                     (TEAMS[caller_idx]['name'], self.dealno, self.score[caller_idx],
-                      self.score[defender_idx], team_points[caller_idx]))
+            log.info("%s wins deal #%d (makes contract), tricks: %d-%d, +%d points",
+                     TEAMS[caller_idx]['name'], self.dealno, self.score[caller_idx],
+                     self.score[defender_idx], team_points[caller_idx])
         else:
             self.winner = TEAMS[defender_idx]
             team_points[defender_idx] += 2
-            log.info("%s wins deal #%d (euchre!), tricks: %d-%d, +%d points" %
-                     (TEAMS[defender_idx]['name'], self.dealno, self.score[defender_idx],
-                      self.score[caller_idx], team_points[defender_idx]))
+            log.info("%s wins deal #%d (euchre!), tricks: %d-%d, +%d points",
+                     TEAMS[defender_idx]['name'], self.dealno, self.score[defender_idx],
+                     self.score[caller_idx], team_points[defender_idx])
 
+        prof = self.profiler
+        if prof:
+            prof.lap('tabulate')
         self.compute_stats()
+        if prof:
+            prof.lap('compute_stats')
         self.game.update_score(team_points)
+        if prof:
+            prof.lap('score')
 
     def compute_stats(self):
         """
@@ -558,107 +647,322 @@ class Deal(object):
                           'call_suit': suit_bid,
                           'tricks'   : tricks,
                           'points'   : points}
-            log.debug("Deal stats: %s" % (self.stats))
+            log.debug("Deal stats: %s", self.stats)
         else:
             self.stats = {'deal_seat': deal_seat,
                           'turncard' : self.turncard.level,
                           'call_pos' : None,
                           'call_seat': deal_seat,  # for computing stats
                           'call_suit': None}
+        self.game.update_stats(self.stats)
 
     def log_info(self, *what):
         """
         :return: void
         """
+        if not log.isEnabledFor(logging.INFO):
+            return
+
         if not what or 'header' in what:
-            log.info("Deal #%d, dealer is %s" % (self.dealno, self.dealer['name']))
+            log.info("Deal #%d, dealer is %s", self.dealno, self.dealer['name'])
 
         if not what or 'caller' in what:
-            log.info("  Caller: %s" % (self.caller.seat['name']))
+            log.info("  Caller: %s", self.caller.seat['name'])
 
         if not what or 'contract' in what:
-            log.info("  Trump: %s" % (self.contract['name']))
+            log.info("  Trump: %s", self.contract['name'])
 
         if not what or 'hands' in what:
-            log.info("  %s hands:" % ("Bidding" if not self.contract else "Playing"))
+            log.info("  %s hands:", "Bidding" if not self.contract else "Playing")
             for hand in self.hands:
-                log.info("    %-5s (%d): %s" %
-                      (hand.seat['name'], hand.pos, [c.tag for c in hand.cards]))
+                log.info("    %-5s (%d): %s",
+                      hand.seat['name'], hand.pos, [c.tag for c in hand.cards])
             if not self.contract and (not self.bids or len(self.bids) < 4):
-                log.info("  Turncard: %s" % (self.turncard.tag))
-            log.info("  Buried: %s" % ([c.tag for c in self.bury]))
+                log.info("  Turncard: %s", self.turncard.tag)
+            log.info("  Buried: %s", [c.tag for c in self.bury])
 
 ###########
 # Testing #
 ###########
 
-import click
 import bidding
 import playing
 
-from core import param, dflt_hand, dbg_hand
+import core
+from core import dflt_hand, dbg_hand, HEADLESS_LEVEL, use_async_log
 import utils
 
 MAX_DEALS = 1000000
 
-@click.command()
-@click.option('--matches', '-m', default=1,    type=int, help="Number of matches to play")
-@click.option('--ndeals',  '-n', default=None, type=int, help="Max number of deals")
-@click.option('--debug',   '-d', default=0,    type=int, help="Debug level (0-2)")
-@click.option('--seed',    '-s', default=None, type=int, help="Seed for random module")
-def test(matches, ndeals, debug, seed):
-    """Play one or more complete matches, print out aggregate stats across matches
+def set_logging(debug, headless = False, sample = 0, async_log = None):
+    """Set logging level for the specified debug level (0-2); in headless mode, INFO and
+    DEBUG logging is disabled, except for 1 in every `sample` deals (if specified), which
+    are logged at the debug level (or DEBUG, if debug level is 0)
+
+    :param async_log: queue policy ('block' or 'drop') for writing the log file from a
+                      background thread, or None to write synchronously
     """
-    ndeals = ndeals or MAX_DEALS
-    debug = debug or int(param.get('debug') or 0)
+    level = utils.TRACE if debug > 1 else logging.DEBUG
     if debug > 0:
-        log.setLevel(utils.TRACE if debug > 1 else logging.DEBUG)
-        dflt_hand.setLevel(utils.TRACE if debug > 1 else logging.DEBUG)
-    random.seed(seed)
-
-    for imatch in range(matches):
-        match = Match(bidding, playing)
-        game = match.newgame()
-        while ndeals > 0:
-            deal = game.newdeal()
-            deal.play()
-            #print(deal.stats)
-            ndeals -= 1
-
-            if game.winner:
-                idx = game.winner['idx']
-                print("%s wins game #%d, score: %d-%d" %
-                      (game.winner['name'], game.gameno,
-                       game.score[idx], game.score[idx^0x01]))
-
-                if match.winner:
-                    idx = match.winner['idx']
-                    print("  %s wins match #%d, games: %d-%d" %
-                          (match.winner['name'], imatch + 1,
-                           match.games_won[idx], match.games_won[idx^0x01]))
-                    break
-
-                game = match.newgame()
-                continue
-
-        if not match.winner:
-            print("Score for match #%d: %s %d, %s %d" %
-                  (imatch + 1,
-                   TEAMS[0]['name'], match.games_won[0],
-                   TEAMS[1]['name'], match.games_won[1]))
-            if not game.winner:
-                print("Score for game #%d: %s %d, %s %d" %
-                      (game.gameno,
-                       TEAMS[0]['name'], game.score[0],
-                       TEAMS[1]['name'], game.score[1]))
-                game.compute_stats()
-
-            match.compute_stats()
+        log.setLevel(level)
+        dflt_hand.setLevel(level)
+    if headless:
+        log.setLevel(HEADLESS_LEVEL)
+    log_sampler.configure(sample, level)
+    if async_log and not isinstance(log.handlers[0], utils.AsyncLogHandler):
+        use_async_log(async_log)
+
+def set_rule_stats(enable):
+    """Enable (or disable) rule instrumentation for the bidding and playing modules (note
+    that for the bit engine, only playing rules are instrumented, since the bitbidding
+    discard logic is not implemented as a ruleset)
+
+    :return: RuleStats (or None, if disabled)
+    """
+    import bitplaying
+    rule_stats = RuleStats() if enable else None
+    bidding.rule_stats = playing.rule_stats = bitplaying.rule_stats = rule_stats
+    return rule_stats
+
+def set_profiling(enable):
+    """Enable (or disable) phase timing for Deal.play (both engines)
+
+    :return: PhaseStats (or None, if disabled)
+    """
+    import bitengine
+    profiler = PhaseStats() if enable else None
+    Deal.profiler = bitengine.BitDeal.profiler = profiler
+    return profiler
+
+def engine_args(engine, retain = None):
+    """
+    :param engine: 'std' or 'bit'
+    :return: tuple (args, kwargs) for creating Match instances
+    """
+    if engine == 'bit':
+        import bitengine, bitbidding, bitplaying
+        match_args = (bitbidding, bitplaying)
+        match_kwargs = {'deal_class': bitengine.BitDeal}
+    else:
+        match_args = (bidding, playing)
+        match_kwargs = {}
+    match_kwargs['history'] = retain
+    return match_args, match_kwargs
+
+def open_recorders(record, shard = 0):
+    """
+    :param record: tuple (results store directory, deal log directory, run id), where
+                   either directory may be None
+    :param shard: int (distinguishes files written by concurrent shards within a run)
+    :return: list of recorders (see play_match)
+    """
+    results, deal_log, run_id = record
+    recorders = []
+    if results:
+        from results import ResultsWriter
+        recorders.append(ResultsWriter(results, run_id, shard))
+    if deal_log:
+        from deallog import DealLogWriter, log_file
+        recorders.append(DealLogWriter(log_file(deal_log, run_id, shard)))
+    return recorders
+
+def play_match(imatch, match, ndeals, out = print, recorders = ()):
+    """Play match to completion (or until ndeals is exhausted)
+
+    :param imatch: int (zero-based match number, for reporting)
+    :param out: function for reporting results (takes a string)
+    :param recorders: list of recorders (e.g. ResultsWriter), each of which is passed
+                      every completed deal
+    :return: int (remaining ndeals)
+    """
+    game = match.newgame()
+    while ndeals > 0:
+        deal = game.newdeal()
+        deal.play()
+        for recorder in recorders:
+            recorder.append(imatch, deal)
+        #print(deal.stats)
+        ndeals -= 1
+
+        if game.winner:
+            idx = game.winner['idx']
+            out("%s wins game #%d, score: %d-%d" %
+                (game.winner['name'], game.gameno,
+                 game.score[idx], game.score[idx^0x01]))
+
+            if match.winner:
+                idx = match.winner['idx']
+                out("  %s wins match #%d, games: %d-%d" %
+                    (match.winner['name'], imatch + 1,
+                     match.games_won[idx], match.games_won[idx^0x01]))
+                break
+
+            game = match.newgame()
+            continue
+
+    if not match.winner:
+        out("Score for match #%d: %s %d, %s %d" %
+            (imatch + 1,
+             TEAMS[0]['name'], match.games_won[0],
+             TEAMS[1]['name'], match.games_won[1]))
+        if not game.winner:
+            out("Score for game #%d: %s %d, %s %d" %
+                (game.gameno,
+                 TEAMS[0]['name'], game.score[0],
+                 TEAMS[1]['name'], game.score[1]))
+
+        match.compute_stats()
+
+    return ndeals
+
+def play_shard(shard):
+    """Play a shard of matches (runs in a worker process); each match is played with
+    its own seed, so results do not depend on how matches are sharded
+
+    :param shard: tuple (engine, retain, logging args (see set_logging), rule stats flag,
+                  profile flag, recording spec (see open_recorders, or None), list of
+                  (imatch, seed) tuples)
+    :return: tuple (list of output lines, MatchStats, RuleStats or None, PhaseStats or
+             None)
+    """
+    engine, retain, log_args, rule_stats, profile, record, seeds = shard
+    set_logging(*log_args)
+    rule_stats = set_rule_stats(rule_stats)
+    profiler = set_profiling(profile)
+    # files are named by first match in the shard, so they sort in match order
+    recorders = open_recorders(record, seeds[0][0]) if record else ()
+    match_args, match_kwargs = engine_args(engine, retain)
+    lines = []
+    # note that worker processes may be reused across shards
+    Match.matchstats = MatchStats()
+    for imatch, seed in seeds:
+        random.seed(seed)
+        play_match(imatch, Match(*match_args, **match_kwargs), MAX_DEALS, lines.append,
+                   recorders)
+    for recorder in recorders:
+        recorder.close()
+    return lines, Match.matchstats, rule_stats, profiler
+
+def match_seeds(matches, seed):
+    """Per-match seeds, derived from the master seed (so that matches are played the
+    same, whether serially or sharded across any number of workers)
+
+    :param matches: int (number of matches)
+    :param seed: int (master seed, or None)
+    :return: list of (imatch, seed) tuples
+    """
+    seeder = random.Random(seed)
+    return [(imatch, seeder.getrandbits(64)) for imatch in range(matches)]
+
+def play_sharded(matches, seed, engine, retain, log_args, workers, rule_stats = None,
+                 profiler = None, record = None):
+    """Shard matches across a pool of worker processes; per-match seeds are derived
+    from the master seed, so the results (including aggregate stats) are the same for
+    any number of workers
+
+    :param rule_stats: RuleStats (if specified, rule stats from workers are merged in)
+    :param profiler: PhaseStats (if specified, phase timings from workers are merged in)
+    :param record: tuple (see open_recorders), if deals are to be recorded
+    :return: void (output is printed, and stats are merged into Match.matchstats)
+    """
+    import multiprocessing
+
+    seeds = match_seeds(matches, seed)
+    # several (contiguous) shards per worker, for load balancing; results are returned
+    # in shard order, so output is in match order
+    shard_size = max(1, -(-matches // (workers * 4)))
+    shards = [(engine, retain, log_args, bool(rule_stats), bool(profiler), record,
+               seeds[i:i + shard_size])
+              for i in range(0, matches, shard_size)]
+
+    with multiprocessing.Pool(workers) as pool:
+        for lines, matchstats, shard_rule_stats, shard_profiler in \
+            pool.imap(play_shard, shards):
+            Match.matchstats.merge(matchstats)
+            if rule_stats:
+                rule_stats.merge(shard_rule_stats)
+            if profiler:
+                profiler.merge(shard_profiler)
+            for line in lines:
+                print(line)
+
+def test(matches = 1, ndeals = None, debug = 0, seed = None, engine = 'std', retain = None,
+         workers = None, headless = False, sample = 0, async_log = None, rule_stats = False,
+         profile = False, results = None, deal_log = None):
+    """Play one or more complete matches, print out aggregate stats across matches
+    """
+    debug = debug or int(core.param.get('debug') or 0)
+    log_args = (debug, headless, sample, async_log)
+    set_logging(*log_args)
+    rule_stats = set_rule_stats(rule_stats)
+    profiler = set_profiling(profile)
+    record = None
+    if results or deal_log:
+        from results import new_run_id
+        record = (results, deal_log, new_run_id())
+
+    if workers:
+        if ndeals:
+            raise ValueError("ndeals cannot be used with workers")
+        play_sharded(matches, seed, engine, retain, log_args, workers, rule_stats, profiler,
+                     record)
+    else:
+        ndeals = ndeals or MAX_DEALS
+        recorders = open_recorders(record) if record else ()
+        match_args, match_kwargs = engine_args(engine, retain)
+        for imatch, match_seed in match_seeds(matches, seed):
+            random.seed(match_seed)
+            ndeals = play_match(imatch, Match(*match_args, **match_kwargs), ndeals,
+                                recorders=recorders)
+        for recorder in recorders:
+            recorder.close()
 
     matchstats_agg = Match.matchstats.compute_agg()
     for k, v in matchstats_agg.items():
         print("%20s: %s" % (k, v))
+    if rule_stats:
+        rule_stats.report()
+    if profiler:
+        profiler.report()
     return 0
 
+def cli():
+    """Command line interface for test() (click is imported here, rather than at module
+    level, to keep imports fast)
+    """
+    import click
+
+    @click.command(help=test.__doc__)
+    @click.option('--matches', '-m', default=1,    type=int, help="Number of matches to play")
+    @click.option('--ndeals',  '-n', default=None, type=int, help="Max number of deals")
+    @click.option('--debug',   '-d', default=0,    type=int, help="Debug level (0-2)")
+    @click.option('--seed',    '-s', default=None, type=int,
+                  help="Master seed (each match is seeded from it, with or without workers)")
+    @click.option('--engine',  '-e', default='std', type=click.Choice(['std', 'bit']),
+                  help="Deal engine (bit engine is faster, with the same results)")
+    @click.option('--retain',  '-r', default=None, type=int,
+                  help="Number of most recent games/deals to retain (default: all)")
+    @click.option('--workers', '-w', default=None, type=int,
+                  help="Number of worker processes")
+    @click.option('--headless', is_flag=True, help="Disable INFO and DEBUG logging")
+    @click.option('--sample',  default=0,    type=int,
+                  help="Log 1 in every N deals at debug level (e.g. with --headless)")
+    @click.option('--async-log', default=None, type=click.Choice(['block', 'drop']),
+                  help="Write log file from a background thread (policy if queue is full)")
+    @click.option('--rule-stats', is_flag=True,
+                  help="Report hits and timing for bidding/playing rules at the end")
+    @click.option('--profile', is_flag=True,
+                  help="Report time spent in each phase of a deal at the end")
+    @click.option('--results', default=None,
+                  help="Directory of results store, to record every deal (see results.py)")
+    @click.option('--deal-log', default=None,
+                  help="Directory for binary deal logs, to record every deal (see deallog.py)")
+    def test_cmd(**kwargs):
+        if kwargs['workers'] and kwargs['ndeals']:
+            raise click.UsageError("--ndeals cannot be used with --workers")
+        return test(**kwargs)
+
+    return test_cmd()
+
 if __name__ == '__main__':
-    test()
+    cli()
@@ -1,46 +1,49 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from core import log, TEAMS, SUITS, ALLRANKS, ace, king, queen, jack, right, left
+from core import log, TEAMS, SUITS, CARDS, ALLRANKS, ace, king, queen, jack, right, left
+from bitcards import EFF_LEVEL, EFF_SUIT
+
+#########################
+# Trump-relative tables #
+#########################
+
+# effective level and suit of each card, indexed by [trump idx][card idx]; these are
+# computed once (see bitcards module for the bower promotion, queen/king demotion, and
+# off-ace adjustment rules), and used to initialize the trump-bound cards below
+EFFLEVEL = EFF_LEVEL
+EFFSUIT  = tuple(tuple(SUITS[s] for s in row) for row in EFF_SUIT)
 
 ########
 # Card #
 ########
 
 class Card(object):
-    """Represents an instance of a card that is part of a deal/deck; the "base" card
-    is the underlying immutable identity (i.e. CARDS[n]) that indicates rank, suit,
-    and name, independent of deal status, trump, etc.
+    """Represents a view of a card, either unbound (i.e. before trump is set, where level
+    and suit are the base values) or bound to a specific trump suit (where level and suit
+    are the effective values relative to trump); the "base" card is the underlying
+    immutable identity (i.e. CARDS[n]) that indicates rank, suit, and name
+
+    Note that there is exactly one instance for each card/trump combination (see
+    BASE_CARDS and TRUMP_CARDS below), so no cards are created per deal, and cards can
+    be compared by identity (as long as they are bound to the same trump)
     """
-    def __init__(self, base, deal):
-        self.base = base
-        self.deal = deal
-        # effective level and suit are based on trump suit
-        self.efflevel = [self.base['level']] * 4
-        self.effsuit = [self.base['suit']] * 4
-
-        suit_idx = self.base['suit']['idx']
-        opp_idx = suit_idx ^ 0x3
-        if self.rank == jack:
-            self.efflevel[suit_idx] = right['level']
-            self.efflevel[opp_idx] = left['level']
-            # counter-intuitive: this can look wrong at first glance, but is correct
-            self.effsuit[opp_idx] = SUITS[opp_idx]
-        elif self.rank in (queen, king):
-            # REVISIT: for now, demote queen/king because jack is elevated (the gap
-            # to ace and bowers accentuates strength of those cards), but not sure
-            # this is best formula (could also close up gap one way or the other)--
-            # would be cool to validate this against ML models at some point!!!
-            self.efflevel[suit_idx] -= 1
-            self.efflevel[opp_idx] -= 1
-        elif self.rank == ace:
-            self.efflevel[opp_idx] -= 1
-
-    def __getattr__(self, key):
-        try:
-            return self.base[key]
-        except KeyError:
-            raise AttributeError()
+    __slots__ = ('base', 'idx', 'rank', 'name', 'tag', 'sortkey', 'trump', 'level', 'suit')
+
+    def __init__(self, base, trump = None):
+        self.base    = base
+        self.idx     = base['idx']
+        self.rank    = base['rank']
+        self.name    = base['name']
+        self.tag     = base['tag']
+        self.sortkey = base['sortkey']
+        self.trump   = trump
+        if trump:
+            self.level = EFFLEVEL[trump['idx']][self.idx]
+            self.suit  = EFFSUIT[trump['idx']][self.idx]
+        else:
+            self.level = base['level']
+            self.suit  = base['suit']
 
     def __repr__(self):
         return str(self.base)
@@ -48,19 +51,12 @@ class Card(object):
     def __str__(self):
         return self.base['tag']
 
-    @property
-    def level(self):
-        if self.deal.contract:
-            tru_idx = self.deal.contract['idx']
-            return self.efflevel[tru_idx]
-        return self.base['level']
-
-    @property
-    def suit(self):
-        if self.deal.contract:
-            tru_idx = self.deal.contract['idx']
-            return self.effsuit[tru_idx]
-        return self.base['suit']
+    def bind(self, trump):
+        """
+        :param trump: suit (or None, for unbound card)
+        :return: Card (view of this card for the specified trump)
+        """
+        return TRUMP_CARDS[trump['idx']][self.idx] if trump else BASE_CARDS[self.idx]
 
     def is_left(self):
         """Keep as method rather than property to show trump-dependent
@@ -69,6 +65,9 @@ class Card(object):
         """
         return self.level == left['level']
 
+BASE_CARDS  = [Card(c) for c in CARDS]
+TRUMP_CARDS = [[Card(c, s) for c in CARDS] for s in SUITS]
+
 ########
 # Hand #
 ########
@@ -95,7 +94,14 @@ class Hand(object):
           * Update game stats/analysis (at seat level)
           * Revisit: should this really be seat/player[?]-level notifications?
     """
-    def __init__(self, deal, seat, pos, cards):
+    __slots__ = ('deal', 'seat', 'pos', 'next_pos', 'partner_pos', 'prev_pos', 'cards',
+                 'bidding', 'playing', 'bid_analysis', 'play_analysis', 'trump', 'discard')
+
+    def __init__(self, deal, seat, pos, cards, analysis = None):
+        """
+        :param analysis: tuple (bid_analysis, discard) from a previous deal of the same
+                         cards (i.e. a replay), in which case show_turncard() is skipped
+        """
         self.deal          = deal
         self.seat          = seat
         self.pos           = pos
@@ -112,7 +118,11 @@ class Hand(object):
 
         # the following are set in set_trump()
         self.trump         = None  
-        self.discard       = None  # dealer only
+        self.discard       = None  # dealer only (note, initially set by show_turncard)
+
+        if analysis:
+            # bid analysis is not modified after it is computed, so it can be shared
+            self.bid_analysis, self.discard = analysis
 
     #+-------+
     #| Teams |
@@ -178,15 +188,19 @@ class Hand(object):
         tru_idx = trump['idx']
         self.trump = trump
         # TODO: dissociate the following from bid_analysis!!!
-        self.cards = self.bid_analysis[tru_idx].cards.copy()
+        self.cards = [c.bind(trump) for c in self.bid_analysis[tru_idx].cards]
         self.cards.sort(key=lambda c: c.suit['idx'] * len(ALLRANKS) + c.level)
+        if self.discard:
+            self.discard = self.discard.bind(trump)
         self.play_analysis = self.playing.analyze(self, trump)
 
     def play(self, plays, winning):
         """
-        :return: Card
+        :return: Card (or None, if the turn is skipped)
         """
         card = self.playing.play(self, plays, winning)
+        if card is None:
+            return None  # turn is skipped (partner playing alone)
         if card not in self.cards:
             raise LogicError("Card %s not in hand %s" % (card['tag'], self.card_tags))
         self.cards.remove(card)
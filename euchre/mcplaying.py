@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Monte Carlo (determinization) playing strategy, with the same interface as the
+playing module, usable with either engine
+
+For each play decision, layouts of the hidden cards (i.e. the other three hands) are
+sampled consistent with what the player has seen: cards already played, suits that
+other players have shown out of, and the turncard (which is in the dealer's hand if
+picked up, and out of play if turned down), see sampler.py.  Each legal card is then evaluated against
+each layout, either by double-dummy solving (see solver.py) or by random playouts, and
+the card with the best average result (tricks for the player's team) is played.
+
+The number of layouts per decision, time budget per decision, evaluation method, and
+number of worker processes for evaluating layouts are set by configure(); since the
+module itself is passed to Match as the playing strategy, these settings apply to all
+seats using it.  The random module is not used (layouts and playouts are drawn from a
+separate generator), so the shuffling and bidding for seeded runs are not affected by
+whether this strategy is playing.
+
+Note that deals played alone are not supported (bidding does not currently go alone)
+"""
+
+import sys
+import random
+import time
+
+from core import log, HEADLESS_LEVEL, SEATS, LogicError
+from bitcards import (CARD_BIT, EFF_SUIT, EFF_SUIT_MASK, PLAY_ORDER, cards_of, trick_winner,
+                      card_idx, suit_idx)
+from sampler import layout_sampler
+import solver
+
+SAMPLES_DFLT  = 20
+ROLLOUTS_DFLT = 8
+METHODS       = ('solve', 'rollout')
+
+# settings (see configure)
+samples    = SAMPLES_DFLT   # layouts per decision
+time_limit = None           # secs per decision (None for no limit)
+method     = METHODS[0]     # how layouts are evaluated
+rollouts   = ROLLOUTS_DFLT  # random playouts per card and layout (for 'rollout' method)
+likelihood = None           # likelihood model for layouts (see configure)
+tablebase  = None           # endgame tablebase directory (for 'solve' method)
+
+# decisions made, layouts evaluated, and total decision time (secs), across all seats
+totals = {'decisions': 0, 'layouts': 0, 'secs': 0.0}
+
+_random  = random.Random()
+_pool    = None
+_workers = 0
+
+# open tablebases, keyed by directory (per process)
+_tablebases = {}
+
+def configure(samples = SAMPLES_DFLT, time_limit = None, method = METHODS[0],
+              rollouts = ROLLOUTS_DFLT, likelihood = None, tablebase = None, workers = 0,
+              seed = None):
+    """Set (or reset to default) all settings for the strategy
+
+    :param samples: int (number of layouts per decision)
+    :param time_limit: float (secs per decision, where at least one layout is always
+                       evaluated), or None for no limit
+    :param method: 'solve' (double-dummy) or 'rollout' (random playouts)
+    :param rollouts: int (number of random playouts per card and layout)
+    :param likelihood: function taking (hand, plays) and returning per-position card
+                       weights (see LayoutSampler.sample_weighted), or None for layouts
+                       to be uniformly distributed
+    :param tablebase: str (directory of endgame tablebase, see tablebase.py), which is
+                      used in place of solving for the positions that it covers
+    :param workers: int (number of worker processes, or 0 to evaluate layouts in-process)
+    :param seed: int (for generating layouts and playouts)
+    :return: void
+    """
+    global _pool, _workers
+    if method not in METHODS:
+        raise ValueError("Unknown method '%s'" % (method))
+    module = sys.modules[__name__]
+    module.samples    = samples
+    module.time_limit = time_limit
+    module.method     = method
+    module.rollouts   = rollouts
+    module.likelihood = likelihood
+    module.tablebase  = tablebase
+    _random.seed(seed)
+    if workers != _workers:
+        close()
+        if workers:
+            import multiprocessing
+            _pool = multiprocessing.Pool(workers)
+        _workers = workers
+
+def close():
+    """Shut down worker processes (if any)
+
+    :return: void
+    """
+    global _pool, _workers
+    if _pool:
+        _pool.close()
+        _pool.join()
+    _pool = None
+    _workers = 0
+
+############
+# Analysis #
+############
+
+class MCPlayAnalysis(object):
+    """Only the trump suit is needed (all decisions are made from the current state of the
+    deal)
+    """
+    __slots__ = ('trump',)
+
+    def __init__(self, trump):
+        self.trump = trump
+
+def analyze(hand, trump):
+    """Allocate and initialize play analysis structure based on trump
+    """
+    return MCPlayAnalysis(suit_idx(trump))
+
+##############
+# Evaluation #
+##############
+
+def playout(trump, hands, leader, trick, rng):
+    """Play out the rest of the deal with random (legal) plays
+
+    :param hands: list of masks, by position (not modified)
+    :param trick: list of card idx (played to the current trick so far)
+    :return: int (tricks for team 0, from the current trick on)
+    """
+    effsuit  = EFF_SUIT[trump]
+    suitmask = EFF_SUIT_MASK[trump]
+    hands    = list(hands)
+    trick    = list(trick)
+    tricks   = 0
+    while True:
+        pos = (leader + len(trick)) & 3
+        hand = hands[pos]
+        legal = (hand & suitmask[effsuit[trick[0]]] or hand) if trick else hand
+        card = rng.choice(cards_of(legal))
+        hands[pos] ^= CARD_BIT[card]
+        trick.append(card)
+        if len(trick) == 4:
+            leader = (leader + trick_winner(trump, trick)) & 3
+            tricks += not leader & 0x01
+            trick = []
+            if not hands[leader]:
+                return tricks
+
+def evaluate(task):
+    """Evaluate the legal plays for a position against a set of layouts (runs in a worker
+    process, if configured)
+
+    :param task: tuple (trump, position to play, leader, trick, layouts, method,
+                 rollouts, tablebase directory, seed, deadline), where trick is a tuple
+                 of card idx, and deadline is a time.time() value (or None)
+    :return: tuple (dict of card idx -> total tricks for the position's team, number of
+             layouts evaluated)
+    """
+    trump, pos, leader, trick, layouts, method, rollouts, tb_path, seed, deadline = task
+    rng = random.Random(seed)
+    tb = None
+    if tb_path and method == 'solve':
+        tb = _tablebases.get(tb_path)
+        if tb is None:
+            from tablebase import Tablebase
+            tb = _tablebases[tb_path] = Tablebase(tb_path)
+    sums = {}
+    nlayouts = 0
+    for hands in layouts:
+        if nlayouts and deadline and time.time() > deadline:
+            break
+        ntricks = hands[pos].bit_count()
+        if tb and tb.covers(hands, leader, trick):
+            values = tb.analyze(trump, hands, leader, trick)
+        elif method == 'solve':
+            values = solver.get_solver(trump).analyze(hands, leader, trick)
+        else:
+            values = {}
+            hand = hands[pos]
+            legal = (hand & EFF_SUIT_MASK[trump][EFF_SUIT[trump][trick[0]]] or hand) \
+                if trick else hand
+            for card in cards_of(legal):
+                new_hands = list(hands)
+                new_hands[pos] ^= CARD_BIT[card]
+                new_trick = trick + (card,)
+                value = 0
+                for _ in range(rollouts):
+                    if len(new_trick) == 4:
+                        winner = (leader + trick_winner(trump, new_trick)) & 3
+                        won = int(not winner & 0x01)
+                        value += won + (playout(trump, new_hands, winner, (), rng)
+                                        if new_hands[winner] else 0)
+                    else:
+                        value += playout(trump, new_hands, leader, new_trick, rng)
+                values[card] = value / rollouts
+        for card, value in values.items():
+            if pos & 0x01:
+                value = ntricks - value
+            sums[card] = sums.get(card, 0) + value
+        nlayouts += 1
+    return sums, nlayouts
+
+############
+# Strategy #
+############
+
+def play(hand, plays, winning):
+    """
+    :param hand:
+    :param plays: [(player, card), ...]
+    :param winning: (player, card)
+    :return: Card (or card idx, for the bit engine)
+    """
+    start   = time.perf_counter()
+    trump   = hand.play_analysis.trump
+    pos     = hand.pos
+    trick   = tuple(card_idx(card) for player, card in plays)
+    leader  = plays[0][0].pos if plays else pos
+    own     = solver.hand_mask(hand)
+    follow  = own & EFF_SUIT_MASK[trump][EFF_SUIT[trump][trick[0]]] if trick else 0
+    legal   = cards_of(follow or own, PLAY_ORDER[trump])
+
+    if len(legal) == 1:
+        best = legal[0]
+    else:
+        deadline = time.time() + time_limit if time_limit else None
+        sampler = layout_sampler(hand, plays)
+        weights = likelihood(hand, plays) if likelihood else None
+        if weights:
+            layouts = sampler.sample_weighted(samples, weights, _random)
+        else:
+            layouts = sampler.sample(samples, _random)
+        # layouts are split across workers (if any); note that the layouts (and so the
+        # results, for the solve method) do not depend on the number of workers
+        nchunks = _workers or 1
+        seed = _random.getrandbits(32)
+        tasks = [(trump, pos, leader, trick, layouts[i::nchunks], method, rollouts,
+                  tablebase, seed + i, deadline) for i in range(nchunks)]
+        results = _pool.map(evaluate, tasks) if _pool else [evaluate(tasks[0])]
+        values = {}
+        for card_totals, nlayouts in results:
+            for card, value in card_totals.items():
+                values[card] = values.get(card, 0) + value
+            totals['layouts'] += nlayouts
+        # ties go to the lowest card (first in play order)
+        best = max(legal, key=lambda c: values[c])
+
+    totals['decisions'] += 1
+    totals['secs'] += time.perf_counter() - start
+    if hasattr(hand, 'mask'):
+        return best
+    for card in hand.cards:
+        if card.idx == best:
+            return card
+    raise LogicError("Card %d not in hand %s" % (best, hand.card_tags))
+
+###########
+# Testing #
+###########
+
+def deal_points(deal, team_idx):
+    """
+    :return: int (points scored by the team for the deal, negative if scored against)
+    """
+    points = deal.stats['points']
+    return points if deal.caller.team_idx == team_idx else -points
+
+def main(ndeals = 100, seed = None, engine = 'bit', team = 0, samples = SAMPLES_DFLT,
+         time_limit = None, method = METHODS[0], rollouts = ROLLOUTS_DFLT, tablebase = None,
+         workers = 0):
+    """Play each deal with the rule-based strategy for all seats, and then again (same
+    cards, same bidding) with this strategy for the specified team, and compare the
+    tricks and points made by the team
+    """
+    from euchre import Match, engine_args
+
+    log.setLevel(HEADLESS_LEVEL)
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    random.seed(seed)
+    configure(samples=samples, time_limit=time_limit, method=method, rollouts=rollouts,
+              tablebase=tablebase, workers=workers, seed=seed)
+
+    match_args, match_kwargs = engine_args(engine, 0)
+    bidding_mod, playing_mod = match_args
+    mc_playing = [sys.modules[__name__] if i & 0x01 == team else playing_mod
+                  for i in range(4)]
+    rule_game = Match(*match_args, game_points=sys.maxsize, **match_kwargs).newgame()
+    mc_game = Match([bidding_mod] * 4, mc_playing, game_points=sys.maxsize,
+                    **match_kwargs).newgame()
+
+    nplayed = 0
+    tricks = [0, 0]  # by rule-based, mc
+    points = [0, 0]
+    counts = [0, 0, 0]  # deals by mc tricks relative to rule-based (fewer, same, more)
+    rule_secs = 0.0
+    try:
+        for _ in range(ndeals):
+            # the mc deal is played from the same random state (so the same shuffle and
+            # bidding), and with the same dealer (see Game.nextdealer)
+            deal = rule_game.newdeal()
+            state = random.getstate()
+            start = time.perf_counter()
+            deal.play()
+            rule_secs += time.perf_counter() - start
+            if deal.contract is None:
+                continue
+            end_state = random.getstate()
+
+            random.setstate(state)
+            mc_game.curdealer = SEATS[(SEATS.index(deal.dealer) - 1) % 4]
+            mc_deal = mc_game.newdeal()
+            mc_deal.play()
+            random.setstate(end_state)
+
+            made = (deal.score[team], mc_deal.score[team])
+            tricks[0] += made[0]
+            tricks[1] += made[1]
+            points[0] += deal_points(deal, team)
+            points[1] += deal_points(mc_deal, team)
+            counts[(made[1] > made[0]) - (made[1] < made[0]) + 1] += 1
+            nplayed += 1
+    finally:
+        close()
+
+    if not nplayed:
+        print("No deals played")
+        return 1
+    print("Played %d deals (team %d with %s evaluation, %d layouts per decision)" %
+          (nplayed, team, method, samples))
+    print("  avg tricks: rule-based %.3f, mc %.3f" %
+          (tricks[0] / nplayed, tricks[1] / nplayed))
+    print("  avg points: rule-based %.3f, mc %.3f" %
+          (points[0] / nplayed, points[1] / nplayed))
+    for label, count in zip(("fewer", "same", "more"), counts):
+        print("  mc made %-5s tricks than rule-based: %6d (%.1f%%)" %
+              (label, count, count / nplayed * 100.0))
+    decisions = totals['decisions']
+    if decisions:
+        print("  %d decisions, %.1f ms/decision, %.1f layouts/decision "
+              "(rule-based: %.3f ms/deal)" %
+              (decisions, totals['secs'] / decisions * 1000.0,
+               totals['layouts'] / decisions, rule_secs / ndeals * 1000.0))
+    return 0
+
+def cli():
+    """Command line interface for main() (click is imported here, rather than at module
+    level, to keep imports fast)
+    """
+    import click
+
+    @click.command(help=main.__doc__)
+    @click.option('--ndeals',     '-n', default=100, type=int, help="Number of deals to play")
+    @click.option('--seed',       '-s', default=None, type=int, help="Seed for random module")
+    @click.option('--engine',     '-e', default='bit', type=click.Choice(['std', 'bit']),
+                  help="Deal engine")
+    @click.option('--team',       '-t', default=0, type=click.IntRange(0, 1),
+                  help="Team (idx) to play with this strategy")
+    @click.option('--samples',    '-k', default=SAMPLES_DFLT, type=int,
+                  help="Number of layouts per decision")
+    @click.option('--time-limit', '-l', default=None, type=float,
+                  help="Time budget per decision (secs)")
+    @click.option('--method',     '-m', default=METHODS[0], type=click.Choice(METHODS),
+                  help="Evaluation method for layouts")
+    @click.option('--rollouts',   '-r', default=ROLLOUTS_DFLT, type=int,
+                  help="Random playouts per card and layout (rollout method)")
+    @click.option('--tablebase',  '-b', default=None,
+                  help="Endgame tablebase directory (see tablebase.py)")
+    @click.option('--workers',    '-w', default=0, type=int,
+                  help="Number of worker processes (for evaluating layouts)")
+    def main_cmd(**kwargs):
+        sys.exit(main(**kwargs))
+
+    return main_cmd()
+
+if __name__ == '__main__':
+    cli()
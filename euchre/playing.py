@@ -4,7 +4,7 @@
 import random
 from enum import Enum, auto
 
-from core import log, ALLRANKS, ace, right, left
+from core import log, ALLRANKS, ace, right, left, LogicError
 
 class Strategy(Enum):
     DRAW_TRUMP     = auto()
@@ -16,6 +16,8 @@ class PlayAnalysis(object):
     TODO: need to transition this class into the bidding module, to keep the Hand
     class/module as unopinionated (relative to strategy) as possible!!!
     """
+    __slots__ = ('cards', 'trump', 'suitcards', 'strategy')
+
     def __init__(self, cards, trump):
         self.cards        = cards.copy()
         self.trump        = trump
@@ -27,7 +29,7 @@ class PlayAnalysis(object):
             self.suitcards[suit_idx].append(card)
 
         tru_idx = self.trump['idx']
-        self.suitcards[tru_idx].sort(key=lambda c: c.efflevel[tru_idx])
+        self.suitcards[tru_idx].sort(key=lambda c: c.level)
 
     @property
     def has_bower(self):
@@ -85,360 +87,468 @@ def analyze(hand, trump):
     """
     return PlayAnalysis(hand.cards, trump)
 
-def play(hand, plays, winning):
-    """
-    :param hand:
-    :param plays: [(player, card), ...]
-    :param winning: (player, card)
-    :return: Card
+class PlayContext(object):
+    """Context for a single play decision, shared across the rules in a ruleset; derived
+    facts (singletons, missing trump, high cards) are only computed if a rule asks for
+    them, and then cached for the remaining rules
+
+    Note that the facts about the current trick (lead_idx, winning_card, lead_trumped)
+    are only set when following, since the lead rules do not use them
     """
-    # deal stats
-    deal          = hand.deal
-    trick_no      = len(deal.tricks) + 1
-    play_pos      = len(plays)  # 0 = lead, etc.
-    tru_idx       = deal.contract['idx']
-    trump_seen    = deal.tracking.seen[tru_idx]
-    trump_unseen  = deal.tracking.unseen[tru_idx]
-    if plays:
-        lead_card    = plays[0][1]
-        lead_idx     = lead_card.suit['idx']
-        winning_card = winning[1]
-        lead_trumped = lead_card.suit['idx'] != tru_idx and winning_card.suit['idx'] == tru_idx
-
-    # hand stats
-    analysis     = hand.play_analysis
-    play_strategy = analysis.strategy
-    trump_cards   = analysis.trump_cards
-    off_aces      = analysis.off_aces
-    singletons    = [s[0] for s in analysis.suitcards
-                     if len(s) == 1 and s[0].suit['idx'] != tru_idx]
-    missing_trump = set(trump_unseen).difference(trump_cards)  # note: set!!!
-    my_high_cards = [c for c in deal.tracking.high_cards
-                     if c in analysis.cards and c.suit['idx'] != tru_idx]
-
-    ########################
-    # play selection rules #
-    ########################
-
-    #-----------------#
-    # Lead Card Plays #
-    #-----------------#
-
-    def lead_last_card():
-        """
-        """
-        if len(analysis.cards) == 1:
-            log.debug("Lead last card")
-            return analysis.cards[0]
-
-    def next_call_lead():
-        """Especially if calling with weaker hand...
-
-        * The best first lead on a next call is a small trump, this is especially
-          true if you hold an off-suit Ace. By leading a small trump you stand the
-          best chance of hitting your partner's hand. Remember, the odds are that
-          he will have at least one bower in his hand
-        * Leading the right may not be the best move. Your partner may only have
-          one bower in his hand and you don't want them to clash. When you are
-          holding a right/ace combination it's usually best to lead the ace. If
-          the other bower has been turned down, then it is okay to lead the right.
-        * In a hand where you only hold two small cards in next but no power, try
-          leading an off suit that you think your partner may be able to trump.
-          You may need the trump to make your point.
-        * If your partner calls next and leads a trump, DO NOT lead trump back.
-        """
-        if deal.is_next_call and trump_cards:
-            if not analysis.has_bower:
-                log.debug("No bower, lead small trump")
-                play_strategy.append(Strategy.PRESERVE_TRUMP)
-                return trump_cards[0]
-            elif len(trump_cards) > 1:
-                if trump_cards[-1].rank == right and trump_cards[-2].rank == ace:
-                    log.debug("Lead ace from right-ace")
-                    play_strategy.append(Strategy.DRAW_TRUMP)
-                    return trump_cards[-2]
-                if trump_cards[-1].level < ace['level']:
-                    grn_suitcards = analysis.green_suitcards
-                    if grn_suitcards[0]:
-                        log.debug("Lead from longest green suit")
-                        play_strategy.append(Strategy.PRESERVE_TRUMP)
-                        return grn_suitcards[0][0]
-
-    def draw_trump():
-        """Draw trump if caller (strong hand), or flush out bower
-        """
-        if hand == deal.caller and missing_trump:
-            if Strategy.DRAW_TRUMP in play_strategy:
-                if len(trump_cards) > 2:
-                    log.debug("Continue drawing trump")
-                    return trump_cards[-1]
-                elif len(trump_cards) >= 2:
-                    log.debug("Last round of drawing trump")
-                    play_strategy.remove(Strategy.DRAW_TRUMP)
-                    return trump_cards[-1]
-            elif len(trump_cards) >= 3:
-                play_strategy.append(Strategy.DRAW_TRUMP)
-                log.debug("Draw trump (or flush out bower)")
-                return trump_cards[-1]
+    __slots__ = ('hand', 'deal', 'analysis', 'plays', 'winning', 'trick_no', 'play_pos',
+                 'tru_idx', 'trump_cards', 'lead_idx', 'winning_card', 'lead_trumped',
+                 '_singletons', '_missing_trump', '_my_high_cards')
+
+    def __init__(self, hand, plays, winning):
+        """
+        :param hand:
+        :param plays: [(player, card), ...]
+        :param winning: (player, card)
+        """
+        deal = hand.deal
+        analysis = hand.play_analysis
+        self.hand          = hand
+        self.deal          = deal
+        self.analysis      = analysis
+        self.plays         = plays
+        self.winning       = winning
+        self.trick_no      = len(deal.tricks) + 1
+        self.play_pos      = len(plays)  # 0 = lead, etc.
+        self.tru_idx       = tru_idx = deal.contract['idx']
+        self.trump_cards   = analysis.suitcards[tru_idx]
+        if plays:
+            self.lead_idx     = lead_idx = plays[0][1].suit['idx']
+            self.winning_card = winning[1]
+            self.lead_trumped = lead_idx != tru_idx and winning[1].suit['idx'] == tru_idx
+        self._singletons   = None
+        self._missing_trump = None
+        self._my_high_cards = None
 
-    def lead_off_ace():
-        """Off-ace (short suit, or green if defending?)
+    @property
+    def singletons(self):
         """
-        if off_aces:
-            # TODO: choose more wisely if more than one, or possibly preserve ace to
-            # avoid being trumped!!!
-            if len(off_aces) == 1:
-                log.debug("Lead off-ace")
-                return off_aces[0]
-            else:
-                log.debug("Lead off-ace (random choice)")
-                return random.choice(off_aces)
+        :return: list of cards (non-trump singletons, in suit order)
+        """
+        if self._singletons is None:
+            tru_idx = self.tru_idx
+            self._singletons = [s[0] for s in self.analysis.suitcards
+                                if len(s) == 1 and s[0].suit['idx'] != tru_idx]
+        return self._singletons
 
-    def lead_to_partner_call():
-        """No trump seen with parter as caller
+    @property
+    def missing_trump(self):
         """
-        if hand.is_partner(deal.caller):
-            if trump_cards and not trump_seen:
-                if analysis.has_bower:
-                    log.debug("Lead bower to partner's call")
-                    return trump_cards[-1]
-                elif len(trump_cards) > 1:
-                    log.debug("Lead low trump to partner's call")
-                    return trump_cards[0]
-                elif singletons:
-                    # REVISIT: not sure we should do this, but if so, add some logic for
-                    # choosing if more than one singleton!!!
-                    if len(singletons) == 1:
-                        log.debug("Lead singleton to void suit")
-                        return singletons[0]
-                    else:
-                        log.debug("Lead singleton to void suit (random choice)")
-                        return random.choice(singletons)
-
-    def lead_to_create_void():
-        """If trump in hand, try and void a suit
+        :return: int (number of trump still out, other than in own hand)
         """
-        if trump_cards and singletons:
-            # REVISIT: perhaps only makes sense in earlier rounds (2 and 3), and otherwise
-            # add some logic for choosing if more than one singleton!!!
-            if len(singletons) == 1:
-                log.debug("Lead singleton to void suit")
-                return singletons[0]
-            else:
-                log.debug("Lead singleton to void suit (random for now)")
-                return random.choice(singletons)
+        if self._missing_trump is None:
+            self._missing_trump = self.deal.tracking.trump_out(len(self.trump_cards))
+        return self._missing_trump
 
-    def lead_suit_winner():
-        """Try to lead winner (non-trump)
+    @property
+    def my_high_cards(self):
         """
-        if my_high_cards:
-            my_high_cards.sort(key=lambda c: c.efflevel[tru_idx])
-            log.debug("Try and lead suit winner")
-            # REVISIT: is this the right logic (perhaps makes no sense if preceded by
-            # off-ace rule)???  Should also examine remaining cards in suit!!!
-            return my_high_cards[-1] if trick_no <= 3 else my_high_cards[0]
-
-    def lead_low_non_trump():
-        """If still trump in hand, lead lowest card (non-trump)
+        :return: list of cards (non-trump cards in hand that are the highest unseen in suit)
         """
-        if trump_cards and len(trump_cards) < len(analysis.cards):
-            # NOTE: will always pick the "lowest" suit if multiple cards at min level
-            non_trump_cards = [c for c in analysis.cards if c.suit['idx'] != tru_idx]
-            non_trump_cards.sort(key=lambda c: c.efflevel[tru_idx])
-            log.debug("Lead lowest non-trump")
-            return non_trump_cards[0]
+        if self._my_high_cards is None:
+            tru_idx = self.tru_idx
+            is_boss = self.deal.tracking.is_boss
+            self._my_high_cards = [c for c in self.analysis.cards
+                                   if c.suit['idx'] != tru_idx and is_boss(c)]
+        return self._my_high_cards
 
-    def lead_low_from_long_suit():
-        """Lead low from long suit (favor green if defeending?)
+########################
+# play selection rules #
+########################
 
-        Note: always returns value, can be last in ruleset
-        """
-        suitcards = analysis.suitcards.copy()
-        suitcards.sort(key=lambda s: len(s))
-        # TODO: a little more logic in choosing suit (perhaps avoid trump, if possible)!!!
-        log.debug("Lead low from longest suit")
-        return suitcards[-1][0]
+# Each rule takes a PlayContext, and returns a card (from the hand's play analysis) if
+# the rule applies, otherwise None
 
-    def lead_random_card():
-        """This is a catchall, though we should look at cases where this happens and
-        see if there is a better rule to insert before
+#-----------------#
+# Lead Card Plays #
+#-----------------#
 
-        Note: always returns value, can be last in ruleset
-        """
-        log.debug("Lead random card")
-        return random.choice(analysis.cards)
+def lead_last_card(d):
+    """
+    """
+    if len(d.analysis.cards) == 1:
+        log.debug("Lead last card")
+        return d.analysis.cards[0]
+
+def next_call_lead(d):
+    """Especially if calling with weaker hand...
+
+    * The best first lead on a next call is a small trump, this is especially
+      true if you hold an off-suit Ace. By leading a small trump you stand the
+      best chance of hitting your partner's hand. Remember, the odds are that
+      he will have at least one bower in his hand
+    * Leading the right may not be the best move. Your partner may only have
+      one bower in his hand and you don't want them to clash. When you are
+      holding a right/ace combination it's usually best to lead the ace. If
+      the other bower has been turned down, then it is okay to lead the right.
+    * In a hand where you only hold two small cards in next but no power, try
+      leading an off suit that you think your partner may be able to trump.
+      You may need the trump to make your point.
+    * If your partner calls next and leads a trump, DO NOT lead trump back.
+    """
+    trump_cards = d.trump_cards
+    if d.deal.is_next_call and trump_cards:
+        analysis = d.analysis
+        if not analysis.has_bower:
+            log.debug("No bower, lead small trump")
+            analysis.strategy.append(Strategy.PRESERVE_TRUMP)
+            return trump_cards[0]
+        elif len(trump_cards) > 1:
+            # note that the bowers keep their base rank (jack), so the right is identified
+            # by level
+            if trump_cards[-1].level == right['level'] and trump_cards[-2].rank == ace:
+                log.debug("Lead ace from right-ace")
+                analysis.strategy.append(Strategy.DRAW_TRUMP)
+                return trump_cards[-2]
+            if trump_cards[-1].level < ace['level']:
+                grn_suitcards = analysis.green_suitcards
+                if grn_suitcards[0]:
+                    log.debug("Lead from longest green suit")
+                    analysis.strategy.append(Strategy.PRESERVE_TRUMP)
+                    return grn_suitcards[0][0]
+
+def draw_trump(d):
+    """Draw trump if caller (strong hand), or flush out bower
+    """
+    if d.hand == d.deal.caller and d.missing_trump:
+        trump_cards = d.trump_cards
+        play_strategy = d.analysis.strategy
+        if Strategy.DRAW_TRUMP in play_strategy:
+            if len(trump_cards) > 2:
+                log.debug("Continue drawing trump")
+                return trump_cards[-1]
+            elif len(trump_cards) >= 2:
+                log.debug("Last round of drawing trump")
+                play_strategy.remove(Strategy.DRAW_TRUMP)
+                return trump_cards[-1]
+        elif len(trump_cards) >= 3:
+            play_strategy.append(Strategy.DRAW_TRUMP)
+            log.debug("Draw trump (or flush out bower)")
+            return trump_cards[-1]
 
-    #-------------------#
-    # Follow Card Plays #
-    #-------------------#
+def lead_off_ace(d):
+    """Off-ace (short suit, or green if defending?)
+    """
+    off_aces = d.analysis.off_aces
+    if off_aces:
+        # TODO: choose more wisely if more than one, or possibly preserve ace to
+        # avoid being trumped!!!
+        if len(off_aces) == 1:
+            log.debug("Lead off-ace")
+            return off_aces[0]
+        else:
+            log.debug("Lead off-ace (random choice)")
+            return random.choice(off_aces)
+
+def lead_to_partner_call(d):
+    """No trump seen with parter as caller
+    """
+    if d.hand.is_partner(d.deal.caller):
+        trump_cards = d.trump_cards
+        if trump_cards and not d.deal.tracking.seen[d.tru_idx]:
+            if d.analysis.has_bower:
+                log.debug("Lead bower to partner's call")
+                return trump_cards[-1]
+            elif len(trump_cards) > 1:
+                log.debug("Lead low trump to partner's call")
+                return trump_cards[0]
+            elif d.singletons:
+                # REVISIT: not sure we should do this, but if so, add some logic for
+                # choosing if more than one singleton!!!
+                singletons = d.singletons
+                if len(singletons) == 1:
+                    log.debug("Lead singleton to void suit")
+                    return singletons[0]
+                else:
+                    log.debug("Lead singleton to void suit (random choice)")
+                    return random.choice(singletons)
 
-    def play_last_card():
-        """
-        """
-        if len(analysis.cards) == 1:
-            log.debug("Play last card")
-            return analysis.cards[0]
+def lead_to_create_void(d):
+    """If trump in hand, try and void a suit
+    """
+    if d.trump_cards and d.singletons:
+        # REVISIT: perhaps only makes sense in earlier rounds (2 and 3), and otherwise
+        # add some logic for choosing if more than one singleton!!!
+        singletons = d.singletons
+        if len(singletons) == 1:
+            log.debug("Lead singleton to void suit")
+            return singletons[0]
+        else:
+            log.debug("Lead singleton to void suit (random for now)")
+            return random.choice(singletons)
+
+def lead_suit_winner(d):
+    """Try to lead winner (non-trump)
+    """
+    my_high_cards = d.my_high_cards
+    if my_high_cards:
+        my_high_cards.sort(key=lambda c: c.level)
+        log.debug("Try and lead suit winner")
+        # REVISIT: is this the right logic (perhaps makes no sense if preceded by
+        # off-ace rule)???  Should also examine remaining cards in suit!!!
+        return my_high_cards[-1] if d.trick_no <= 3 else my_high_cards[0]
+
+def _low_non_trump(d):
+    """
+    :return: card (lowest level non-trump card, ties go to the "lowest" suit)
+    """
+    tru_idx = d.tru_idx
+    low = None
+    for card in d.analysis.cards:
+        if card.suit['idx'] != tru_idx and (low is None or card.level < low.level):
+            low = card
+    return low
+
+def lead_low_non_trump(d):
+    """If still trump in hand, lead lowest card (non-trump)
+    """
+    if d.trump_cards and len(d.trump_cards) < len(d.analysis.cards):
+        # NOTE: will always pick the "lowest" suit if multiple cards at min level
+        log.debug("Lead lowest non-trump")
+        return _low_non_trump(d)
 
-    def follow_suit_low():
-        """Follow suit low
-        """
-        if analysis.suitcards[lead_idx]:
-            # REVISIT: are there cases where we want to try and take the lead???
-            log.debug("Follow suit low")
-            return analysis.suitcards[lead_idx][0]
+def lead_low_from_long_suit(d):
+    """Lead low from long suit (favor green if defeending?)
 
-    def throw_off_to_create_void():
-        """Create void (if early in deal)--NOTE: this only matters if we've decided not
-        to trump (e.g. to preserve for later)
-        """
-        if trump_cards and singletons:
-            if len(singletons) == 1:
-                log.debug("Throw off singleton to void suit (lowest)")
-                return singletons[0]
+    Note: always returns value, can be last in ruleset
+    """
+    # longest suit, ties go to the highest suit idx (same as a stable sort by length)
+    # TODO: a little more logic in choosing suit (perhaps avoid trump, if possible)!!!
+    longest = None
+    for suitcards in d.analysis.suitcards:
+        if longest is None or len(suitcards) >= len(longest):
+            longest = suitcards
+    log.debug("Lead low from longest suit")
+    return longest[0]
+
+def lead_random_card(d):
+    """This is a catchall, though we should look at cases where this happens and
+    see if there is a better rule to insert before
+
+    Note: always returns value, can be last in ruleset
+    """
+    log.debug("Lead random card")
+    return random.choice(d.analysis.cards)
+
+#-------------------#
+# Follow Card Plays #
+#-------------------#
+
+def play_last_card(d):
+    """
+    """
+    if len(d.analysis.cards) == 1:
+        log.debug("Play last card")
+        return d.analysis.cards[0]
+
+def follow_suit_low(d):
+    """Follow suit low
+    """
+    suitcards = d.analysis.suitcards[d.lead_idx]
+    if suitcards:
+        # REVISIT: are there cases where we want to try and take the lead???
+        log.debug("Follow suit low")
+        return suitcards[0]
+
+def throw_off_to_create_void(d):
+    """Create void (if early in deal)--NOTE: this only matters if we've decided not
+    to trump (e.g. to preserve for later)
+    """
+    if d.trump_cards and d.singletons:
+        singletons = d.singletons
+        if len(singletons) == 1:
+            log.debug("Throw off singleton to void suit (lowest)")
+            return singletons[0]
+        else:
+            # REVISIT: perhaps only makes sense in earlier rounds (2 and 3), and also
+            # reconsider selection if multiple (currently lowest valued)!!!
+            singletons.sort(key=lambda c: c.level)
+            log.debug("Throw off singleton to void suit (lowest)")
+            return singletons[0]
+
+def throw_off_low(d):
+    """Throw off lowest non-trump card
+    """
+    if len(d.trump_cards) < len(d.analysis.cards):
+        # NOTE: this will always pick the "lowest" suit in case multiple cards at min level
+        log.debug("Throw-off lowest non-trump")
+        return _low_non_trump(d)
+
+def play_low_trump(d):
+    """Play lowest trump (assumes no non-trump remaining)
+    """
+    trump_cards = d.trump_cards
+    if trump_cards and len(trump_cards) == len(d.analysis.cards):
+        # REVISIT: are there cases where we want to play a higher trump???
+        log.debug("Play lowest trump")
+        return trump_cards[0]
+
+def follow_suit_high(d):
+    """Follow suit (high if can lead trick, low otherwise)
+    """
+    suitcards = d.analysis.suitcards[d.lead_idx]
+    if suitcards:
+        if d.lead_trumped:
+            log.debug("Follow suit low")
+            return suitcards[0]
+        win_level = d.winning_card.level
+        if suitcards[-1].level > win_level:
+            # REVISIT: are there cases where we don't want to try and take the trick,
+            # or not play???
+            if d.play_pos == 3:
+                for card in suitcards:
+                    if card.level > win_level:
+                        log.debug("Follow suit, take winner")
+                        return card
             else:
-                # REVISIT: perhaps only makes sense in earlier rounds (2 and 3), and also
-                # reconsider selection if multiple (currently lowest valued)!!!
-                singletons.sort(key=lambda c: c.efflevel[tru_idx])
-                log.debug("Throw off singleton to void suit (lowest)")
-                return singletons[0]
-
-    def throw_off_low():
-        """Throw off lowest non-trump card
-        """
-        if len(trump_cards) < len(analysis.cards):
-            # NOTE: this will always pick the "lowest" suit in case multiple cards at min level
-            non_trump_cards = [c for c in analysis.cards if c.suit['idx'] != tru_idx]
-            non_trump_cards.sort(key=lambda c: c.efflevel[tru_idx])
-            log.debug("Throw-off lowest non-trump")
-            return non_trump_cards[0]
-
-    def play_low_trump():
-        """Play lowest trump (assumes no non-trump remaining)
-        """
-        if trump_cards and len(trump_cards) == len(analysis.cards):
-            # REVISIT: are there cases where we want to play a higher trump???
-            log.debug("Play lowest trump")
-            return trump_cards[0]
+                log.debug("Follow suit high")
+                return suitcards[-1]
 
-    def follow_suit_high():
-        """Follow suit (high if can lead trick, low otherwise)
-        """
-        if analysis.suitcards[lead_idx]:
-            if lead_trumped:
-                log.debug("Follow suit low")
-                return analysis.suitcards[lead_idx][0]
-            if analysis.suitcards[lead_idx][-1].level > winning_card.level:
+        log.debug("Follow suit low")
+        return suitcards[0]
+
+def trump_low(d):
+    """Trump (low) to lead trick
+    """
+    trump_cards = d.trump_cards
+    if trump_cards:
+        if d.lead_trumped:
+            win_level = d.winning_card.level
+            if trump_cards[-1].level > win_level:
                 # REVISIT: are there cases where we don't want to try and take the trick,
                 # or not play???
-                if play_pos == 3:
-                    for card in analysis.suitcards[lead_idx]:
-                        if card.level > winning_card.level:
-                            log.debug("Follow suit, take winner")
+                if d.play_pos == 3:
+                    for card in trump_cards:
+                        if card.level > win_level:
+                            log.debug("Overtrump, take winner")
                             return card
                 else:
-                    log.debug("Follow suit high")
-                    return analysis.suitcards[lead_idx][-1]
+                    log.debug("Overtrump high")
+                    return trump_cards[-1]
+        else:
+            # hold onto highest remaining trump (sure winner later), otherwise try and
+            # take the trick
+            # REVISIT: are there cases where we want to play a higher trump, or other
+            # reasons to throw off (esp. if pos == 1 and partner yet to play)???
+            if len(trump_cards) > 1 or not d.deal.tracking.is_boss(trump_cards[0]):
+                log.debug("Play lowest trump, to lead trick")
+                return trump_cards[0]
 
-            log.debug("Follow suit low")
-            return analysis.suitcards[lead_idx][0]
+def play_random_card(d):
+    """Play random card, but follow suit if possible
 
-    def trump_low():
-        """Trump (low) to lead trick
-        """
-        if trump_cards:
-            if lead_trumped:
-                if trump_cards[-1].level > winning_card.level:
-                    # REVISIT: are there cases where we don't want to try and take the trick,
-                    # or not play???
-                    if play_pos == 3:
-                        for card in trump_cards:
-                            if card.level > winning_card.level:
-                                log.debug("Overtrump, take winner")
-                                return card
-                    else:
-                        log.debug("Overtrump high")
-                        return trump_cards[-1]
-            else:
-                # hold onto highest remaining trump (sure winner later), otherwise try and
-                # take the trick
-                # REVISIT: are there cases where we want to play a higher trump, or other
-                # reasons to throw off (esp. if pos == 1 and partner yet to play)???
-                if len(trump_cards) > 1 or trump_cards[0] not in deal.tracking.high_cards:
-                    log.debug("Play lowest trump, to lead trick")
-                    return trump_cards[0]
-
-    def play_random_card():
-        """Play random card, but follow suit if possible
-
-        Note: always returns value, can be last in ruleset
-        """
-        if plays:
-            lead_card = plays[0][1]
-            suit_idx = lead_card.suit['idx']
-            if analysis.suitcards[suit_idx]:
-                log.debug("Follow suit, random card")
-                return random.choice(analysis.suitcards[suit_idx])
-
-        log.debug("Play random card")
-        return random.choice(analysis.cards)
-
-    ###################
-    # play strategies #
-    ###################
-
-    # Note, these are static for now, but later could be created dynamically based
-    # on game or deal scenario
-    init_lead    = [next_call_lead,
-                    draw_trump,
-                    lead_off_ace,
-                    lead_to_partner_call,
-                    lead_to_create_void,
-                    lead_low_from_long_suit]
-
-    subseq_lead  = [lead_last_card,
-                    draw_trump,
-                    # maybe swap the next two...
-                    lead_to_partner_call,
-                    lead_off_ace,
-                    lead_suit_winner,
-                    lead_to_create_void,
-                    lead_low_non_trump,
-                    lead_low_from_long_suit]
-
-    part_winning = [play_last_card,
-                    follow_suit_low,
-                    throw_off_to_create_void,
-                    throw_off_low,
-                    play_low_trump,
-                    play_random_card]
-
-    opp_winning  = [play_last_card,
-                    follow_suit_high,
-                    trump_low,
-                    throw_off_to_create_void,
-                    throw_off_low,
-                    play_random_card]
-
-    def apply(ruleset):
-        """TODO: move to core (currently replicated across modules)!!!
-        """
-        res = None
+    Note: always returns value, can be last in ruleset
+    """
+    if d.plays:
+        suitcards = d.analysis.suitcards[d.lead_idx]
+        if suitcards:
+            log.debug("Follow suit, random card")
+            return random.choice(suitcards)
+
+    log.debug("Play random card")
+    return random.choice(d.analysis.cards)
+
+###################
+# play strategies #
+###################
+
+# Note, these are static for now, but later could be created dynamically based on game
+# or deal scenario (rulesets are built once, at import time)
+INIT_LEAD    = (next_call_lead,
+                draw_trump,
+                lead_off_ace,
+                lead_to_partner_call,
+                lead_to_create_void,
+                lead_low_from_long_suit)
+
+SUBSEQ_LEAD  = (lead_last_card,
+                draw_trump,
+                # maybe swap the next two...
+                lead_to_partner_call,
+                lead_off_ace,
+                lead_suit_winner,
+                lead_to_create_void,
+                lead_low_non_trump,
+                lead_low_from_long_suit)
+
+PART_WINNING = (play_last_card,
+                follow_suit_low,
+                throw_off_to_create_void,
+                throw_off_low,
+                play_low_trump,
+                play_random_card)
+
+OPP_WINNING  = (play_last_card,
+                follow_suit_high,
+                trump_low,
+                throw_off_to_create_void,
+                throw_off_low,
+                play_random_card)
+
+RULESET_NAMES = {INIT_LEAD:    'init_lead',
+                 SUBSEQ_LEAD:  'subseq_lead',
+                 PART_WINNING: 'part_winning',
+                 OPP_WINNING:  'opp_winning'}
+
+# set to stats.RuleStats instance to enable rule instrumentation
+rule_stats = None
+
+# set to a function taking (hand, plays) and returning a card idx, or None if it does
+# not apply, to override the rules for endgame plays (e.g. tablebase.EndgamePlayer)
+endgame = None
+
+def apply(ruleset, d):
+    """
+    :param ruleset: sequence of rules (see above)
+    :param d: PlayContext
+    :return: Card
+    """
+    if rule_stats is not None:
+        card = rule_stats.apply(RULESET_NAMES[ruleset], ruleset, d.trick_no, d.play_pos, d)
+        if card is not None:
+            return card
+    else:
         for rule in ruleset:
-            res = rule()
-            if res:
-                break
-        if not res:
-            raise LogicError("Ruleset did not produce valid result")
-        return res
+            card = rule(d)
+            if card is not None:
+                return card
+    raise LogicError("Ruleset did not produce valid result")
+
+def play(hand, plays, winning):
+    """
+    :param hand:
+    :param plays: [(player, card), ...]
+    :param winning: (player, card)
+    :return: Card
+    """
+    if endgame is not None:
+        idx = endgame(hand, plays)
+        if idx is not None:
+            analysis = hand.play_analysis
+            for card in analysis.cards:
+                if card.idx == idx:
+                    return analysis.play_card(card)
+            raise LogicError("Endgame play %d not in hand %s" % (idx, hand.card_tags))
+
+    d = PlayContext(hand, plays, winning)
 
     #########################
     # pick ruleset and play #
     #########################
 
     if not plays:
-        ruleset = init_lead if trick_no == 1 else subseq_lead
+        ruleset = INIT_LEAD if d.trick_no == 1 else SUBSEQ_LEAD
     else:
-        cur_winning = hand.is_partner(winning[0])
-        ruleset = part_winning if cur_winning else opp_winning
+        ruleset = PART_WINNING if hand.is_partner(winning[0]) else OPP_WINNING
 
-    return analysis.play_card(apply(ruleset))
+    if rule_stats is None:
+        # same as apply(), without the extra call (this is the common case)
+        for rule in ruleset:
+            card = rule(d)
+            if card is not None:
+                return d.analysis.play_card(card)
+    return d.analysis.play_card(apply(ruleset, d))
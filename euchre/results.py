@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Columnar store of per-deal results, for offline aggregation
+
+A store is a directory of chunk files (.npz, one array per column), which is only ever
+appended to: each writer (i.e. run, or shard within a run) writes its own sequence of
+chunks, named "<run id>-<shard>-<seq>.npz", so concurrent writers never collide, and
+loading the chunks in name order returns deals in the order they were played
+
+Aggregates (e.g. MatchStats, see matchstats) and new breakdowns (see group_by) can then
+be computed from the loaded columns with vectorized operations, rather than by playing
+all of the deals again
+"""
+
+import os
+import sys
+import datetime as dt
+from array import array
+
+import numpy as np
+
+from stats import MatchStats, PlayStats, deal_types
+from bitcards import card_idx, suit_idx
+
+CHUNK_ROWS_DFLT = 100000
+
+# value for missing (or not applicable) entries in integer columns
+NONE = -1
+
+# columns, as (name, array typecode, width), where width > 1 means the column holds
+# a fixed-size vector for each deal (padded with NONE, if applicable)
+COLUMNS = (('match',        'i', 1),  # match number (as played, across shards)
+           ('game',         'h', 1),  # game number (within match)
+           ('deal',         'h', 1),  # deal number (within game)
+           ('dealer',       'b', 1),  # seat
+           ('turncard',     'b', 1),  # card idx
+           ('nbids',        'b', 1),
+           ('bids',         'b', 8),  # suit idx, or NONE for pass
+           ('contract',     'b', 1),  # suit idx
+           ('caller',       'b', 1),  # seat
+           ('alone',        'b', 1),  # bool
+           ('tricks',       'b', 2),  # by team
+           ('points',       'b', 2),  # by team
+           ('game_winner',  'b', 1),  # team, if deal ends the game
+           ('match_winner', 'b', 1),  # team, if deal ends the match
+           # Deal.stats fields (see Deal.compute_stats)
+           ('deal_seat',    'b', 1),
+           ('turn_level',   'b', 1),
+           ('call_pos',     'b', 1),
+           ('call_seat',    'b', 1),
+           ('call_suit',    'b', 1),
+           ('call_tricks',  'b', 1),
+           ('call_points',  'b', 1))
+
+COLUMN_NAMES = tuple(name for name, typecode, width in COLUMNS)
+
+def _none(value):
+    return NONE if value is None else value
+
+def deal_row(imatch, deal):
+    """Engine-neutral row for a completed deal (in COLUMNS order)
+
+    :param imatch: int (match number)
+    :return: tuple
+    """
+    game  = deal.game
+    match = deal.match
+    stats = deal.stats
+    bids  = [_none(suit_idx(b)) for b in deal.bids]
+    bids += [NONE] * (8 - len(bids))
+
+    points = [0, 0]
+    if deal.caller:
+        caller_team = deal.caller.seat['idx'] & 0x01
+        if stats['points'] > 0:
+            points[caller_team] = stats['points']
+        else:
+            points[caller_team ^ 0x01] = -stats['points']
+
+    return (imatch,
+            game.gameno,
+            game.ndeals,
+            deal.dealer['idx'],
+            card_idx(deal.turncard),
+            len(deal.bids),
+            bids,
+            _none(suit_idx(deal.contract)),
+            deal.caller.seat['idx'] if deal.caller else NONE,
+            int(deal.play_alone),
+            deal.score,
+            points,
+            game.winner['idx'] if game.winner else NONE,
+            match.winner['idx'] if match.winner else NONE,
+            stats['deal_seat'],
+            stats['turncard'],
+            _none(stats['call_pos']),
+            stats['call_seat'],
+            _none(stats['call_suit']),
+            stats.get('tricks', NONE),
+            stats.get('points', NONE))
+
+##########
+# Writer #
+##########
+
+def new_run_id():
+    """
+    :return: str (timestamp, same format as for bid_stage1 training data, plus the
+             process id, so that runs started in the same second are distinct)
+    """
+    return "%s_%d" % (dt.datetime.now().strftime('%Y%m%d%H%M%S'), os.getpid())
+
+class ResultsWriter(object):
+    """Buffers deal rows by column (as compact arrays), and writes a chunk file whenever
+    `chunk_rows` deals have been buffered (and on close)
+    """
+    def __init__(self, path, run_id = None, shard = 0, chunk_rows = CHUNK_ROWS_DFLT):
+        """
+        :param path: str (store directory, created if needed)
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path       = path
+        self.run_id     = run_id or new_run_id()
+        self.shard      = shard
+        self.chunk_rows = chunk_rows
+        self.nchunks    = 0
+        self.nrows      = 0  # total rows written (not including buffered)
+        self._reset()
+
+    def _reset(self):
+        self._cols  = [array(typecode) for name, typecode, width in COLUMNS]
+        self._nbuf  = 0
+
+    def append(self, imatch, deal):
+        """
+        :param imatch: int (match number)
+        :param deal: Deal (or BitDeal), after play()
+        :return: void
+        """
+        for col, (name, typecode, width), value in zip(self._cols, COLUMNS,
+                                                       deal_row(imatch, deal)):
+            if width == 1:
+                col.append(value)
+            else:
+                col.extend(value)
+        self._nbuf += 1
+        if self._nbuf >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows as a new chunk (written under a temporary name, and then
+        renamed, so readers never see a partial chunk); an existing chunk is never
+        replaced
+
+        :return: void
+        """
+        if not self._nbuf:
+            return
+        columns = {}
+        for col, (name, typecode, width) in zip(self._cols, COLUMNS):
+            data = np.frombuffer(col, dtype=col.typecode)
+            columns[name] = data.reshape(-1, width) if width > 1 else data
+        filename = "%s-%06d-%06d.npz" % (self.run_id, self.shard, self.nchunks)
+        chunk_path = os.path.join(self.path, filename)
+        if os.path.exists(chunk_path):
+            raise FileExistsError("Chunk '%s' already exists" % (chunk_path))
+        tmp_path = chunk_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, chunk_path)
+        self.nchunks += 1
+        self.nrows += self._nbuf
+        self._reset()
+
+    def close(self):
+        """
+        :return: void
+        """
+        self.flush()
+
+##########
+# Reader #
+##########
+
+def chunk_files(path, run_id = None):
+    """
+    :param run_id: str (if specified, only return chunks for the run)
+    :return: list of chunk paths, in name order
+    """
+    return [os.path.join(path, f) for f in sorted(os.listdir(path))
+            if f.endswith('.npz') and (not run_id or f.startswith(run_id + '-'))]
+
+def load(path, columns = None, run_id = None):
+    """Load (and concatenate) columns from all chunks in the store
+
+    :param columns: list of column names (default: all)
+    :param run_id: str (if specified, only load chunks for the run)
+    :return: dict of numpy arrays, keyed by column name
+    """
+    columns = columns or COLUMN_NAMES
+    for name in columns:
+        if name not in COLUMN_NAMES:
+            raise ValueError("Unknown column '%s'" % (name))
+    parts = {name: [] for name in columns}
+    for chunk in chunk_files(path, run_id):
+        with np.load(chunk) as data:
+            for name in columns:
+                parts[name].append(data[name])
+    result = {}
+    for name, typecode, width in COLUMNS:
+        if name not in parts:
+            continue
+        if parts[name]:
+            result[name] = np.concatenate(parts[name])
+        else:
+            shape = (0, width) if width > 1 else (0,)
+            result[name] = np.zeros(shape, dtype=typecode)
+    return result
+
+###############
+# Aggregation #
+###############
+
+def group_by(cols, by, values = ()):
+    """Vectorized group-by over loaded columns
+
+    :param cols: dict of numpy arrays (see load)
+    :param by: list of (scalar) column names to group by
+    :param values: list of column names to sum (within each group)
+    :return: dict with 'keys' (array of unique key rows, sorted), 'count' (deals per
+             group) and sums for each of `values` (by group)
+    """
+    keys = np.stack([cols[name].astype(np.int64) for name in by], axis=1)
+    uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    result = {'keys': uniq, 'count': np.bincount(inverse, minlength=len(uniq))}
+    for name in values:
+        col = cols[name].astype(np.int64)
+        if col.ndim == 1:
+            result[name] = np.bincount(inverse, weights=col, minlength=len(uniq))
+        else:
+            sums = np.zeros((len(uniq), col.shape[1]), dtype=np.int64)
+            np.add.at(sums, inverse, col)
+            result[name] = sums
+    return result
+
+def playstats(cols):
+    """Recompute PlayStats for each team (where deals are attributed to the calling team,
+    or the dealing team if passed, as for Match.update_stats)
+
+    :param cols: dict of numpy arrays (see load, requires Deal.stats columns)
+    :return: list of PlayStats (by team)
+    """
+    pos    = cols['call_pos'].astype(np.int64)
+    dtype  = deal_types(pos, cols['call_points'].astype(np.int64),
+                        cols['call_tricks'].astype(np.int64))
+    team   = cols['call_seat'] & 0x01
+    fields = (cols['turn_level'], pos, cols['call_seat'], cols['call_suit'], dtype)
+    stats = []
+    for idx in range(2):
+        mask = team == idx
+        teamstats = PlayStats()
+        teamstats.add_deals(*(f[mask].astype(np.int64) for f in fields))
+        stats.append(teamstats)
+    return stats
+
+def matchstats(cols):
+    """Recompute MatchStats (as accumulated in Match.matchstats) from stored results
+
+    :param cols: dict of numpy arrays (see load, requires all columns)
+    :return: MatchStats
+    """
+    stats = MatchStats()
+    for idx, teamstats in enumerate(playstats(cols)):
+        stats.counts[idx] += teamstats.counts
+    stats.matches[:] = np.bincount(cols['match_winner'][cols['match_winner'] >= 0],
+                                   minlength=2)
+    stats.games[:] = np.bincount(cols['game_winner'][cols['game_winner'] >= 0],
+                                 minlength=2)
+    return stats
+
+########
+# Main #
+########
+
+def main(path, by = None, values = None, run_id = None):
+    """Recompute aggregate match stats from a results store (as reported by euchre.py),
+    or group deals by the specified columns
+    """
+    by = [c for c in (by or '').split(',') if c]
+    values = [c for c in (values or '').split(',') if c]
+    cols = load(path, (by + values) if by else None, run_id)
+    ndeals = len(next(iter(cols.values())))
+    print("Loaded %d deals from %s" % (ndeals, path))
+    if not ndeals:
+        return 1
+
+    if not by:
+        for k, v in matchstats(cols).compute_agg().items():
+            print("%20s: %s" % (k, v))
+        return 0
+
+    groups = group_by(cols, by, values)
+    print("%s  %8s  %s" % ("  ".join("%8s" % b for b in by), "count",
+                           "  ".join("%14s" % ("avg_" + v) for v in values)))
+    for i, key in enumerate(groups['keys']):
+        count = groups['count'][i]
+        avgs = [groups[v][i] / count for v in values]
+        print("%s  %8d  %s" % ("  ".join("%8d" % k for k in key), count,
+                               "  ".join("%14s" % np.round(a, 3) for a in avgs)))
+    return 0
+
+def cli():
+    """Command line interface for main() (click is imported here, rather than at module
+    level, to keep imports fast)
+    """
+    import click
+
+    @click.command(help=main.__doc__)
+    @click.argument('path')
+    @click.option('--by',     default=None, help="Comma-separated columns to group by")
+    @click.option('--values', default=None, help="Comma-separated columns to average")
+    @click.option('--run-id', default=None, help="Only load results for the run")
+    def main_cmd(**kwargs):
+        sys.exit(main(**kwargs))
+
+    return main_cmd()
+
+if __name__ == '__main__':
+    cli()
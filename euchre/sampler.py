@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Sampling of hidden-card layouts, consistent with what a player knows at a point in
+the playing of a deal (for search-based strategies, see mcplaying.py)
+
+What is known to the player (see hidden_state) is reduced to per-position masks: cards
+known to be held (e.g. the turncard, if picked up by the dealer), and cards that cannot
+be held (suits shown out of), plus the number of cards each position holds.  The unknown
+cards are then grouped into classes by the set of positions (and the bury) that can hold
+them, and every feasible allocation of counts from each class to each position is
+enumerated once (there are only a handful, since the classes are few), weighted by the
+number of layouts it represents.  Each layout is then generated by choosing an allocation
+(by weight), and shuffling within each class, so layouts are uniformly distributed over
+all consistent layouts, without any rejection, regardless of the number of voids known.
+
+Layouts can also be drawn according to a likelihood model, given as per-position card
+weights (e.g. inferred from bidding), by resampling from a larger uniform sample
+"""
+
+import sys
+import random
+import time
+from math import comb
+
+from core import log, HEADLESS_LEVEL, LogicError
+from bitcards import ALL_CARDS, CARD_BIT, EFF_SUIT, EFF_SUIT_MASK, cards_of, card_idx, suit_idx
+from solver import hand_mask
+
+# holder index for cards not held by any position (i.e. the bury)
+BURY = 4
+
+# uniform layouts generated for each layout drawn, when a likelihood model is used
+RESAMPLE_FACTOR = 4
+
+################
+# Hidden state #
+################
+
+def hidden_state(hand, plays):
+    """What the player knows about the cards not yet seen
+
+    :param hand: Hand or BitHand (whose turn it is)
+    :param plays: list of (hand, card) tuples, for the current trick
+    :return: tuple (mask of unknown cards, number of cards held by position, masks of
+             known cards by position, masks of excluded cards by position)
+    """
+    deal     = hand.deal
+    trump    = suit_idx(deal.contract)
+    effsuit  = EFF_SUIT[trump]
+    suitmask = EFF_SUIT_MASK[trump]
+    ncards   = [5, 5, 5, 5]
+    known    = [0, 0, 0, 0]
+    excluded = [0, 0, 0, 0]  # suits shown out of
+    seen     = 0
+
+    allplays = deal.plays + plays
+    for i in range(0, len(allplays), 4):
+        trick = allplays[i:i + 4]
+        lead_suit = effsuit[card_idx(trick[0][1])]
+        for player, card in trick:
+            c = card_idx(card)
+            seen |= CARD_BIT[c]
+            ncards[player.pos] -= 1
+            if effsuit[c] != lead_suit:
+                excluded[player.pos] |= suitmask[lead_suit]
+
+    known[hand.pos] = hand_mask(hand)
+    unknown = ALL_CARDS & ~seen & ~known[hand.pos]
+    turncard = CARD_BIT[card_idx(deal.turncard)]
+    if len(deal.bids) <= 4:
+        # turncard picked up by the dealer (and the discard only known to the dealer)
+        if hand.pos == 3:
+            unknown &= ~CARD_BIT[card_idx(hand.discard)]
+        elif unknown & turncard:
+            known[3] |= turncard
+    unknown &= ~turncard
+    return unknown, ncards, known, excluded
+
+###########
+# Sampler #
+###########
+
+class LayoutSampler(object):
+    """Generates layouts (masks of cards held, by position) for a fixed set of
+    constraints, where the player's own hand is always as known
+    """
+    def __init__(self, pos, unknown, ncards, known, excluded):
+        """
+        :param pos: int (position of the player)
+        :param unknown: int (mask of cards whose location is unknown to the player, which
+                        are either held by other positions or in the bury)
+        :param ncards: list of int (number of cards held, by position)
+        :param known: list of masks (cards known to be held, by position)
+        :param excluded: list of masks (cards that cannot be held, by position)
+        """
+        self.pos   = pos
+        self.known = list(known)
+        # number of unknown cards to be dealt to each holder (position or bury)
+        need = [0 if q == pos else ncards[q] - known[q].bit_count() for q in range(4)]
+        need.append(unknown.bit_count() - sum(need))
+        if min(need) < 0:
+            raise LogicError("Inconsistent card counts: %s" % (need))
+        self.need = need
+
+        # group unknown cards by the set of holders that can hold them
+        classes = {}
+        for c in cards_of(unknown):
+            holders = tuple(q for q in range(4)
+                            if need[q] and not excluded[q] & CARD_BIT[c]) + (BURY,)
+            classes.setdefault(holders, []).append(c)
+        self.classes = list(classes.items())  # [(holders, cards), ...]
+
+        self.allocs, self.weights = self._enumerate()
+        if not self.allocs:
+            raise LogicError("No layout consistent with constraints")
+        self.total = sum(self.weights)  # number of consistent layouts
+        self.cum_weights = []
+        acc = 0
+        for w in self.weights:
+            acc += w
+            self.cum_weights.append(acc)
+
+    def _enumerate(self):
+        """Enumerate the allocations of counts from each class to each of its holders
+        that exactly satisfy the number of cards needed by each holder
+
+        :return: tuple (list of allocations, list of weights), where an allocation is a
+                 list (by class) of tuples of (holder, count), and the weight is the
+                 number of distinct layouts for the allocation
+        """
+        allocs  = []
+        weights = []
+        classes = self.classes
+        remain  = list(self.need)
+
+        def split(k, alloc, weight):
+            if k == len(classes):
+                if not any(remain):
+                    allocs.append(list(alloc))
+                    weights.append(weight)
+                return
+            holders, cards = classes[k]
+
+            def assign(i, left, parts, w):
+                holder = holders[i]
+                if i == len(holders) - 1:
+                    if left > remain[holder]:
+                        return
+                    remain[holder] -= left
+                    alloc.append(tuple(parts + [(holder, left)]))
+                    split(k + 1, alloc, w)
+                    alloc.pop()
+                    remain[holder] += left
+                    return
+                for n in range(min(left, remain[holder]), -1, -1):
+                    remain[holder] -= n
+                    assign(i + 1, left - n, parts + [(holder, n)], w * comb(left, n))
+                    remain[holder] += n
+
+            assign(0, len(cards), [], weight)
+
+        split(0, [], 1)
+        return allocs, weights
+
+    def sample(self, n, rng = random):
+        """Generate layouts, uniformly distributed over all consistent layouts
+
+        :param n: int (number of layouts)
+        :param rng: random.Random (or the random module)
+        :return: list of layouts (each a list of masks, by position)
+        """
+        classes = self.classes
+        known   = self.known
+        layouts = []
+        if len(self.allocs) == 1:
+            chosen = self.allocs * n
+        else:
+            chosen = rng.choices(self.allocs, cum_weights=self.cum_weights, k=n)
+        for alloc in chosen:
+            hands = list(known)
+            hands.append(0)  # bury
+            for (holders, cards), parts in zip(classes, alloc):
+                perm = rng.sample(cards, len(cards))
+                start = 0
+                for holder, count in parts:
+                    for c in perm[start:start + count]:
+                        hands[holder] |= CARD_BIT[c]
+                    start += count
+            hands.pop()
+            layouts.append(hands)
+        return layouts
+
+    def likelihood(self, layout, weights):
+        """
+        :param layout: list of masks, by position
+        :param weights: list (by position) of sequences of card weights (None for
+                        positions to be treated uniformly)
+        :return: float (relative likelihood of the layout)
+        """
+        value = 1.0
+        for q in range(4):
+            if q == self.pos or not weights[q]:
+                continue
+            wts = weights[q]
+            for c in cards_of(layout[q] & ~self.known[q]):
+                value *= wts[c]
+        return value
+
+    def sample_weighted(self, n, weights, rng = random):
+        """Generate layouts distributed according to a likelihood model, by resampling
+        (with replacement) from RESAMPLE_FACTOR times as many uniform layouts, in
+        proportion to their likelihood
+
+        :param weights: list (by position) of sequences of card weights, where the
+                        likelihood of a layout is the product of the weights of the
+                        unknown cards held by each position
+        :return: list of layouts
+        """
+        pool = self.sample(n * RESAMPLE_FACTOR, rng)
+        likelihoods = [self.likelihood(layout, weights) for layout in pool]
+        if not any(likelihoods):
+            log.debug("No layouts with non-zero likelihood, using uniform layouts")
+            return pool[:n]
+        return rng.choices(pool, weights=likelihoods, k=n)
+
+def layout_sampler(hand, plays):
+    """
+    :param hand: Hand or BitHand (whose turn it is)
+    :param plays: list of (hand, card) tuples, for the current trick
+    :return: LayoutSampler (for the player's current knowledge of the deal)
+    """
+    return LayoutSampler(hand.pos, *hidden_state(hand, plays))
+
+###########
+# Testing #
+###########
+
+class SamplingPlaying(object):
+    """Stands in for a playing module (for all seats), sampling layouts for each decision
+    before delegating to the module, and checking that the actual layout is consistent
+    with the constraints
+    """
+    def __init__(self, module, nlayouts):
+        self.module    = module
+        self.nlayouts  = nlayouts
+        self.rng       = random.Random(0)
+        self.decisions = 0
+        self.layouts   = 0
+        self.classes   = 0
+        self.allocs    = 0
+        self.elapsed   = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def play(self, hand, plays, winning):
+        start = time.perf_counter()
+        sampler = layout_sampler(hand, plays)
+        layouts = sampler.sample(self.nlayouts, self.rng)
+        self.elapsed += time.perf_counter() - start
+
+        actual = [hand_mask(h) for h in hand.deal.hands]
+        for q in range(4):
+            if actual[q] & sampler.known[q] != sampler.known[q]:
+                raise LogicError("Known cards not held by position %d" % (q))
+        unknown, ncards, known, excluded = hidden_state(hand, plays)
+        for layout in layouts:
+            for q in range(4):
+                if layout[q].bit_count() != ncards[q] or layout[q] & excluded[q] or \
+                   layout[q] & ~(known[q] | unknown):
+                    raise LogicError("Layout inconsistent for position %d" % (q))
+        self.decisions += 1
+        self.layouts += len(layouts)
+        self.classes += len(sampler.classes)
+        self.allocs += len(sampler.allocs)
+        return self.module.play(hand, plays, winning)
+
+def main(ndeals = 1000, seed = None, engine = 'bit', nlayouts = 100):
+    """Play deals, and sample layouts for every play decision, reporting the sampling
+    rate (including the computation of the constraints for each decision)
+    """
+    from euchre import Match, engine_args
+
+    log.setLevel(HEADLESS_LEVEL)
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    random.seed(seed)
+    match_args, match_kwargs = engine_args(engine, 0)
+    bidding_mod, playing_mod = match_args
+    players = SamplingPlaying(playing_mod, nlayouts)
+    game = Match([bidding_mod] * 4, [players] * 4, game_points=sys.maxsize,
+                 **match_kwargs).newgame()
+    for _ in range(ndeals):
+        game.newdeal().play()
+
+    decisions = players.decisions
+    if not decisions:
+        print("No play decisions")
+        return 1
+    print("Sampled %d layouts for %d decisions in %.2f secs (%.0f layouts/sec)" %
+          (players.layouts, decisions, players.elapsed, players.layouts / players.elapsed))
+    print("  %.2f classes/decision, %.2f allocations/decision" %
+          (players.classes / decisions, players.allocs / decisions))
+    return 0
+
+def cli():
+    """Command line interface for main() (click is imported here, rather than at module
+    level, to keep imports fast)
+    """
+    import click
+
+    @click.command(help=main.__doc__)
+    @click.option('--ndeals',   '-n', default=1000, type=int, help="Number of deals to play")
+    @click.option('--seed',     '-s', default=None, type=int, help="Seed for random module")
+    @click.option('--engine',   '-e', default='bit', type=click.Choice(['std', 'bit']),
+                  help="Deal engine")
+    @click.option('--nlayouts', '-k', default=100, type=int,
+                  help="Number of layouts per decision")
+    def main_cmd(**kwargs):
+        sys.exit(main(**kwargs))
+
+    return main_cmd()
+
+if __name__ == '__main__':
+    cli()
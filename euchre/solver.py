@@ -0,0 +1,683 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Double-dummy (perfect information) solver for the playing of a deal
+
+Given all four hands (as masks, see bitcards module), trump, and the leader, the solver
+computes the number of tricks each team can force with best play by both sides, using
+alpha-beta search over legal plays, where:
+
+  - cards that are adjacent in rank (within an effective suit) among the cards still
+    in play at the start of a trick, and held by the same player, are equivalent, so
+    only the highest of each such run is searched
+  - leads are ordered with boss cards first, then low to high; plays to a trick are
+    ordered low to high, when partner is winning the trick, otherwise the cheapest
+    winning card first
+  - results are cached at trick boundaries in a transposition table, keyed by the
+    remaining cards (by position) and the leader, as lower/upper bounds
+  - the last two tricks are played out directly, without the per-node overhead of the
+    general search (and the last trick, where all plays are forced, without any search)
+
+Positions are relative to the deal (0 = first to bid/lead, 3 = dealer), so positions 0
+and 2 are one team, and 1 and 3 are the other; search values are in terms of tricks for
+positions 0 and 2 ("team 0" below)
+"""
+
+import sys
+import random
+import time
+
+from core import log, HEADLESS_LEVEL
+from bitcards import (NSUITS, CARD_BIT, EFF_SUIT, EFF_LEVEL, EFF_SUIT_MASK, TRUMP_MASK,
+                      STRENGTH, mask_of, card_idx, suit_idx)
+
+# cards within each effective suit, highest first, indexed by [trump][suit]
+RANKED = tuple(tuple(tuple(sorted((c for c in range(len(EFF_SUIT[t])) if EFF_SUIT[t][c] == s),
+                                  key=lambda c: -EFF_LEVEL[t][c]))
+                     for s in range(NSUITS))
+               for t in range(NSUITS))
+
+# representative plays within a suit, keyed by (trump, legal cards in suit, remaining
+# cards in suit), see _suit_reps; the number of entries is bounded (at most 3^7 per trump
+# and suit), so this is shared by all solvers
+_suit_reps_cache = {}
+
+def _suit_reps(trump, suit, legal, remaining):
+    """Representative plays from `legal` within an effective suit (one per run of
+    equivalent cards, i.e. cards that are adjacent in rank among the remaining cards)
+
+    :param legal: mask (cards that can be played, within the suit)
+    :param remaining: mask (all cards in play at the start of the trick, within the suit)
+    :return: tuple of card idx (highest first)
+    """
+    key = legal | remaining << 24 | trump << 48
+    reps = _suit_reps_cache.get(key)
+    if reps is None:
+        reps = []
+        run = False
+        for c in RANKED[trump][suit]:
+            bit = CARD_BIT[c]
+            if not remaining & bit:
+                continue
+            if legal & bit:
+                if not run:
+                    reps.append(c)
+                    run = True
+            else:
+                run = False
+        reps = _suit_reps_cache[key] = tuple(reps)
+    return reps
+
+# lead order within a suit, keyed same as _suit_reps_cache, see _suit_leads
+_suit_leads_cache = {}
+
+def _suit_leads(trump, suit, legal, remaining):
+    """Representative leads within an effective suit, split into the boss card (if held,
+    i.e. the highest remaining card), and the others (lowest first)
+
+    :return: tuple (boss tuple (empty, or single card idx), tuple of other card idx)
+    """
+    key = legal | remaining << 24 | trump << 48
+    leads = _suit_leads_cache.get(key)
+    if leads is None:
+        reps = _suit_reps(trump, suit, legal, remaining)
+        top = next(c for c in RANKED[trump][suit] if remaining & CARD_BIT[c])
+        if reps[0] == top:
+            leads = (reps[:1], reps[:0:-1])
+        else:
+            leads = ((), reps[::-1])
+        _suit_leads_cache[key] = leads
+    return leads
+
+def _leads(trump, hand, remaining):
+    """Representative leads from `hand`, ordered with boss cards first (which are most
+    likely to be best), then other cards low to high
+
+    :return: tuple of card idx
+    """
+    suitmask = EFF_SUIT_MASK[trump]
+    bosses = others = ()
+    for s in range(NSUITS):
+        if hand & suitmask[s]:
+            boss, rest = _suit_leads(trump, s, hand & suitmask[s], remaining & suitmask[s])
+            bosses += boss
+            others += rest
+    return bosses + others
+
+def _ordered(plays, row, beat):
+    """
+    :param plays: tuple of card idx (representative plays, highest first within suit)
+    :param row: STRENGTH row for the led card
+    :param beat: int (strength of the winning card, if the opponents are winning the
+                 trick, otherwise 0)
+    :return: tuple of card idx, with the cheapest card that wins the trick first, then
+             the lowest losing card (or low to high, if partner is winning)
+    """
+    if not beat:
+        return plays[::-1]
+    return (tuple(c for c in reversed(plays) if row[c] > beat) +
+            tuple(c for c in reversed(plays) if row[c] <= beat))
+
+# plays following suit in search order, keyed by (trump, legal cards, remaining cards,
+# strength to beat), see _follow_order; like _suit_reps_cache, the number of entries is
+# bounded, so this is shared by all solvers
+_follow_cache = {}
+
+def _follow_order(trump, suit, legal, remaining, beat):
+    """Representative plays following suit, in search order (see _ordered)
+
+    :param legal: mask (cards that can be played, within the led suit)
+    :param remaining: mask (all cards in play at the start of the trick, within the suit)
+    :return: tuple of card idx
+    """
+    key = legal | remaining << 24 | trump << 48 | beat << 50
+    order = _follow_cache.get(key)
+    if order is None:
+        row = STRENGTH[trump][RANKED[trump][suit][0]]
+        order = _follow_cache[key] = _ordered(_suit_reps(trump, suit, legal, remaining),
+                                              row, beat)
+    return order
+
+def _reps(trump, legal, remaining):
+    """Representative plays from `legal` (across suits, see _suit_reps)
+
+    :return: tuple of card idx (highest first, within each suit)
+    """
+    suitmask = EFF_SUIT_MASK[trump]
+    reps = ()
+    for s in range(NSUITS):
+        if legal & suitmask[s]:
+            reps += _suit_reps(trump, s, legal & suitmask[s], remaining & suitmask[s])
+    return reps
+
+##########
+# Solver #
+##########
+
+class Solver(object):
+    """Search state for solving positions with a given trump suit; the transposition
+    table is kept across calls to solve() (which is useful for solving successive
+    positions within the same deal), until reset() is called
+
+    Note that the search functions are closures over the search state (see _build),
+    rather than methods, since attribute lookups are a significant part of the cost
+    of each node
+    """
+    def __init__(self, trump):
+        """
+        :param trump: int (suit idx)
+        """
+        self.trump    = trump
+        self.strength = STRENGTH[trump]
+        self.effsuit  = EFF_SUIT[trump]
+        self.suitmask = EFF_SUIT_MASK[trump]
+        self.hands    = [0, 0, 0, 0]  # masks by position (modified during search)
+        self.tt       = {}  # key -> (lower bound, upper bound)
+        self.sure     = {}  # trump holdings -> sure tricks by team (see sure_tricks)
+        self.discards = {}  # (hand, remaining, led suit, beat) -> plays, when void
+        self.counts   = [0]  # trick boundaries searched
+        self._search, self._follow, self._sure_tricks = self._build()
+
+    @property
+    def nodes(self):
+        return self.counts[0]
+
+    def reset(self):
+        """Clear the transposition table (e.g. for a new deal)
+        """
+        self.tt.clear()
+        self.sure.clear()
+        self.discards.clear()
+        self.counts[0] = 0
+
+    def solve(self, hands, leader, trick = ()):
+        """
+        :param hands: list of masks, by position (cards already played to the current
+                      trick are not included)
+        :param leader: int (position leading the current trick)
+        :param trick: sequence of card idx (played to the current trick so far)
+        :return: int (tricks for team 0, from the current trick on)
+        """
+        self.hands[:] = hands
+        ntricks = (hands[leader] | CARD_BIT[trick[0]] if trick else hands[leader]).bit_count()
+        # binary search on the value, using null-window searches (which prune much more
+        # than a full-window search, and share the transposition table)
+        if trick:
+            lower, upper = 0, ntricks
+        else:
+            sure0, sure1 = self._sure_tricks()
+            lower, upper = sure0, ntricks - sure1
+        while lower < upper:
+            target = (lower + upper + 1) // 2
+            if trick:
+                value = self._follow_from(leader, trick, target - 1, target)
+            else:
+                value = self._search(leader, target - 1, target)
+            if value >= target:
+                lower = value
+            else:
+                upper = value
+        return lower
+
+    def analyze(self, hands, leader, trick = ()):
+        """Value of each legal play for the player to move
+
+        :param hands: list of masks, by position (see solve)
+        :return: dict of card idx -> tricks for team 0 (from the current trick on)
+        """
+        pos = (leader + len(trick)) & 3
+        hand = hands[pos]
+        if trick:
+            follow = hand & self.suitmask[self.effsuit[trick[0]]]
+            legal = follow or hand
+        else:
+            legal = hand
+        values = {}
+        for c in range(len(self.effsuit)):
+            if not legal & CARD_BIT[c]:
+                continue
+            new_hands = list(hands)
+            new_hands[pos] ^= CARD_BIT[c]
+            new_trick = tuple(trick) + (c,)
+            if len(new_trick) == 4:
+                winner = (leader + _trick_winner(self.strength, new_trick)) & 3
+                won = int(not winner & 0x01)
+                values[c] = won + self.solve(new_hands, winner)
+            else:
+                values[c] = self.solve(new_hands, leader, new_trick)
+        return values
+
+    def _follow_from(self, leader, trick, alpha, beta):
+        """Continue search from within a trick
+        """
+        row = self.strength[trick[0]]
+        win_pos, win_str = leader, row[trick[0]]
+        for i in range(1, len(trick)):
+            if row[trick[i]] > win_str:
+                win_pos, win_str = (leader + i) & 3, row[trick[i]]
+        hands = self.hands
+        remaining = hands[0] | hands[1] | hands[2] | hands[3]
+        for c in trick:
+            remaining |= CARD_BIT[c]
+        return self._follow(leader, len(trick), row, self.effsuit[trick[0]], win_pos, win_str,
+                            remaining, alpha, beta)
+
+    def _build(self):
+        """
+        :return: tuple (search, follow, sure_tricks) functions
+        """
+        hands    = self.hands
+        tt       = self.tt
+        sure     = self.sure
+        discards = self.discards
+        counts   = self.counts
+        strength = self.strength
+        effsuit  = self.effsuit
+        suitmask = self.suitmask
+        trump    = self.trump
+        ranked   = RANKED[trump]
+        trumps   = TRUMP_MASK[trump]
+        card_bit = CARD_BIT
+        follow_order = _follow_order
+
+        def sure_tricks():
+            """Each trump held by a player that is higher than all of the opponents'
+            remaining trumps wins a trick, so a team gets at least as many tricks as
+            either partner holds of these
+
+            :return: tuple (sure tricks for team 0, sure tricks for team 1)
+            """
+            key = (hands[0] & trumps | (hands[1] & trumps) << 24 |
+                   (hands[2] & trumps) << 48 | (hands[3] & trumps) << 72)
+            by_team = sure.get(key)
+            if by_team is None:
+                by_pos = [0, 0, 0, 0]
+                beaten = [False, False]  # by team, whether an opponent trump was seen
+                for c in ranked[trump]:
+                    bit = card_bit[c]
+                    for pos in range(4):
+                        if hands[pos] & bit:
+                            team = pos & 0x01
+                            if not beaten[team]:
+                                by_pos[pos] += 1
+                            beaten[team ^ 0x01] = True
+                            break
+                    if beaten[0] and beaten[1]:
+                        break
+                by_team = sure[key] = (max(by_pos[0], by_pos[2]), max(by_pos[1], by_pos[3]))
+            return by_team
+
+        def last_trick(leader):
+            """Last trick, where all plays are forced
+
+            :return: int (tricks for team 0)
+            """
+            row = strength[hands[leader].bit_length() - 1]
+            win_pos, win_str = leader, 0
+            for pos in range(4):
+                card_str = row[hands[pos].bit_length() - 1]
+                if card_str > win_str:
+                    win_pos, win_str = pos, card_str
+            return int(not win_pos & 0x01)
+
+        def last_two(leader, alpha, beta):
+            """Last two tricks, where there are at most 16 lines of play, which are walked
+            directly (rather than through search and follow, which is much more costly
+            per line); the caller probes the transposition table first, and stores the
+            result
+
+            :return: int (tricks for team 0, exact if within (alpha, beta), otherwise a
+                     bound)
+            """
+            team = leader & 0x01
+            lower, upper = (2 - beta, 2 - alpha) if team else (alpha, beta)
+            pos1, pos2, pos3 = (leader + 1) & 3, (leader + 2) & 3, (leader + 3) & 3
+            hand0, hand1, hand2, hand3 = hands[leader], hands[pos1], hands[pos2], hands[pos3]
+            # values below are tricks for the leader's team, which maximizes on the first
+            # and third plays, and minimizes on the second and fourth
+            best0 = -1
+            for bit0 in (hand0 & -hand0, hand0 & (hand0 - 1)):
+                row = strength[bit0.bit_length() - 1]
+                ledmask = suitmask[effsuit[bit0.bit_length() - 1]]
+                last0 = hand0 ^ bit0
+                legal1 = hand1 & ledmask or hand1
+                best1 = 3
+                for bit1 in (legal1 & -legal1, legal1 & (legal1 - 1)):
+                    if not bit1:
+                        continue
+                    str1 = row[bit1.bit_length() - 1]
+                    legal2 = hand2 & ledmask or hand2
+                    best2 = -1
+                    for bit2 in (legal2 & -legal2, legal2 & (legal2 - 1)):
+                        if not bit2:
+                            continue
+                        str2 = row[bit2.bit_length() - 1]
+                        legal3 = hand3 & ledmask or hand3
+                        best3 = 3
+                        for bit3 in (legal3 & -legal3, legal3 & (legal3 - 1)):
+                            if not bit3:
+                                continue
+                            str3 = row[bit3.bit_length() - 1]
+                            # winner of this trick (relative to the leader), and so the
+                            # leader of the last trick
+                            win, win_str = 0, row[bit0.bit_length() - 1]
+                            if str1 > win_str:
+                                win, win_str = 1, str1
+                            if str2 > win_str:
+                                win, win_str = 2, str2
+                            if str3 > win_str:
+                                win = 3
+                            last = (last0, hand1 ^ bit1, hand2 ^ bit2, hand3 ^ bit3)
+                            last_row = strength[last[win].bit_length() - 1]
+                            last_win, last_str = win, 0
+                            for i in range(4):
+                                card_str = last_row[last[i].bit_length() - 1]
+                                if card_str > last_str:
+                                    last_win, last_str = i, card_str
+                            value = (not win & 0x01) + (not last_win & 0x01)
+                            if value < best3:
+                                best3 = value
+                                if best3 <= lower:
+                                    break
+                        if best3 > best2:
+                            best2 = best3
+                            if best2 >= upper:
+                                break
+                    if best2 < best1:
+                        best1 = best2
+                        if best1 <= lower:
+                            break
+                if best1 > best0:
+                    best0 = best1
+                    if best0 >= upper:
+                        break
+            return 2 - best0 if team else best0
+
+        def search(leader, alpha, beta):
+            """Search from a trick boundary
+
+            :return: int (tricks for team 0, exact if within (alpha, beta), otherwise a
+                     bound)
+            """
+            lead_hand = hands[leader]
+            ntricks = lead_hand.bit_count()
+            if ntricks <= 1:
+                return last_trick(leader) if ntricks else 0
+            key = hands[0] | hands[1] << 24 | hands[2] << 48 | hands[3] << 72 | leader << 96
+            entry = tt.get(key)
+            if entry:
+                lower, upper = entry
+            else:
+                sure0, sure1 = sure_tricks()
+                lower, upper = sure0, ntricks - sure1
+            if lower >= beta or lower == upper:
+                return lower
+            if upper <= alpha:
+                return upper
+            if lower > alpha:
+                alpha = lower
+            if upper < beta:
+                beta = upper
+            counts[0] += 1
+
+            window = (alpha, beta)
+            if ntricks == 2:
+                best = last_two(leader, alpha, beta)
+            else:
+                remaining = hands[0] | hands[1] | hands[2] | hands[3]
+                maximize = not leader & 0x01
+                best = -1 if maximize else ntricks + 1
+                for c in _leads(trump, lead_hand, remaining):
+                    row = strength[c]
+                    hands[leader] = lead_hand ^ card_bit[c]
+                    value = follow(leader, 1, row, effsuit[c], leader, row[c],
+                                   remaining, alpha, beta)
+                    if maximize:
+                        if value > best:
+                            best = value
+                            if best > alpha:
+                                alpha = best
+                    elif value < best:
+                        best = value
+                        if best < beta:
+                            beta = best
+                    if alpha >= beta:
+                        break
+                hands[leader] = lead_hand
+
+            # fail-soft result: an upper bound if at or below the window, a lower bound
+            # if at or above it, otherwise exact
+            if best <= window[0]:
+                upper = min(upper, best)
+            elif best >= window[1]:
+                lower = max(lower, best)
+            else:
+                lower = upper = best
+            tt[key] = (lower, upper)
+            return best
+
+        def follow(leader, i, row, led_suit, win_pos, win_str, remaining, alpha, beta):
+            """Search the remaining plays of a trick
+
+            :param i: int (number of cards played to the trick so far)
+            :param row: STRENGTH row for the led card
+            :param led_suit: int (led effective suit)
+            :return: int (tricks for team 0, from this trick on)
+            """
+            pos = (leader + i) & 3
+            hand = hands[pos]
+            # strength to beat, if the opponents are winning (see _ordered)
+            beat = win_str if (win_pos ^ pos) & 0x01 else 0
+            ledmask = suitmask[led_suit]
+            legal = hand & ledmask
+            if legal:
+                plays = follow_order(trump, led_suit, legal, remaining & ledmask, beat)
+            else:
+                key = hand | remaining << 24 | led_suit << 48 | beat << 50
+                plays = discards.get(key)
+                if plays is None:
+                    plays = discards[key] = _ordered(_reps(trump, hand, remaining), row, beat)
+            maximize = not pos & 0x01
+            # tricks remaining after this one (if this is the last play of the trick)
+            rest = hand.bit_count() - 1 if i == 3 else None
+            best = -1 if maximize else 6
+            for c in plays:
+                hands[pos] = hand ^ card_bit[c]
+                if row[c] > win_str:
+                    new_pos, new_str = pos, row[c]
+                else:
+                    new_pos, new_str = win_pos, win_str
+                if rest is not None:
+                    won = int(not new_pos & 0x01)
+                    if won >= beta or won + rest <= alpha or rest == 0:
+                        # outside of the window regardless of remaining tricks (or no
+                        # remaining tricks), so no need to search
+                        value = won if won >= beta or rest == 0 else won + rest
+                    else:
+                        value = won + search(new_pos, alpha - won, beta - won)
+                else:
+                    value = follow(leader, i + 1, row, led_suit, new_pos, new_str,
+                                   remaining, alpha, beta)
+                if maximize:
+                    if value > best:
+                        best = value
+                        if best > alpha:
+                            alpha = best
+                elif value < best:
+                    best = value
+                    if best < beta:
+                        beta = best
+                if alpha >= beta:
+                    break
+            hands[pos] = hand
+            return best
+
+        return search, follow, sure_tricks
+
+def _trick_winner(strength, trick):
+    """
+    :return: int (index of winning card within trick)
+    """
+    row = strength[trick[0]]
+    best = 0
+    for i in range(1, 4):
+        if row[trick[i]] > row[trick[best]]:
+            best = i
+    return best
+
+#########
+# Deals #
+#########
+
+_solvers = [Solver(trump) for trump in range(NSUITS)]
+
+def get_solver(trump):
+    """
+    :return: Solver (shared instance for the trump suit, with its transposition table
+             cleared)
+    """
+    solver = _solvers[trump]
+    solver.reset()
+    return solver
+
+def hand_mask(hand):
+    """
+    :param hand: Hand (reference engine) or BitHand
+    :return: int (mask of cards currently held)
+    """
+    if hasattr(hand, 'mask'):
+        return hand.mask
+    return mask_of(c.idx for c in hand.cards)
+
+def initial_position(deal):
+    """Position at the start of play (after bidding), for a deal in any state of play
+    (cards already played are returned to their hands)
+
+    :param deal: Deal or BitDeal (with contract)
+    :return: tuple (hands as masks by position, trump idx)
+    """
+    hands = [hand_mask(hand) for hand in deal.hands]
+    for hand, card in deal.plays:
+        if card is not None:
+            hands[hand.pos] |= CARD_BIT[card_idx(card)]
+    return hands, suit_idx(deal.contract)
+
+def solve_deal(deal):
+    """Double-dummy result for a deal, from the start of play
+
+    :param deal: Deal or BitDeal (with contract)
+    :return: list of tricks, by team idx
+    """
+    hands, trump = initial_position(deal)
+    team0 = get_solver(trump).solve(hands, 0)
+    tricks = [0, 0]
+    tricks[deal.hands[0].team_idx] = team0
+    tricks[deal.hands[1].team_idx] = 5 - team0
+    return tricks
+
+def analyze_play(hand, plays):
+    """Double-dummy value of each legal play for a hand (e.g. for judging the decision
+    made by a playing module), from the current state of the deal
+
+    :param hand: Hand or BitHand (whose turn it is)
+    :param plays: list of (hand, card) tuples, for the current trick
+    :return: dict of card idx -> tricks for the hand's team (from the current trick on)
+    """
+    deal = hand.deal
+    hands = [hand_mask(h) for h in deal.hands]
+    leader = plays[0][0].pos if plays else hand.pos
+    trick = tuple(card_idx(card) for h, card in plays)
+    ntricks = hands[hand.pos].bit_count()
+    values = get_solver(suit_idx(deal.contract)).analyze(hands, leader, trick)
+    if hand.pos & 0x01:
+        return {c: ntricks - v for c, v in values.items()}
+    return values
+
+###########
+# Testing #
+###########
+
+def solve_shard(shard):
+    """Play and solve a run of deals (runs in a worker process, if sharded)
+
+    :param shard: tuple (seed, number of deals, engine)
+    :return: tuple (number of deals solved, solve time, nodes, counts) where counts is a
+             list of (number of deals) by caller tricks made relative to double-dummy
+             result (fewer, same, more)
+    """
+    from euchre import Match, engine_args
+
+    seed, ndeals, engine = shard
+    log.setLevel(HEADLESS_LEVEL)
+    random.seed(seed)
+    match_args, match_kwargs = engine_args(engine, 0)
+    game = Match(*match_args, game_points=sys.maxsize, **match_kwargs).newgame()
+    nsolved = 0
+    elapsed = 0.0
+    nodes = 0
+    counts = [0, 0, 0]
+    for _ in range(ndeals):
+        deal = game.newdeal()
+        deal.play()
+        if not deal.contract:
+            continue
+        start = time.perf_counter()
+        tricks = solve_deal(deal)
+        elapsed += time.perf_counter() - start
+        nodes += _solvers[suit_idx(deal.contract)].nodes
+        nsolved += 1
+        caller_idx = deal.caller.team_idx
+        made = deal.score[caller_idx]
+        counts[(made > tricks[caller_idx]) - (made < tricks[caller_idx]) + 1] += 1
+    return nsolved, elapsed, nodes, counts
+
+def main(ndeals = 1000, seed = None, engine = 'bit', workers = None):
+    """Play deals, and compare the tricks made by the calling team to the double-dummy
+    result (i.e. with perfect play by both teams), reporting solve time
+    """
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    shard_deals = -(-ndeals // workers) if workers else ndeals
+    shards = [(seed + i, min(shard_deals, ndeals - start), engine)
+              for i, start in enumerate(range(0, ndeals, shard_deals))]
+    if workers:
+        import multiprocessing
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(solve_shard, shards)
+    else:
+        results = [solve_shard(shard) for shard in shards]
+
+    nsolved = sum(r[0] for r in results)
+    elapsed = sum(r[1] for r in results)
+    nodes = sum(r[2] for r in results)
+    counts = [sum(r[3][i] for r in results) for i in range(3)]
+    if not nsolved:
+        print("No deals to solve")
+        return 1
+    print("Solved %d deals in %.2f secs (%.3f ms/deal, %.1f nodes/deal)" %
+          (nsolved, elapsed, elapsed / nsolved * 1000.0, nodes / nsolved))
+    for label, count in zip(("fewer", "same", "more"), counts):
+        print("  caller made %-5s tricks than double-dummy: %6d (%.1f%%)" %
+              (label, count, count / nsolved * 100.0))
+    return 0
+
+def cli():
+    """Command line interface for main() (click is imported here, rather than at module
+    level, to keep imports fast)
+    """
+    import click
+
+    @click.command(help=main.__doc__)
+    @click.option('--ndeals',  '-n', default=1000, type=int, help="Number of deals to play")
+    @click.option('--seed',    '-s', default=None, type=int, help="Seed for random module")
+    @click.option('--engine',  '-e', default='bit', type=click.Choice(['std', 'bit']),
+                  help="Deal engine")
+    @click.option('--workers', '-w', default=None, type=int,
+                  help="Number of worker processes (deals are sharded by seed)")
+    def main_cmd(**kwargs):
+        sys.exit(main(**kwargs))
+
+    return main_cmd()
+
+if __name__ == '__main__':
+    cli()
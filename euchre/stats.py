@@ -1,10 +1,25 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from math import log10
+from time import perf_counter
 
 from core import log
 from utils import prettyprint
 
+# numpy is imported on first use (see _numpy), since it is slow to import
+np = None
+
+def _numpy():
+    """
+    :return: numpy module
+    """
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
 #############
 # Constants #
 #############
@@ -14,125 +29,262 @@ NPOS   = 8
 NSEATS = 4
 NSUITS = 3
 
+# Counters are stored as arrays of (dimension row x metric), where the first row holds
+# totals, followed by the rows for each dimension value (turncard level, bid position,
+# seat, and relative suit); MatchStats adds a leading team axis
+
+TOTAL_ROW = 0
+CARD_ROW  = 1
+POS_ROW   = CARD_ROW + NCARDS
+SEAT_ROW  = POS_ROW + NPOS
+SUIT_ROW  = SEAT_ROW + NSEATS
+NROWS     = SUIT_ROW + NSUITS
+
+DIMS = {'card': (CARD_ROW, NCARDS),
+        'pos' : (POS_ROW,  NPOS),
+        'seat': (SEAT_ROW, NSEATS),
+        'suit': (SUIT_ROW, NSUITS)}
+
+DEAL, PASS, BID, MAKE, ALL, EUCH, TRKS, PTS, TPTS = range(9)
+NMETRICS = 9
+
+METRICS = {'deal': DEAL, 'pass': PASS, 'bid': BID, 'make': MAKE, 'all': ALL,
+           'euch': EUCH, 'trks': TRKS, 'pts': PTS, 'tpts': TPTS}
+
+# Deal types, which determine the increment (by metric) for each affected row: type 0 is
+# a passed deal, otherwise the type is determined by points (see Deal.compute_stats for
+# possible values) and tricks made by the calling team
+DEAL_POINTS = (-2, 1, 2, 4)
+NTYPES      = 1 + len(DEAL_POINTS) * 6
+DEAL_TYPE   = {(pts, trks): 1 + i * 6 + trks
+               for i, pts in enumerate(DEAL_POINTS) for trks in range(6)}
+
+def _type_incr():
+    """
+    :return: numpy array (deal type x metric)
+    """
+    incr = _numpy().zeros((NTYPES, NMETRICS), dtype=np.int64)
+    incr[:, DEAL] = 1
+    incr[0, PASS] = 1
+    for (pts, trks), t in DEAL_TYPE.items():
+        incr[t, BID]  = 1
+        incr[t, TRKS] = trks
+        if pts > 0:
+            incr[t, MAKE] = 1
+            incr[t, ALL]  = int(pts > 1)
+            incr[t, PTS]  = pts
+            incr[t, TPTS] = pts
+        else:
+            incr[t, EUCH] = 1
+            incr[t, TPTS] = -pts
+    return incr
+
+def deal_types(pos, points, tricks):
+    """Vectorized version of the DEAL_TYPE lookup (e.g. for stored results)
+
+    :param pos: numpy array (bid position, negative if passed)
+    :param points: numpy array (points for calling team, ignored if passed)
+    :param tricks: numpy array (tricks made by calling team, ignored if passed)
+    :return: numpy array (deal type)
+    """
+    _numpy()
+    dtype = 1 + np.searchsorted(DEAL_POINTS, points) * 6 + tricks
+    return np.where(pos >= 0, dtype, 0)
+
 ###############
 # Match Stats #
 ###############
 
 class MatchStats(object):
     """This structure tracking team scoring across matches
+
+    Counters are numpy arrays: `matches` and `games` by team, and `counts` by team x
+    dimension row x metric (see above), which is the sum of PlayStats counts for each
+    team; arrays are allocated on first use, so that creating an instance (e.g. at
+    import time, for Match.matchstats) does not import numpy
     """
+    # fields reported by compute_agg (in order), as (name, metric, dimension or None)
+    FIELDS = (('tricks',        TRKS, None),
+              ('deals',         DEAL, None),
+              ('passes',        PASS, None),
+              ('bids',          BID,  None),
+              ('makes',         MAKE, None),
+              ('make_alls',     ALL,  None),
+              ('euchres',       EUCH, None),
+              ('bid_by_pos',    BID,  'pos'),
+              ('make_by_pos',   MAKE, 'pos'),
+              ('mkall_by_pos',  ALL,  'pos'),
+              ('euch_by_pos',   EUCH, 'pos'),
+              ('pass_by_card',  PASS, 'card'),
+              ('bid_by_card',   BID,  'card'),
+              ('make_by_card',  MAKE, 'card'),
+              ('mkall_by_card', ALL,  'card'),
+              ('euch_by_card',  EUCH, 'card'),
+              ('bid_by_suit',   BID,  'suit'),
+              ('make_by_suit',  MAKE, 'suit'),
+              ('mkall_by_suit', ALL,  'suit'),
+              ('euch_by_suit',  EUCH, 'suit'))
+
     def __init__(self):
         """
         """
-        self.matches       = [0, 0]
-        self.games         = [0, 0]
-        self.tricks        = [0, 0]
-        self.deals         = [0, 0]
-        self.passes        = [0, 0]
-        self.bids          = [0, 0]
-        self.makes         = [0, 0]
-        self.make_alls     = [0, 0]
-        self.euchres       = [0, 0]
-        self.bid_by_pos    = [[0] * NPOS,   [0] * NPOS]
-        self.make_by_pos   = [[0] * NPOS,   [0] * NPOS]
-        self.mkall_by_pos  = [[0] * NPOS,   [0] * NPOS]
-        self.euch_by_pos   = [[0] * NPOS,   [0] * NPOS]
-        self.pass_by_card  = [[0] * NCARDS, [0] * NCARDS]
-        self.bid_by_card   = [[0] * NCARDS, [0] * NCARDS]
-        self.make_by_card  = [[0] * NCARDS, [0] * NCARDS]
-        self.mkall_by_card = [[0] * NCARDS, [0] * NCARDS]
-        self.euch_by_card  = [[0] * NCARDS, [0] * NCARDS]
-        self.bid_by_suit   = [[0] * NSUITS, [0] * NSUITS]
-        self.make_by_suit  = [[0] * NSUITS, [0] * NSUITS]
-        self.mkall_by_suit = [[0] * NSUITS, [0] * NSUITS]
-        self.euch_by_suit  = [[0] * NSUITS, [0] * NSUITS]
+        self._matches = None
+        self._games   = None
+        self._counts  = None
+
+    def _alloc(self):
+        _numpy()
+        self._matches = np.zeros(2, dtype=np.int64)
+        self._games   = np.zeros(2, dtype=np.int64)
+        self._counts  = np.zeros((2, NROWS, NMETRICS), dtype=np.int64)
+
+    @property
+    def matches(self):
+        if self._counts is None:
+            self._alloc()
+        return self._matches
+
+    @property
+    def games(self):
+        if self._counts is None:
+            self._alloc()
+        return self._games
+
+    @property
+    def counts(self):
+        if self._counts is None:
+            self._alloc()
+        return self._counts
+
+    def field(self, name):
+        """
+        :param name: str (see FIELDS)
+        :return: numpy array (view, by team, and dimension value if applicable)
+        """
+        for fname, metric, dim in MatchStats.FIELDS:
+            if fname == name:
+                break
+        else:
+            raise AttributeError("'MatchStats' object has no attribute '%s'" % (name))
+        if dim is None:
+            return self.counts[:, TOTAL_ROW, metric]
+        start, n = DIMS[dim]
+        return self.counts[:, start:start + n, metric]
+
+    def __getattr__(self, name):
+        """Named fields (e.g. `bid_by_pos`), as views into `counts`
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.field(name)
 
     def update(self, match):
         """
         """
+        counts = self.counts
         if match.winner:
-            self.matches[match.winner['idx']] += 1
+            self._matches[match.winner['idx']] += 1
+        self._games += match.games_won
         for i in range(2):
-            self.games[i]       += match.games_won[i]
-            self.tricks[i]      += match.teamstats[i].ntrk
-            self.deals[i]       += match.teamstats[i].ndeal
-            self.passes[i]      += match.teamstats[i].npass
-            self.bids[i]        += match.teamstats[i].nbid
-            self.makes[i]       += match.teamstats[i].nmake
-            self.make_alls[i]   += match.teamstats[i].nall
-            self.euchres[i]     += match.teamstats[i].neuch
-            for j in range(NPOS):
-                self.bid_by_pos[i][j]    += match.teamstats[i].bid_by_pos[j]
-                self.make_by_pos[i][j]   += match.teamstats[i].make_by_pos[j]
-                self.mkall_by_pos[i][j]  += match.teamstats[i].all_by_pos[j]
-                self.euch_by_pos[i][j]   += match.teamstats[i].euch_by_pos[j]
-            for j in range(NCARDS):
-                self.pass_by_card[i][j]  += match.teamstats[i].pass_by_card[j]
-                self.bid_by_card[i][j]   += match.teamstats[i].bid_by_card[j]
-                self.make_by_card[i][j]  += match.teamstats[i].make_by_card[j]
-                self.mkall_by_card[i][j] += match.teamstats[i].all_by_card[j]
-                self.euch_by_card[i][j]  += match.teamstats[i].euch_by_card[j]
-            for j in range(NSUITS):
-                self.bid_by_suit[i][j]   += match.teamstats[i].bid_by_suit[j]
-                self.make_by_suit[i][j]  += match.teamstats[i].make_by_suit[j]
-                self.mkall_by_suit[i][j] += match.teamstats[i].all_by_suit[j]
-                self.euch_by_suit[i][j]  += match.teamstats[i].euch_by_suit[j]
+            counts[i] += match.teamstats[i].counts
 
-    def compute_agg(self):
+    def merge(self, other):
+        """Add stats from another instance (e.g. accumulated in a separate process, or
+        loaded from a previous run); since all stats are counts, the result does not
+        depend on the order of merging
+
+        :param other: MatchStats
+        :return: void
         """
+        if other._counts is None:
+            return
+        counts = self.counts
+        counts += other._counts
+        self._matches += other._matches
+        self._games   += other._games
+
+    def save(self, path):
+        """Save counters to a (compressed) .npz file
+
+        :param path: str (file name, or file object)
+        """
+        _numpy().savez_compressed(path, matches=self.matches, games=self.games,
+                                  counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: str (file name, or file object, see save())
+        :return: MatchStats
+        """
+        stats = cls()
+        with _numpy().load(path) as data:
+            if data['counts'].shape != (2, NROWS, NMETRICS):
+                raise ValueError("Incompatible stats layout %s" % (data['counts'].shape,))
+            stats._matches = data['matches'].copy()
+            stats._games   = data['games'].copy()
+            stats._counts  = data['counts'].copy()
+        return stats
+
+    def compute_agg(self):
+        """Note that percentages are computed as arrays, but rounded (and converted to
+        lists) using Python round(), so that reported values are the same as for the
+        original list-based implementation
         """
-        def pct_tref(stat, ref, prec = 2, nan = -1):
-            return [round(stat[i] / ref[i] * 100.0, prec) if ref[i] else nan \
-                    for i in range(2)]
+        def rounded(pct, valid, prec, nan):
+            return [round(v, prec) if ok else nan
+                    for v, ok in zip(pct.tolist(), valid.tolist())]
+
+        def pct(stat, ref, prec = 2, nan = -1):
+            stat = stat.astype(np.float64)
+            valid = ref != 0
+            pct = np.divide(stat, ref, out=np.zeros_like(stat), where=valid) * 100.0
+            if pct.ndim == 1:
+                return rounded(pct, valid, prec, nan)
+            return [rounded(pct[i], valid[i], prec, nan) for i in range(2)]
 
         def pct_tot(stat, tot, prec = 2, nan = -1):
-            nvals = len(stat[0])
-            return [[round(stat[i][j] / tot[i] * 100.0, prec) if tot[i] else nan \
-                     for j in range(nvals)] \
-                    for i in range(2)]
-
-        def pct_ref(stat, ref, prec = 2, nan = -1):
-            nvals = len(stat[0])
-            return [[round(stat[i][j] / ref[i][j] * 100.0, prec) if ref[i][j] else nan \
-                     for j in range(nvals)] \
-                    for i in range(2)]
-
-        agg = self.__dict__.copy()
+            return pct(stat, np.broadcast_to(tot[:, None], stat.shape), prec, nan)
+
+        f = self.field
+        agg = {'matches': self.matches.tolist(), 'games': self.games.tolist()}
+        for name, metric, dim in MatchStats.FIELDS:
+            agg[name] = f(name).tolist()
         agg.update({
             # overall team percentages
-            'pass_pct'          : pct_tref(self.passes,       self.deals),
-            'bid_pct'           : pct_tref(self.bids,         self.deals),
-            'make_pct'          : pct_tref(self.makes,        self.bids),
-            'mkall_pct'         : pct_tref(self.make_alls,    self.bids),
-            'euchre_pct'        : pct_tref(self.euchres,      self.bids),
+            'pass_pct'          : pct(f('passes'),          f('deals')),
+            'bid_pct'           : pct(f('bids'),            f('deals')),
+            'make_pct'          : pct(f('makes'),           f('bids')),
+            'mkall_pct'         : pct(f('make_alls'),       f('bids')),
+            'euchre_pct'        : pct(f('euchres'),         f('bids')),
             # bid/result against total occurrences
-            'pct_bid_by_pos'    : pct_tot(self.bid_by_pos,    self.bids),
-            'pct_make_by_pos'   : pct_tot(self.make_by_pos,   self.makes),
-            'pct_mkall_by_pos'  : pct_tot(self.mkall_by_pos,  self.make_alls),
-            'pct_euchre_by_pos' : pct_tot(self.euch_by_pos,   self.euchres),
+            'pct_bid_by_pos'    : pct_tot(f('bid_by_pos'),    f('bids')),
+            'pct_make_by_pos'   : pct_tot(f('make_by_pos'),   f('makes')),
+            'pct_mkall_by_pos'  : pct_tot(f('mkall_by_pos'),  f('make_alls')),
+            'pct_euchre_by_pos' : pct_tot(f('euch_by_pos'),   f('euchres')),
             # result against bids
-            'make_pct_by_pos'   : pct_ref(self.make_by_pos,   self.bid_by_pos),
-            'mkall_pct_by_pos'  : pct_ref(self.mkall_by_pos,  self.bid_by_pos),
-            'euchre_pct_by_pos' : pct_ref(self.euch_by_pos,   self.bid_by_pos),
+            'make_pct_by_pos'   : pct(f('make_by_pos'),     f('bid_by_pos')),
+            'mkall_pct_by_pos'  : pct(f('mkall_by_pos'),    f('bid_by_pos')),
+            'euchre_pct_by_pos' : pct(f('euch_by_pos'),     f('bid_by_pos')),
             # bid/result against total occurrences
-            'pct_pass_by_card'  : pct_tot(self.pass_by_card,  self.passes),
-            'pct_bid_by_card'   : pct_tot(self.bid_by_card,   self.bids),
-            'pct_make_by_card'  : pct_tot(self.make_by_card,  self.makes),
-            'pct_mkall_by_card' : pct_tot(self.mkall_by_card, self.make_alls),
-            'pct_euchre_by_card': pct_tot(self.euch_by_card,  self.euchres),
+            'pct_pass_by_card'  : pct_tot(f('pass_by_card'),  f('passes')),
+            'pct_bid_by_card'   : pct_tot(f('bid_by_card'),   f('bids')),
+            'pct_make_by_card'  : pct_tot(f('make_by_card'),  f('makes')),
+            'pct_mkall_by_card' : pct_tot(f('mkall_by_card'), f('make_alls')),
+            'pct_euchre_by_card': pct_tot(f('euch_by_card'),  f('euchres')),
             # result against bids
-            'make_pct_by_card'  : pct_ref(self.make_by_card,  self.bid_by_card),
-            'mkall_pct_by_card' : pct_ref(self.mkall_by_card, self.bid_by_card),
-            'euchre_pct_by_card': pct_ref(self.euch_by_card,  self.bid_by_card),
+            'make_pct_by_card'  : pct(f('make_by_card'),    f('bid_by_card')),
+            'mkall_pct_by_card' : pct(f('mkall_by_card'),   f('bid_by_card')),
+            'euchre_pct_by_card': pct(f('euch_by_card'),    f('bid_by_card')),
             # bid/result against total occurrences
-            'pct_bid_by_suit'   : pct_tot(self.bid_by_suit,   self.bids),
-            'pct_make_by_suit'  : pct_tot(self.make_by_suit,  self.makes),
-            'pct_mkall_by_suit' : pct_tot(self.mkall_by_suit, self.make_alls),
-            'pct_euchre_by_suit': pct_tot(self.euch_by_suit,  self.euchres),
+            'pct_bid_by_suit'   : pct_tot(f('bid_by_suit'),   f('bids')),
+            'pct_make_by_suit'  : pct_tot(f('make_by_suit'),  f('makes')),
+            'pct_mkall_by_suit' : pct_tot(f('mkall_by_suit'), f('make_alls')),
+            'pct_euchre_by_suit': pct_tot(f('euch_by_suit'),  f('euchres')),
             # result against bids
-            'make_pct_by_suit'  : pct_ref(self.make_by_suit,  self.bid_by_suit),
-            'mkall_pct_by_suit' : pct_ref(self.mkall_by_suit, self.bid_by_suit),
-            'euchre_pct_by_suit': pct_ref(self.euch_by_suit,  self.bid_by_suit),
+            'make_pct_by_suit'  : pct(f('make_by_suit'),    f('bid_by_suit')),
+            'mkall_pct_by_suit' : pct(f('mkall_by_suit'),   f('bid_by_suit')),
+            'euchre_pct_by_suit': pct(f('euch_by_suit'),    f('bid_by_suit')),
         })
         return agg
 
@@ -141,155 +293,357 @@ class MatchStats(object):
 ##############
 
 class PlayStats(object):
-    """This structure is used for tracking stats at the game level, as well as
-    rolling up stats to the match level
+    """This structure is used for tracking stats (for a team) at the game level, as
+    well as rolling up stats to the match level
+
+    Counters are held in a single numpy array, `counts` (dimension row x metric, see
+    above); the original field names are still available as attributes, e.g. `nbid`
+    (total bids) or `make_by_pos` (view of makes by bid position)
+
+    Deals are buffered in update(), and applied to the array in batches (vectorized),
+    whenever `counts` is accessed, or the buffer is full
     """
+    TOTALS = {'ndeal': DEAL, 'npass': PASS, 'nbid': BID, 'nmake': MAKE, 'nall': ALL,
+              'neuch': EUCH, 'ntrk': TRKS}
+
+    BATCH_SIZE = 4096
+    type_incr  = None  # see _type_incr()
+
     def __init__(self):
         """
         """
-        self.ndeal = 0
-        self.npass = 0
-        self.nbid  = 0
-        self.nmake = 0
-        self.nall  = 0
-        self.neuch = 0
-        self.ntrk  = 0
-        self.pass_by_card = [0] * NCARDS
-        self.bid_by_card  = [0] * NCARDS
-        self.bid_by_pos   = [0] * NPOS
-        self.bid_by_seat  = [0] * NSEATS
-        self.bid_by_suit  = [0] * NSUITS
-        self.make_by_card = [0] * NCARDS
-        self.make_by_pos  = [0] * NPOS
-        self.make_by_seat = [0] * NSEATS
-        self.make_by_suit = [0] * NSUITS
-        self.all_by_card  = [0] * NCARDS
-        self.all_by_pos   = [0] * NPOS
-        self.all_by_seat  = [0] * NSEATS
-        self.all_by_suit  = [0] * NSUITS
-        self.euch_by_card = [0] * NCARDS
-        self.euch_by_pos  = [0] * NPOS
-        self.euch_by_seat = [0] * NSEATS
-        self.euch_by_suit = [0] * NSUITS
-        self.trks_by_card = [0] * NCARDS
-        self.trks_by_pos  = [0] * NPOS
-        self.trks_by_seat = [0] * NSEATS
-        self.trks_by_suit = [0] * NSUITS
-        self.pts_by_card  = [0] * NCARDS
-        self.pts_by_pos   = [0] * NPOS
-        self.pts_by_seat  = [0] * NSEATS
-        self.pts_by_suit  = [0] * NSUITS
-        self.tpts_by_card = [0] * NCARDS
-        self.tpts_by_pos  = [0] * NPOS
-        self.tpts_by_seat = [0] * NSEATS
-        self.tpts_by_suit = [0] * NSUITS
+        self._counts  = _numpy().zeros((NROWS, NMETRICS), dtype=np.int64)
+        self._pending = []  # (turncard, pos, seat, suit, deal type), see update
+
+    @property
+    def counts(self):
+        """
+        :return: numpy array (dimension row x metric)
+        """
+        if self._pending:
+            self._flush()
+        return self._counts
+
+    def __getattr__(self, name):
+        """Totals (e.g. `ndeal`) as ints, and breakdowns (e.g. `bid_by_card`) as views
+        into `counts`
+        """
+        if name in PlayStats.TOTALS:
+            return int(self.counts[TOTAL_ROW, PlayStats.TOTALS[name]])
+        metric, _, dim = name.partition('_by_')
+        if metric in METRICS and dim in DIMS:
+            start, n = DIMS[dim]
+            return self.counts[start:start + n, METRICS[metric]]
+        raise AttributeError("'PlayStats' object has no attribute '%s'" % (name))
 
     def update(self, dealstats):
         """
         :param dealstats: dict (see below for field keys)
         :return: void
         """
-        self.ndeal += 1
-        card = dealstats['turncard']
-        pos  = dealstats['call_pos']
+        pos = dealstats['call_pos']
         if pos is None:
-            self.npass += 1
-            self.pass_by_card[card] += 1
-            return
+            self._pending.append((dealstats['turncard'], -1, 0, 0, 0))
+        else:
+            self._pending.append((dealstats['turncard'], pos, dealstats['call_seat'],
+                                  dealstats['call_suit'],
+                                  DEAL_TYPE[(dealstats['points'], dealstats['tricks'])]))
+        if len(self._pending) >= PlayStats.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Apply buffered deals to the counts array
+        """
+        data = _numpy().array(self._pending, dtype=np.int64)
+        self._pending = []
+        self.add_deals(*data.T)
 
-        seat = dealstats['call_seat']
-        suit = dealstats['call_suit']
-        trks = dealstats['tricks']
-        pts  = dealstats['points']
-
-        self.nbid += 1
-        self.bid_by_card[card]  += 1
-        self.bid_by_pos[pos]    += 1
-        self.bid_by_seat[seat]  += 1
-        self.bid_by_suit[suit]  += 1
-        self.ntrk += trks
-        self.trks_by_card[card] += trks
-        self.trks_by_pos[pos]   += trks
-        self.trks_by_seat[seat] += trks
-        self.trks_by_suit[suit] += trks
+    def add_deals(self, card, pos, seat, suit, dtype):
+        """Add a batch of deals (as arrays, see update for fields): deals are counted by
+        (row, deal type) for all affected rows (totals, turncard, and for bids: position,
+        seat and suit), then multiplied out by the increments for each deal type
 
-        if pts > 0:
-            self.nmake += 1
-            self.make_by_card[card] += 1
-            self.make_by_pos[pos]   += 1
-            self.make_by_seat[seat] += 1
-            self.make_by_suit[suit] += 1
-            if pts > 1:
-                self.nall += 1
-                self.all_by_card[card] += 1
-                self.all_by_pos[pos]   += 1
-                self.all_by_seat[seat] += 1
-                self.all_by_suit[suit] += 1
-            self.pts_by_card[card]  += pts
-            self.pts_by_pos[pos]    += pts
-            self.pts_by_seat[seat]  += pts
-            self.pts_by_suit[suit]  += pts
-            self.tpts_by_card[card] += pts
-            self.tpts_by_pos[pos]   += pts
-            self.tpts_by_seat[seat] += pts
-            self.tpts_by_suit[suit] += pts
-        elif pts < 0:
-            self.neuch += 1
-            self.euch_by_card[card] += 1
-            self.euch_by_pos[pos]   += 1
-            self.euch_by_seat[seat] += 1
-            self.euch_by_suit[suit] += 1
-            self.tpts_by_card[card] += -pts
-            self.tpts_by_pos[pos]   += -pts
-            self.tpts_by_seat[seat] += -pts
-            self.tpts_by_suit[suit] += -pts
+        :return: void
+        """
+        if PlayStats.type_incr is None:
+            PlayStats.type_incr = _type_incr()
+        bid = pos >= 0
+        bid_type = dtype[bid]
+
+        cells = np.concatenate((TOTAL_ROW * NTYPES + dtype,
+                                (CARD_ROW + card) * NTYPES + dtype,
+                                (POS_ROW + pos[bid]) * NTYPES + bid_type,
+                                (SEAT_ROW + seat[bid]) * NTYPES + bid_type,
+                                (SUIT_ROW + suit[bid]) * NTYPES + bid_type))
+        by_type = np.bincount(cells, minlength=NROWS * NTYPES).reshape(NROWS, NTYPES)
+        self._counts += by_type @ PlayStats.type_incr
+
+    def merge(self, other):
+        """
+        :param other: PlayStats
+        :return: void
+        """
+        counts = self.counts
+        counts += other.counts
 
     def rollup(self, other):
         """
         :param other: GameStats
         :return: void
         """
-        self.ndeal += other.ndeal
-        self.npass += other.npass
-        self.nbid  += other.nbid
-        self.nmake += other.nmake
-        self.nall  += other.nall
-        self.neuch += other.neuch
-        self.ntrk  += other.ntrk
-
-        for card in range(NCARDS):
-            self.pass_by_card[card] += other.pass_by_card[card]
-            self.bid_by_card[card]  += other.bid_by_card[card]
-            self.make_by_card[card] += other.make_by_card[card]
-            self.all_by_card[card]  += other.all_by_card[card]
-            self.trks_by_card[card] += other.trks_by_card[card]
-            self.pts_by_card[card]  += other.pts_by_card[card]
-            self.tpts_by_card[card] += other.tpts_by_card[card]
-            self.euch_by_card[card] += other.euch_by_card[card]
-
-        for pos in range(NPOS):
-            self.bid_by_pos[pos]    += other.bid_by_pos[pos]
-            self.make_by_pos[pos]   += other.make_by_pos[pos]
-            self.all_by_pos[pos]    += other.all_by_pos[pos]
-            self.trks_by_pos[pos]   += other.trks_by_pos[pos]
-            self.pts_by_pos[pos]    += other.pts_by_pos[pos]
-            self.tpts_by_pos[pos]   += other.tpts_by_pos[pos]
-            self.euch_by_pos[pos]   += other.euch_by_pos[pos]
-
-        for seat in range(NSEATS):
-            self.bid_by_seat[seat]  += other.bid_by_seat[seat]
-            self.make_by_seat[seat] += other.make_by_seat[seat]
-            self.all_by_seat[seat]  += other.all_by_seat[seat]
-            self.trks_by_seat[seat] += other.trks_by_seat[seat]
-            self.pts_by_seat[seat]  += other.pts_by_seat[seat]
-            self.tpts_by_seat[seat] += other.tpts_by_seat[seat]
-            self.euch_by_seat[seat] += other.euch_by_seat[seat]
-
-        for suit in range(NSUITS):
-            self.bid_by_suit[suit]  += other.bid_by_suit[suit]
-            self.make_by_suit[suit] += other.make_by_suit[suit]
-            self.all_by_suit[suit]  += other.all_by_suit[suit]
-            self.trks_by_suit[suit] += other.trks_by_suit[suit]
-            self.pts_by_suit[suit]  += other.pts_by_suit[suit]
-            self.tpts_by_suit[suit] += other.tpts_by_suit[suit]
-            self.euch_by_suit[suit] += other.euch_by_suit[suit]
+        self.merge(other)
+
+    def save(self, path):
+        """Save counters to a (compressed) .npz file
+
+        :param path: str (file name, or file object)
+        """
+        _numpy().savez_compressed(path, counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: str (file name, or file object, see save())
+        :return: PlayStats
+        """
+        stats = cls()
+        with _numpy().load(path) as data:
+            if data['counts'].shape != (NROWS, NMETRICS):
+                raise ValueError("Incompatible stats layout %s" % (data['counts'].shape,))
+            stats._counts = data['counts'].copy()
+        return stats
+
+##############
+# Rule Stats #
+##############
+
+class RuleStats(object):
+    """Opt-in instrumentation for rulesets (see playing.play and bidding._bestdiscard):
+    counts evaluations and hits for each rule, by ruleset, trick number and play
+    position, along with cumulative time spent in the rule
+
+    To enable, assign an instance to `rule_stats` in the rules module(s) (set to None
+    to disable, in which case there is no per-rule overhead)
+    """
+    def __init__(self):
+        """
+        """
+        # {(ruleset, trick_no, play_pos, rule): [evals, hits, secs]}, where trick_no and
+        # play_pos are None for rulesets not associated with a trick
+        self.counts = {}
+
+    def apply(self, name, ruleset, trick_no, play_pos, *args):
+        """Instrumented version of applying a ruleset (first rule to return a value wins)
+
+        :param name: str (name of ruleset)
+        :param ruleset: sequence of functions (rules), each called with *args
+        :return: result of the first rule to return a (non-null) value, or None
+        """
+        counts = self.counts
+        for rule in ruleset:
+            start = perf_counter()
+            res = rule(*args)
+            secs = perf_counter() - start
+            key = (name, trick_no, play_pos, rule.__name__)
+            entry = counts.get(key)
+            if entry is None:
+                entry = counts[key] = [0, 0, 0.0]
+            entry[0] += 1
+            entry[2] += secs
+            if res is not None:
+                entry[1] += 1
+                return res
+        return None
+
+    def merge(self, other):
+        """Add stats from another instance (e.g. accumulated in a separate process)
+
+        :param other: RuleStats
+        :return: void
+        """
+        for key, (evals, hits, secs) in other.counts.items():
+            entry = self.counts.get(key)
+            if entry is None:
+                entry = self.counts[key] = [0, 0, 0.0]
+            entry[0] += evals
+            entry[1] += hits
+            entry[2] += secs
+
+    def rollup(self, by = ()):
+        """Aggregate counts by ruleset and rule, plus the specified breakdown fields
+
+        :param by: tuple of field names ('trick_no' and/or 'play_pos')
+        :return: dict {(ruleset, rule, *by): [evals, hits, secs]}, with rules in the
+                 order first seen (i.e. ruleset order)
+        """
+        fields = {'trick_no': 1, 'play_pos': 2}
+        agg = {}
+        for key, (evals, hits, secs) in self.counts.items():
+            aggkey = (key[0], key[3], *(key[fields[f]] for f in by))
+            entry = agg.get(aggkey)
+            if entry is None:
+                entry = agg[aggkey] = [0, 0, 0.0]
+            entry[0] += evals
+            entry[1] += hits
+            entry[2] += secs
+        return agg
+
+    def report(self, out = print):
+        """Print hits, hit rate (of evaluations), share of ruleset decisions, and timing
+        for each rule, followed by hits broken down by trick number and play position
+
+        :param out: function for reporting results (takes a string)
+        """
+        by_rule = self.rollup()
+        decisions = {}
+        for (ruleset, rule), (evals, hits, secs) in by_rule.items():
+            decisions[ruleset] = decisions.get(ruleset, 0) + hits
+
+        for ruleset in sorted(decisions):
+            out("Ruleset '%s': %d decisions" % (ruleset, decisions[ruleset]))
+            out("  %-26s %9s %9s %7s %7s %10s %8s" %
+                ("rule", "evals", "hits", "hit%", "share%", "total ms", "us/eval"))
+            for (rs, rule), (evals, hits, secs) in by_rule.items():
+                if rs != ruleset:
+                    continue
+                out("  %-26s %9d %9d %7.2f %7.2f %10.2f %8.2f" %
+                    (rule, evals, hits,
+                     hits / evals * 100.0 if evals else 0.0,
+                     hits / decisions[ruleset] * 100.0 if decisions[ruleset] else 0.0,
+                     secs * 1000.0,
+                     secs / evals * 1000000.0 if evals else 0.0))
+
+            for field, label in (('trick_no', "trick"), ('play_pos', "pos")):
+                by_field = self.rollup((field,))
+                values = sorted({k[2] for k in by_field if k[0] == ruleset and k[2] is not None})
+                if not values:
+                    continue
+                out("  hits by %s:" % (label))
+                out("  %-26s %s" % ("rule", ' '.join("%7s" % (v) for v in values)))
+                for rule in [k[1] for k in by_rule if k[0] == ruleset]:
+                    hits = [by_field.get((ruleset, rule, v), [0, 0])[1] for v in values]
+                    out("  %-26s %s" % (rule, ' '.join("%7d" % (h) for h in hits)))
+
+###############
+# Phase Stats #
+###############
+
+class PhaseStats(object):
+    """Opt-in timers for the phases of Deal.play (for either engine); for each phase, a
+    count, total, and max are kept, along with a histogram of fixed log-spaced buckets
+    (BUCKETS_PER_DECADE per power of 10), from which percentiles are reported (to within
+    the bucket resolution), so memory use does not grow with the number of deals
+
+    To enable, assign an instance to `profiler` on the deal class (set to None to
+    disable, in which case the only overhead is a check per phase)
+
+    Phases are timed exclusively (i.e. "tabulate" does not include "compute_stats" or
+    "score"), and "total" covers the whole of Deal.play
+    """
+    PHASES = ('shuffle', 'deal', 'bid', 'playtricks', 'tabulate', 'compute_stats', 'score',
+              'total')
+
+    # buckets cover MIN_TIME to MIN_TIME * 10**DECADES seconds (times outside the range
+    # are counted in the first or last bucket)
+    MIN_TIME           = 1e-7
+    DECADES            = 9
+    BUCKETS_PER_DECADE = 40
+    NBUCKETS           = DECADES * BUCKETS_PER_DECADE
+
+    def __init__(self):
+        """
+        """
+        self.counts  = {phase: 0 for phase in PhaseStats.PHASES}
+        self.totals  = {phase: 0.0 for phase in PhaseStats.PHASES}
+        self.maxes   = {phase: 0.0 for phase in PhaseStats.PHASES}
+        self.buckets = {phase: [0] * PhaseStats.NBUCKETS for phase in PhaseStats.PHASES}
+        self.start   = 0.0
+        self.mark    = 0.0
+
+    def _add(self, phase, secs):
+        self.counts[phase] += 1
+        self.totals[phase] += secs
+        if secs > self.maxes[phase]:
+            self.maxes[phase] = secs
+        bucket = int(log10(secs / PhaseStats.MIN_TIME) * PhaseStats.BUCKETS_PER_DECADE) \
+            if secs > PhaseStats.MIN_TIME else 0
+        self.buckets[phase][min(bucket, PhaseStats.NBUCKETS - 1)] += 1
+
+    def begin(self):
+        """Call at the start of a deal
+        """
+        self.start = self.mark = perf_counter()
+
+    def lap(self, phase):
+        """Record time for phase (since the previous lap, or begin)
+        """
+        now = perf_counter()
+        self._add(phase, now - self.mark)
+        self.mark = now
+
+    def end(self):
+        """Call at the end of a deal
+        """
+        self._add('total', perf_counter() - self.start)
+
+    def merge(self, other):
+        """Add counts and histograms from another instance (e.g. accumulated in a
+        separate process)
+
+        :param other: PhaseStats
+        :return: void
+        """
+        for phase in PhaseStats.PHASES:
+            self.counts[phase] += other.counts[phase]
+            self.totals[phase] += other.totals[phase]
+            self.maxes[phase] = max(self.maxes[phase], other.maxes[phase])
+            buckets = self.buckets[phase]
+            for i, n in enumerate(other.buckets[phase]):
+                buckets[i] += n
+
+    def compute_agg(self, pctls = (50, 90, 99)):
+        """
+        :param pctls: tuple of percentiles to compute (nearest rank, reported as the
+                      upper bound of the bucket holding the sample, capped at the max)
+        :return: dict {phase: {'count', 'total', 'mean', 'p<n>'..., 'max'}}, with times
+                 in seconds (phases with no samples are omitted)
+        """
+        agg = {}
+        for phase in PhaseStats.PHASES:
+            count = self.counts[phase]
+            if not count:
+                continue
+            phase_agg = {'count': count, 'total': self.totals[phase]}
+            phase_agg['mean'] = phase_agg['total'] / count
+            for pctl in pctls:
+                rank = max(1, -(-pctl * count // 100))
+                seen = 0
+                for i, n in enumerate(self.buckets[phase]):
+                    seen += n
+                    if seen >= rank:
+                        break
+                upper = PhaseStats.MIN_TIME * 10.0 ** ((i + 1) / PhaseStats.BUCKETS_PER_DECADE)
+                phase_agg['p%d' % (pctl)] = min(upper, self.maxes[phase])
+            phase_agg['max'] = self.maxes[phase]
+            agg[phase] = phase_agg
+        return agg
+
+    def report(self, out = print):
+        """Print total and share of overall time, along with per-deal mean and percentiles
+        (in microseconds), for each phase
+
+        :param out: function for reporting results (takes a string)
+        """
+        agg = self.compute_agg()
+        if not agg:
+            return
+        overall = agg['total']['total'] if 'total' in agg else 0.0
+        out("%-14s %9s %10s %7s %9s %9s %9s %9s %9s" %
+            ("phase", "count", "total s", "share%", "mean us", "p50 us", "p90 us", "p99 us",
+             "max us"))
+        for phase, a in agg.items():
+            out("%-14s %9d %10.3f %7.2f %9.1f %9.1f %9.1f %9.1f %9.1f" %
+                (phase, a['count'], a['total'],
+                 a['total'] / overall * 100.0 if overall else 0.0,
+                 a['mean'] * 1e6, a['p50'] * 1e6, a['p90'] * 1e6, a['p99'] * 1e6,
+                 a['max'] * 1e6))
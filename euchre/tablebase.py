@@ -0,0 +1,611 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Endgame tablebase, giving the exact (double-dummy) value of each card for the player
+to move, for every position (at or within a trick) with up to 3 tricks remaining, stored
+as memory-mapped tables (one per number of tricks remaining), indexed directly by the
+canonical form of the position
+
+Positions are canonicalized as follows (so that strategically identical positions share
+a single entry):
+
+  - seats are relative to the leader of the trick (so the leader is always seat 0)
+  - suits are trump-relative (trump first, then the three off suits), and only the order
+    of the remaining cards within each suit matters (cards already played are irrelevant
+    to the outcome), so each suit is reduced to the sequence of seats holding its
+    remaining cards, highest card first
+  - the off suits are interchangeable for playing purposes, so are sorted (longest first)
+
+Note that this is not built on the suit maps of the canonical module, and cannot be:
+those map each card to a card (trump to suit 0, with next kept as the same-color suit,
+and only the two green suits interchangeable), so two positions share a key only if the
+same cards are held, whereas here the identity of the cards is dropped altogether, and
+next is interchangeable with the green suits (it only differs from them by the missing
+jack, which reducing each suit to its order already accounts for).  This coarser form is
+what allows a dense table index, and positions from different deals to share entries
+
+The index of a position at the start of the trick is then the rank of the concatenated
+seat sequence (among all arrangements of N cards for each of the four seats) combined
+with the index of the suit lengths.  Positions within the trick are stored after the
+position at its start, by the cards played so far (each as the index among the player's
+cards, in canonical order), so each trick boundary has 1 + N + N^2 + N^3 entries.
+
+Each table entry is a byte, holding the tricks for the leader's team (from the current
+trick on) after each card held by the player to move, 2 bits per card, in canonical
+order (bits for cards that cannot legally be played are zero); only entries with the off
+suits in sorted order, and legal plays to the trick, are built (others are never looked
+up), so a lookup is a canonicalization and a single table read
+"""
+
+import os
+import sys
+import random
+import time
+from math import factorial
+
+import numpy as np
+
+from core import log, HEADLESS_LEVEL, LogicError
+from bitcards import NSUITS, CARD_BIT, EFF_SUIT, EFF_SUIT_MASK, PLAY_ORDER, card_idx, suit_idx
+from solver import RANKED, get_solver, hand_mask
+from sampler import layout_sampler
+
+MAX_TRICKS = 3
+MAX_LENGTH = (7, 6, 6, 5)  # maximum length of trump, and off suits (when sorted)
+UNBUILT    = 0xFF
+
+RANK_CACHE_MAX = 10000
+CACHE_MAX      = 1 << 16  # positions memoised by probe and analyze, before clearing
+CARD_BITS      = 2        # bits per card in a table entry
+
+TABLE_FILE = 'endgame-%d.tb'
+
+##################
+# Canonical form #
+##################
+
+def _compositions(ncards):
+    """
+    :return: list of suit lengths (trump, off suits in descending order of length)
+    """
+    comps = []
+    for a in range(min(ncards, MAX_LENGTH[0]) + 1):
+        for b in range(min(ncards - a, MAX_LENGTH[1]) + 1):
+            for c in range(min(ncards - a - b, b) + 1):
+                d = ncards - a - b - c
+                if 0 <= d <= c:
+                    comps.append((a, b, c, d))
+    return comps
+
+def _narrangements(counts):
+    """
+    :param counts: sequence of int (remaining cards, by seat)
+    :return: int (number of distinct sequences of seats)
+    """
+    value = factorial(sum(counts))
+    for n in counts:
+        value //= factorial(n)
+    return value
+
+class TableShape(object):
+    """Index arithmetic for the table with `ntricks` tricks remaining
+    """
+    def __init__(self, ntricks):
+        self.ntricks   = ntricks
+        self.ncards    = ntricks * 4
+        self.comps     = _compositions(self.ncards)
+        self.comp_idx  = {comp: i for i, comp in enumerate(self.comps)}
+        self.narr      = _narrangements([ntricks] * 4)
+        # entries for positions within a trick start at these offsets (by the number of
+        # cards played), following the entry for the start of the trick
+        self.offsets   = tuple(sum(ntricks ** k for k in range(n)) for n in range(4))
+        self.nentries  = self.offsets[3] + ntricks ** 3
+        self.size      = len(self.comps) * self.narr * self.nentries
+        self._perms    = {}
+        # ranks are cached, if the number of arrangements is small enough
+        self._ranks    = {} if self.narr <= RANK_CACHE_MAX else None
+
+    def _count(self, counts):
+        key = tuple(counts)
+        value = self._perms.get(key)
+        if value is None:
+            value = self._perms[key] = _narrangements(counts)
+        return value
+
+    def rank(self, seq):
+        """
+        :param seq: sequence of seats (each appearing ntricks times)
+        :return: int (rank among all such sequences, in lexicographic order)
+        """
+        ranks = self._ranks
+        if ranks is not None:
+            key = tuple(seq)
+            value = ranks.get(key)
+            if value is None:
+                value = ranks[key] = self._rank(seq)
+            return value
+        return self._rank(seq)
+
+    def _rank(self, seq):
+        counts = [self.ntricks] * 4
+        value = 0
+        for seat in seq:
+            for lower in range(seat):
+                if counts[lower]:
+                    counts[lower] -= 1
+                    value += self._count(counts)
+                    counts[lower] += 1
+            counts[seat] -= 1
+        return value
+
+    def unrank(self, value):
+        """Inverse of rank()
+        """
+        counts = [self.ntricks] * 4
+        seq = []
+        for _ in range(self.ncards):
+            for seat in range(4):
+                if not counts[seat]:
+                    continue
+                counts[seat] -= 1
+                n = self._count(counts)
+                if value < n:
+                    seq.append(seat)
+                    break
+                value -= n
+                counts[seat] += 1
+        return seq
+
+    def index(self, comp, seq):
+        """
+        :return: int (index of the position at the start of the trick, see entry)
+        """
+        return self.comp_idx[comp] * self.narr + self.rank(seq)
+
+    def entry(self, index, choices):
+        """
+        :param index: int (position at the start of the trick)
+        :param choices: sequence of int (each card played to the trick so far, as the
+                        index among the player's cards, in canonical order)
+        :return: int (table entry)
+        """
+        code = 0
+        for k in choices:
+            code = code * self.ntricks + k
+        return index * self.nentries + self.offsets[len(choices)] + code
+
+_shapes = {n: TableShape(n) for n in range(1, MAX_TRICKS + 1)}
+
+# sequences of (cards, seats) for a suit, by trump and the cards held in the suit by
+# each seat (filled in as positions are seen, see _suits)
+_suit_seqs = {}
+
+def _suit_seq(trump, suit, held):
+    """
+    :param held: tuple of masks (cards in the suit, by seat)
+    :return: tuple (cards, seats), highest card first
+    """
+    cards = []
+    seats = []
+    for c in RANKED[trump][suit]:
+        bit = CARD_BIT[c]
+        for seat, mask in enumerate(held):
+            if mask & bit:
+                cards.append(c)
+                seats.append(seat)
+                break
+    return tuple(cards), tuple(seats)
+
+def _suits(trump, masks):
+    """
+    :param masks: list of masks (cards held, by seat)
+    :return: list of tuples ((cards, seats), suit idx), for trump followed by the off
+             suits in canonical (sorted) order
+    """
+    suitmasks = EFF_SUIT_MASK[trump]
+    h0, h1, h2, h3 = masks
+    suits = []
+    for suit in range(NSUITS):
+        sm = suitmasks[suit]
+        # suit masks are disjoint, so the key also identifies the suit
+        key = (trump, h0 & sm, h1 & sm, h2 & sm, h3 & sm)
+        seq = _suit_seqs.get(key)
+        if seq is None:
+            seq = _suit_seqs[key] = _suit_seq(trump, suit, key[1:])
+        suits.append((seq, suit))
+    trump_suit = suits.pop(trump)
+    suits.sort(key=lambda s: (-len(s[0][1]), s[0][1]))
+    suits.insert(0, trump_suit)
+    return suits
+
+def canonical(trump, hands, leader):
+    """Canonical form of a position at a trick boundary
+
+    :param trump: int (suit idx)
+    :param hands: list of masks, by position (same number of cards in each)
+    :param leader: int (position to lead)
+    :return: tuple (index, cards in canonical order, seats in canonical order), see
+             TableShape.index
+    """
+    (s0, _), (s1, _), (s2, _), (s3, _) = _suits(trump, [hands[(leader + seat) & 3]
+                                                        for seat in range(4)])
+    shape = _shapes[hands[leader].bit_count()]
+    comp = (len(s0[0]), len(s1[0]), len(s2[0]), len(s3[0]))
+    cards = s0[0] + s1[0] + s2[0] + s3[0]
+    seats = s0[1] + s1[1] + s2[1] + s3[1]
+    return shape.index(comp, seats), cards, seats
+
+def representative(shape, index):
+    """Position for a trick boundary index (with trump as suit 0, and the leader as
+    position 0), where each suit holds the highest cards of the corresponding effective
+    suit
+
+    :return: list of masks (by position), or None if the off suits are not in canonical
+             (sorted) order
+    """
+    comp_idx, arr = divmod(index, shape.narr)
+    comp = shape.comps[comp_idx]
+    seats = shape.unrank(arr)
+    # off suits (sorted by length) are assigned to the two green suits and then next,
+    # since next is the shortest (see MAX_LENGTH)
+    suits = (0, 1, 2, 3)
+    hands = [0, 0, 0, 0]
+    start = 0
+    prev = None
+    for suit, length in zip(suits, comp):
+        suit_seats = seats[start:start + length]
+        if suit and prev is not None and (-length, suit_seats) < prev:
+            return None
+        if suit:
+            prev = (-length, suit_seats)
+        for c, seat in zip(RANKED[0][suit], suit_seats):
+            hands[seat] |= CARD_BIT[c]
+        start += length
+    return hands
+
+#############
+# Tablebase #
+#############
+
+def table_file(path, ntricks):
+    return os.path.join(path, TABLE_FILE % (ntricks))
+
+class Tablebase(object):
+    """Memory-mapped tables (for as many numbers of tricks remaining as have been built)
+    """
+    def __init__(self, path):
+        """
+        :param path: str (directory containing table files, see build)
+        """
+        self.path   = path
+        self.tables = {}
+        self.entries   = {}  # views of the tables (cheaper to index than the memmaps)
+        self.starts    = {}  # canonical forms, by actual position at the start of a trick
+        self.positions = {}  # results of analyze, by actual position
+        self.probes    = {}  # results of probe, by actual position
+        for ntricks in range(1, MAX_TRICKS + 1):
+            filename = table_file(path, ntricks)
+            if not os.path.exists(filename):
+                continue
+            table = np.memmap(filename, dtype=np.uint8, mode='r')
+            if len(table) != _shapes[ntricks].size:
+                raise LogicError("Table %s has wrong size (%d)" % (filename, len(table)))
+            self.tables[ntricks] = table
+            self.entries[ntricks] = memoryview(table)
+
+    @property
+    def max_tricks(self):
+        """
+        :return: int (tricks remaining for which all positions can be resolved)
+        """
+        ntricks = 0
+        while ntricks + 1 in self.tables:
+            ntricks += 1
+        return ntricks
+
+    def covers(self, hands, leader, trick = ()):
+        """
+        :return: bool (whether the position can be resolved from the tables)
+        """
+        pos = (leader + len(trick)) & 3
+        return hands[pos].bit_count() <= self.max_tricks
+
+    def probe(self, trump, hands, leader):
+        """Look up a position at a trick boundary
+
+        :param trump: int (suit idx)
+        :param hands: list of masks, by position
+        :param leader: int (position to lead)
+        :return: tuple (tricks for the leader's team, best lead card idx)
+        """
+        key = (trump, leader, *hands)
+        result = self.probes.get(key)
+        if result is None:
+            if len(self.probes) >= CACHE_MAX:
+                self.probes.clear()
+            values = self._lookup(trump, hands, leader, ())
+            # first of the best leads, in canonical order
+            lead = max(values, key=values.get)
+            result = self.probes[key] = (values[lead], lead)
+        return result
+
+    def solve(self, trump, hands, leader, trick = ()):
+        """Same as Solver.solve (see covers() for the positions that can be resolved)
+
+        :return: int (tricks for team 0, from the current trick on)
+        """
+        values = self.analyze(trump, hands, leader, trick)
+        pos = (leader + len(trick)) & 3
+        return min(values.values()) if pos & 0x01 else max(values.values())
+
+    def analyze(self, trump, hands, leader, trick = ()):
+        """Same as Solver.analyze; results are memoised by the actual position, so the
+        dict returned must not be modified
+
+        :return: dict of card idx -> tricks for team 0 (from the current trick on)
+        """
+        trick = tuple(trick)
+        raw_key = (trump, leader, trick, *hands)
+        values = self.positions.get(raw_key)
+        if values is None:
+            if len(self.positions) >= CACHE_MAX:
+                self.positions.clear()
+            values = self._lookup(trump, hands, leader, trick)
+            if leader & 0x01:
+                ntricks = hands[(leader + len(trick)) & 3].bit_count()
+                values = {c: ntricks - v for c, v in values.items()}
+            self.positions[raw_key] = values
+        return values
+
+    def _lookup(self, trump, hands, leader, trick):
+        """
+        :return: dict of card idx -> tricks for the leader's team (from the current
+                 trick on), for the legal cards in canonical order
+        """
+        # the position at the start of the trick, with the cards played returned (which
+        # is shared by all positions within the trick)
+        start = list(hands)
+        for i, c in enumerate(trick):
+            start[(leader + i) & 3] |= CARD_BIT[c]
+        start_key = (trump, leader, *start)
+        canon = self.starts.get(start_key)
+        if canon is None:
+            if len(self.starts) >= CACHE_MAX:
+                self.starts.clear()
+            index, cards, seats = canonical(trump, start, leader)
+            by_seat = ([], [], [], [])
+            for c, seat in zip(cards, seats):
+                by_seat[seat].append(c)
+            canon = self.starts[start_key] = (start[leader].bit_count(), index, by_seat)
+        ntricks, index, by_seat = canon
+        choices = [by_seat[i].index(c) for i, c in enumerate(trick)]
+        entry = self.entries[ntricks][_shapes[ntricks].entry(index, choices)]
+        if entry == UNBUILT:
+            raise LogicError("Tablebase entry for %d, %s not built" % (index, choices))
+        legal = _legal(trump, hands[(leader + len(trick)) & 3], trick)
+        return {c: entry >> k * CARD_BITS & 0x03
+                for k, c in enumerate(by_seat[len(trick)]) if legal & CARD_BIT[c]}
+
+def _legal(trump, hand, trick):
+    """
+    :return: mask (cards in `hand` that can be played to the trick)
+    """
+    if trick:
+        return hand & EFF_SUIT_MASK[trump][EFF_SUIT[trump][trick[0]]] or hand
+    return hand
+
+class EndgamePlayer(object):
+    """Chooses plays for a player from the tablebase, once the remaining tricks are
+    covered, by evaluating each legal card over layouts of the hidden cards (see
+    sampler.py), for use as the endgame hook of the playing modules (e.g. set
+    playing.endgame to an instance)
+    """
+    def __init__(self, tablebase, nlayouts = 20, seed = None):
+        self.tablebase = tablebase
+        self.nlayouts  = nlayouts
+        self.rng       = random.Random(seed)
+
+    def __call__(self, hand, plays):
+        """
+        :return: int (card idx), or None if not covered by the tablebase
+        """
+        trump = suit_idx(hand.deal.contract)
+        trick = tuple(card_idx(card) for player, card in plays)
+        leader = plays[0][0].pos if plays else hand.pos
+        hands = [0, 0, 0, 0]
+        hands[hand.pos] = hand_mask(hand)
+        if not self.tablebase.covers(hands, leader, trick):
+            return None
+
+        pos = hand.pos
+        values = {}
+        for layout in layout_sampler(hand, plays).sample(self.nlayouts, self.rng):
+            for card, value in self.tablebase.analyze(trump, layout, leader, trick).items():
+                values[card] = values.get(card, 0) + (-value if pos & 0x01 else value)
+        legal = [c for c in PLAY_ORDER[trump] if c in values]
+        return max(legal, key=lambda c: values[c])
+
+###########
+# Builder #
+###########
+
+def build_range(task):
+    """Build a range of table entries (runs in a worker process, if parallel)
+
+    :param task: tuple (table file, tricks remaining, start index, stop index)
+    :return: int (number of entries built)
+    """
+    filename, ntricks, start, stop = task
+    shape = _shapes[ntricks]
+    table = np.memmap(filename, dtype=np.uint8, mode='r+')
+    solver = get_solver(0)
+    entries = np.full((stop - start) * shape.nentries, UNBUILT, dtype=np.uint8)
+    nbuilt = 0
+    order = RANKED[0][0] + RANKED[0][1] + RANKED[0][2] + RANKED[0][3]
+    for index in range(start, stop):
+        hands = representative(shape, index)
+        if hands is None:
+            continue
+        solver.reset()
+        by_seat = [[c for c in order if hands[seat] & CARD_BIT[c]] for seat in range(4)]
+        base = (index - start) * shape.nentries
+        _build_entries(solver, shape, entries, base, by_seat, hands, ())
+        nbuilt += 1
+    table[start * shape.nentries:stop * shape.nentries] = entries
+    table.flush()
+    return nbuilt
+
+def _build_entries(solver, shape, entries, base, by_seat, hands, choices):
+    """Fill in the entry for a position (with the leader as position 0, so the values
+    from the solver are for the leader's team), and for the legal plays following it
+    within the trick
+    """
+    trick = tuple(by_seat[i][k] for i, k in enumerate(choices))
+    seat = len(trick)
+    values = solver.analyze(hands, 0, trick)
+    entry = 0
+    for k, c in enumerate(by_seat[seat]):
+        if c in values:
+            entry |= values[c] << k * CARD_BITS
+            if seat < 3:
+                new_hands = list(hands)
+                new_hands[seat] ^= CARD_BIT[c]
+                _build_entries(solver, shape, entries, base, by_seat, new_hands,
+                               choices + (k,))
+    entries[base + shape.entry(0, choices)] = entry
+
+def build(path, ntricks = 2, workers = None, chunk = 20000):
+    """Build tables for 1 through `ntricks` tricks remaining (each table is written
+    under a temporary name, and then renamed)
+
+    :param workers: int (number of worker processes, or None to build in-process)
+    :return: void
+    """
+    os.makedirs(path, exist_ok=True)
+    pool = None
+    if workers:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+    try:
+        for n in range(1, ntricks + 1):
+            shape = _shapes[n]
+            filename = table_file(path, n)
+            tmp_file = filename + '.tmp'
+            table = np.memmap(tmp_file, dtype=np.uint8, mode='w+', shape=(shape.size,))
+            table[:] = UNBUILT
+            table.flush()
+            del table
+            nstarts = shape.size // shape.nentries
+            tasks = [(tmp_file, n, start, min(start + chunk, nstarts))
+                     for start in range(0, nstarts, chunk)]
+            start = time.perf_counter()
+            if pool:
+                nbuilt = sum(pool.imap_unordered(build_range, tasks))
+            else:
+                nbuilt = sum(build_range(task) for task in tasks)
+            os.replace(tmp_file, filename)
+            print("Built %s: %d entries (%d canonical trick starts) in %.2f secs" %
+                  (filename, shape.size, nbuilt, time.perf_counter() - start))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+###########
+# Testing #
+###########
+
+def check(path, ndeals = 1000, seed = None, engine = 'bit'):
+    """Play deals, and compare the tablebase to the solver for all covered positions
+    (at and within trick boundaries) reached in play, reporting lookup times
+
+    :return: tuple (positions checked, mismatches, tablebase secs, solver secs)
+    """
+    from euchre import Match, engine_args
+
+    tablebase = Tablebase(path)
+    random.seed(seed)
+    match_args, match_kwargs = engine_args(engine, 0)
+    game = Match(*match_args, game_points=sys.maxsize, **match_kwargs).newgame()
+    nchecked = nwrong = 0
+    tb_secs = solve_secs = 0.0
+    for _ in range(ndeals):
+        deal = game.newdeal()
+        deal.play()
+        if deal.contract is None:
+            continue
+        trump = suit_idx(deal.contract)
+        hands = [0, 0, 0, 0]
+        for player, card in deal.plays:
+            hands[player.pos] |= CARD_BIT[card_idx(card)]
+        plays = [(player.pos, card_idx(card)) for player, card in deal.plays]
+        for i, (pos, card) in enumerate(plays):
+            leader = plays[i - i % 4][0]
+            trick = tuple(c for p, c in plays[i - i % 4:i])
+            if tablebase.covers(hands, leader, trick):
+                start = time.perf_counter()
+                tb_values = tablebase.analyze(trump, hands, leader, trick)
+                tb_secs += time.perf_counter() - start
+                start = time.perf_counter()
+                values = get_solver(trump).analyze(hands, leader, trick)
+                solve_secs += time.perf_counter() - start
+                nchecked += 1
+                if tb_values != values:
+                    nwrong += 1
+                    log.info("Mismatch for %s (leader %d, trick %s): %s vs %s",
+                             hands, leader, trick, tb_values, values)
+                if not trick:
+                    tricks, lead = tablebase.probe(trump, hands, leader)
+                    best = max(values.values()) if not leader & 0x01 else min(values.values())
+                    if values[lead] != best:
+                        nwrong += 1
+                        log.info("Bad lead %d for %s (leader %d)", lead, hands, leader)
+            hands[pos] ^= CARD_BIT[card]
+    return nchecked, nwrong, tb_secs, solve_secs
+
+def cli():
+    """Command line interface (click is imported here, rather than at module level, to
+    keep imports fast)
+    """
+    import click
+
+    @click.group()
+    def main_cmd():
+        """Endgame tablebase
+        """
+        log.setLevel(HEADLESS_LEVEL)
+
+    @main_cmd.command('build')
+    @click.argument('path')
+    @click.option('--tricks',  '-n', default=2, type=click.IntRange(1, MAX_TRICKS),
+                  help="Maximum tricks remaining (note: 3 takes about 4 CPU-hours, and "
+                  "the table is 843 MB)")
+    @click.option('--workers', '-w', default=None, type=int,
+                  help="Number of worker processes")
+    def build_cmd(path, tricks, workers):
+        """Build tables for up to the specified number of tricks remaining
+        """
+        build(path, tricks, workers)
+
+    @main_cmd.command('check')
+    @click.argument('path')
+    @click.option('--ndeals', '-n', default=1000, type=int, help="Number of deals to play")
+    @click.option('--seed',   '-s', default=None, type=int, help="Seed for random module")
+    @click.option('--engine', '-e', default='bit', type=click.Choice(['std', 'bit']),
+                  help="Deal engine")
+    def check_cmd(path, ndeals, seed, engine):
+        """Check the tablebase against the solver, for positions reached in play
+        """
+        nchecked, nwrong, tb_secs, solve_secs = check(path, ndeals, seed, engine)
+        if not nchecked:
+            print("No positions checked")
+            sys.exit(1)
+        print("Checked %d positions, %d mismatches" % (nchecked, nwrong))
+        print("  tablebase: %.1f us/position, solver: %.1f us/position" %
+              (tb_secs / nchecked * 1e6, solve_secs / nchecked * 1e6))
+        sys.exit(1 if nwrong else 0)
+
+    return main_cmd()
+
+if __name__ == '__main__':
+    cli()
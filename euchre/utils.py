@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import os
 import logging
 import json
 import re
-
-import yaml
+import threading
+import queue
 
 #####################
 # Config Management #
@@ -36,6 +37,7 @@ class Config(object):
         if profile in Config.cfg_profiles[self.path]:
             return Config.cfg_profiles[self.path][profile].get(section, {})
 
+        import yaml  # only needed when config is first loaded (slow to import)
         with open(self.path, 'r') as f:
             cfg = yaml.safe_load(f)
         if cfg:
@@ -93,3 +95,156 @@ def prettyprint(data, indent = 4, sort_keys = True, noprint = False):
         return re.sub(pattern, spaces, json.dumps(data, indent=indent, sort_keys=sort_keys, ensure_ascii=False))
     else:
         print(re.sub(pattern, spaces, json.dumps(data, indent=indent, sort_keys=sort_keys, ensure_ascii=False)))
+
+#####################
+# Async log handler #
+#####################
+
+class AsyncLogHandler(logging.Handler):
+    """Moves formatting and file I/O for a target (rotating file) handler onto a
+    background writer thread, behind a bounded queue; records are written in batches,
+    with a single flush (and rollover check) per batch
+
+    When the queue is full, the "block" policy waits for the writer, and the "drop"
+    policy discards the record (the number of dropped records is logged when the handler
+    is closed)
+    """
+    def __init__(self, target, maxsize = 10000, policy = 'block', batch_size = 500):
+        """
+        :param target: logging.handlers.RotatingFileHandler (or other StreamHandler), or
+                       core.LogFileHandler (which provides the underlying file handler)
+        :param policy: 'block' or 'drop'
+        """
+        if policy not in ('block', 'drop'):
+            raise ValueError("Unknown queue policy '%s'" % (policy))
+        super().__init__(target.level)
+        self.target     = target
+        self.maxsize    = maxsize
+        self.policy     = policy
+        self.batch_size = batch_size
+        self.dropped    = 0
+        self.closed     = False
+        self.start()
+        # threads do not survive fork, so worker processes need their own writer
+        os.register_at_fork(after_in_child=self.start)
+
+    def start(self):
+        """Create queue and start writer thread (also called in forked child processes)
+        """
+        if self.closed:
+            return
+        self.queue  = queue.Queue(self.maxsize)
+        self.thread = threading.Thread(target=self.writer, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def emit(self, record):
+        """Note that the message is merged with its args here (rather than in the writer
+        thread), in case any of the args are subsequently modified
+        """
+        if record.levelno < self.target.level:
+            return
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                formatter = self.target.formatter or logging.Formatter()
+                record.exc_text = formatter.formatException(record.exc_info)
+                record.exc_info = None
+            if self.policy == 'block':
+                self.queue.put(record)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def writer(self):
+        """Writer thread main loop, terminated by None sentinel
+        """
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = records[-1] is None
+            if done:
+                records.pop()
+            try:
+                self.write_batch(records)
+            except Exception:
+                for record in records:
+                    self.handleError(record)
+            for _ in range(len(records) + int(done)):
+                self.queue.task_done()
+            if done:
+                return
+
+    def write_batch(self, records):
+        """Records are passed through the filters of the target (and of the underlying
+        file handler), and the rollover check is done on the encoded size of the batch
+
+        :param records: list of LogRecord
+        """
+        target = self.target
+        handler = getattr(target, 'handler', target)
+        kept = []
+        chunks = []
+        for record in records:
+            if not target.filter(record) or (handler is not target and
+                                             not handler.filter(record)):
+                continue
+            try:
+                chunks.append(handler.format(record) + handler.terminator)
+                kept.append(record)
+            except Exception:
+                handler.handleError(record)
+        if not kept:
+            return
+        with handler.lock:
+            stream = handler.stream
+            if stream is None:
+                # file closed (e.g. during shutdown), let the handler reopen it
+                for record in kept:
+                    handler.handle(record)
+                return
+            data = ''.join(chunks)
+            try:
+                max_bytes = getattr(handler, 'maxBytes', 0)
+                if max_bytes > 0:
+                    nbytes = len(data.encode(stream.encoding or 'utf-8',
+                                             stream.errors or 'strict'))
+                    if stream.tell() + nbytes >= max_bytes:
+                        handler.doRollover()
+                        stream = handler.stream
+                stream.write(data)
+                stream.flush()
+            except Exception:
+                for record in kept:
+                    handler.handleError(record)
+
+    def flush(self):
+        """Wait for queued records to be written
+        """
+        if not self.closed and self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        """Write out remaining records and stop writer thread (called at exit, through
+        logging.shutdown)
+        """
+        if self.closed:
+            return
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.closed = True
+        if self.dropped:
+            record = logging.makeLogRecord({'name': 'async', 'levelno': logging.WARNING,
+                                            'levelname': 'WARNING',
+                                            'msg': "%d log records dropped (queue full)" %
+                                                   (self.dropped)})
+            self.write_batch([record])
+        super().close()